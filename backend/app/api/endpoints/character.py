@@ -1,21 +1,64 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from app.core.database import get_db
+from datetime import datetime
+from typing import List, Literal, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from pydantic import BaseModel
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.database import get_async_db
+from app.core.http_cache import cached_json_response
 from app.modules.character import service
+from app.modules.character.models import CharacterModel
 from app.schemas.character import TavernCardV3
 
 router = APIRouter()
 
+# --- 列表 / 搜索返回的摘要 (不含完整 JSON) ---
+class CharacterSummary(BaseModel):
+    id: int
+    name: Optional[str] = None
+    creator: Optional[str] = None
+    avatar_path: Optional[str] = None
+    create_date: Optional[datetime] = None
+    update_date: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+class CharacterPage(BaseModel):
+    items: List[CharacterSummary]
+    # 下一页游标 (原样传回 cursor 参数)；没有下一页时为 None
+    next_cursor: Optional[str] = None
+
 @router.post("/upload", summary="上传角色卡")
-def upload_character(card: TavernCardV3, db: Session = Depends(get_db)):
+async def upload_character(card: TavernCardV3, request: Request, db: AsyncSession = Depends(get_async_db)):
     # card 参数会自动把前端传来的 JSON 校验并转成对象
-    # 我们把它转回 dict 传给 service
-    return service.create_character(db, card.model_dump())
+    # 我们把它转回 dict 传给 service；原始 JSON 用来算内容指纹 (已经解析过，不会再读一遍)
+    return await service.create_character(db, card.model_dump(), source=await request.json())
+
+@router.get("/", response_model=CharacterPage, summary="角色卡列表 (分页)")
+async def list_characters(
+    sort: Literal["name", "creator", "create_date"] = "create_date",
+    desc: bool = False,
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db),
+):
+    items, next_cursor = await service.list_characters(db, sort=sort, desc=desc, limit=limit, cursor=cursor)
+    return {"items": items, "next_cursor": next_cursor}
+
+@router.get("/search", response_model=CharacterPage, summary="搜索角色卡 (名字 / 标签 / 作者 / 简介)")
+async def search_characters(
+    q: str = Query(..., min_length=1),
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db),
+):
+    items, next_cursor = await service.search_characters(db, q, limit=limit, cursor=cursor)
+    return {"items": items, "next_cursor": next_cursor}
 
 @router.get("/{char_id}", summary="获取角色卡")
-def read_character(char_id: int, db: Session = Depends(get_db)):
-    db_char = service.get_character(db, char_id)
+async def read_character(char_id: int, request: Request, db: AsyncSession = Depends(get_async_db)):
+    db_char = await service.get_character(db, char_id)
     if db_char is None:
         raise HTTPException(status_code=404, detail="Character not found")
-    # 注意：这里直接返回数据库对象，FastAPI 会自动把它转成 JSON
-    return db_char
\ No newline at end of file
+    # 按版本缓存序列化好的 JSON，带 ETag (匹配时 304) 和 gzip / br 压缩
+    return await cached_json_response(request, CharacterModel.__tablename__, db_char)
\ No newline at end of file
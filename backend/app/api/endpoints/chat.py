@@ -1,15 +1,29 @@
-from typing import List, Dict, Optional
-from fastapi import APIRouter, Depends, HTTPException
-from pydantic import BaseModel
-from sqlalchemy.orm import Session
+import asyncio
+import json
+import time
+import anyio
+from functools import partial
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Set, Tuple
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.core.database import get_db
+from app.core import config, llm, metrics
+from app.core.database import get_async_db
+from app.core.model_cache import model_cache, response_cache, stamp_of
+from app.core.preset_compiler import preset_plan_cache
+from app.core.prompt_prefix import prefix_cache
 from app.core.prompt_engine import ContextAssembler
+from app.core.regex_scripts import regex_script_cache
+from app.core.semantic_memory import chat_vector_cache, lorebook_vector_cache
+from app.core.world_info import world_info_cache
 
 # 引入之前的搬运工，方便取数据
 from app.modules.character import service as char_service
 from app.modules.preset import service as preset_service
-# 如果以后有世界书，也可以引入 lorebook_service
+from app.modules.lorebook import service as lorebook_service
 
 router = APIRouter()
 
@@ -21,45 +35,401 @@ class ChatRequest(BaseModel):
     # 聊天记录格式：[{"role": "user", "content": "你好"}, ...]
     messages: List[Dict[str, str]] = []
     user_name: str = "User"
-    
+
     # 世界书ID (可选)
     lorebook_id: Optional[int] = None
 
-# --- 调试接口：只拼装，不发给 AI ---
-@router.post("/debug/assemble", summary="[调试] 预览拼装后的 Prompt")
-def debug_assemble_prompt(payload: ChatRequest, db: Session = Depends(get_db)):
-    """
-    这个接口用于测试 ContextAssembler 是否工作正常。
-    它会返回最终发给 LLM 的 messages 列表。
-    """
-    # 1. 取出角色卡
-    char = char_service.get_character(db, payload.char_id)
+    # 聊天ID (可选)：带上后世界书会按聊天做增量扫描
+    chat_id: Optional[str] = None
+
+class CompletionRequest(ChatRequest):
+    # 模型名 (可选)：不填就用 .env 里的 CHAT_MODEL
+    model: Optional[str] = None
+    # 是否流式返回 (SSE)
+    stream: bool = True
+
+class BatchAssembleRequest(BaseModel):
+    # 每个任务和 /debug/assemble 的请求体一样：多路重生成 = 同一组参数重复几次，群聊 = 换 char_id
+    jobs: List[ChatRequest] = Field(..., min_length=1, max_length=config.ASSEMBLE_BATCH_MAX_JOBS)
+
+async def fetch_character(db: AsyncSession, char_id: int):
+    char = await char_service.get_character(db, char_id)
     if not char:
         raise HTTPException(status_code=404, detail="Character not found")
+    return char
 
-    # 2. 取出预设
-    preset = preset_service.get_preset(db, payload.preset_id)
+async def fetch_preset(db: AsyncSession, preset_id: int):
+    preset = await preset_service.get_preset(db, preset_id)
     if not preset:
         raise HTTPException(status_code=404, detail="Preset not found")
+    return preset
+
+async def fetch_lorebook(db: AsyncSession, lorebook_id: int):
+    lorebook = await lorebook_service.get_lorebook(db, lorebook_id)
+    if not lorebook:
+        raise HTTPException(status_code=404, detail="Lorebook not found")
+    return lorebook
+
+async def load_schema(service, obj):
+    """
+    数据库里存的是压缩的原始 JSON，还原成 Schema 对象，返回 (ORM 对象, Schema)。
+    校验结果按版本缓存：命中时连 data 列都不读；没命中才读出、解压，校验放到线程池里
+    """
+    try:
+        with metrics.stage("validate"):
+            return obj, await service.load_schema(obj)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Assembly failed: {str(e)}")
+
+async def load_world_info(lorebook):
+    """
+    世界书只需要编译好的关键词索引，返回 (ORM 对象, 索引)。
+    有编译好的文件时直接 mmap (不读 data 列、不建 Schema 对象)，见 lorebook_service.load_index
+    """
+    try:
+        with metrics.stage("validate"):
+            return lorebook, await lorebook_service.load_index(lorebook)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Assembly failed: {str(e)}")
+
+def build_assembler(
+    char_pair,
+    preset_pair,
+    lorebook_pair,
+    history: List[Dict[str, str]],
+    user_name: str = "User",
+    chat_id: Optional[Hashable] = None,
+    variables: Optional[Dict[str, Any]] = None,
+    memories: Optional[List[Dict[str, Any]]] = None,
+    summary: Optional[Dict[str, Any]] = None,
+    global_variables: Optional[Dict[str, Any]] = None,
+) -> ContextAssembler:
+    """
+    用取好的 (ORM 对象, Schema) 初始化拼装引擎 (CPU 活，在线程池里调)；世界书是 (ORM 对象, 关键词索引)。
+    预设的执行计划、世界书索引也都按 (ID, 版本) 缓存，只编译一次
+    """
+    (char, card_schema), (preset, preset_schema) = char_pair, preset_pair
+    lorebook, world_info_index = lorebook_pair or (None, None)
+    with metrics.stage("assembler_init"):
+        return ContextAssembler(
+            card=card_schema,
+            preset=preset_schema,
+            history=history,
+            user_name=user_name,
+            world_info_index=world_info_index,
+            preset_id=preset.id,
+            preset_version=stamp_of(preset),
+            lorebook_id=lorebook.id if lorebook else None,
+            lorebook_version=stamp_of(lorebook) if lorebook else None,
+            card_id=char.id,
+            card_version=stamp_of(char),
+            chat_id=chat_id,
+            variables=variables,
+            global_variables=global_variables,
+            memories=memories,
+            summary=summary,
+        )
+
+async def load_assembler(
+    db: AsyncSession,
+    char_id: int,
+    preset_id: int,
+    history: List[Dict[str, str]],
+    user_name: str = "User",
+    lorebook_id: Optional[int] = None,
+    chat_id: Optional[Hashable] = None,
+    variables: Optional[Dict[str, Any]] = None,
+    memories: Optional[List[Dict[str, Any]]] = None,
+    summary: Optional[Dict[str, Any]] = None,
+    global_variables: Optional[Dict[str, Any]] = None,
+) -> ContextAssembler:
+    """取出角色卡 / 预设 / 世界书，初始化拼装引擎"""
+    # 1. 取出角色卡、预设、世界书 (可选)
+    with metrics.stage("db_fetch"):
+        char = await fetch_character(db, char_id)
+        preset = await fetch_preset(db, preset_id)
+        lorebook = await fetch_lorebook(db, lorebook_id) if lorebook_id is not None else None
+
+    # 2. 还原成 Schema 对象
+    char_pair = await load_schema(char_service, char)
+    preset_pair = await load_schema(preset_service, preset)
+    lorebook_pair = await load_world_info(lorebook) if lorebook else None
 
     # 3. 初始化拼装引擎
-    assembler = ContextAssembler(
-        card=char,
-        preset=preset,
-        history=payload.messages,
-        user_name=payload.user_name
-        # lorebook=... 以后再加
-    )
+    try:
+        return await run_in_threadpool(
+            build_assembler, char_pair, preset_pair, lorebook_pair, history,
+            user_name, chat_id, variables, memories, summary, global_variables,
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Assembly failed: {str(e)}")
 
-    # 4. 执行拼装
+async def run_assembly(assembler: ContextAssembler) -> List[Dict[str, str]]:
+    """拼装是 CPU 活，在线程池里跑"""
     try:
-        final_messages = assembler.assemble()
+        messages = await run_in_threadpool(assembler.assemble)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Assembly failed: {str(e)}")
+    budget = assembler.budget
+    metrics.assembled_tokens.observe(budget.system_tokens, "system")
+    metrics.assembled_tokens.observe(budget.history_tokens, "history")
+    metrics.assembled_tokens.observe(budget.total_tokens, "total")
+    return messages
 
-    # 5. 返回结果
+async def _assemble(payload: ChatRequest, db: AsyncSession):
+    """查库 + 拼装，返回 (拼装引擎, 最终消息列表)"""
+    assembler = await load_assembler(
+        db,
+        char_id=payload.char_id,
+        preset_id=payload.preset_id,
+        history=payload.messages,
+        user_name=payload.user_name,
+        lorebook_id=payload.lorebook_id,
+        chat_id=payload.chat_id,
+    )
+    return assembler, await run_assembly(assembler)
+
+# --- 调试接口：只拼装，不发给 AI ---
+@router.post("/debug/assemble", summary="[调试] 预览拼装后的 Prompt")
+async def debug_assemble_prompt(payload: ChatRequest, db: AsyncSession = Depends(get_async_db)):
+    """
+    这个接口用于测试 ContextAssembler 是否工作正常。
+    它会返回最终发给 LLM 的 messages 列表。
+    """
+    assembler, final_messages = await _assemble(payload, db)
+
+    # 返回结果
     return {
         "info": "Assembly Success",
         "total_messages": len(final_messages),
-        "prompt": final_messages  # 这里就是最终产物！
-    }
\ No newline at end of file
+        "prompt": final_messages,  # 这里就是最终产物！
+        "budget": assembler.budget.as_dict()
+    }
+
+# --- 批量拼装：多路重生成 / 群聊一次拼好几份 ---
+@router.post("/assemble/batch", summary="批量拼装 Prompt (SSE，按完成顺序返回)")
+async def assemble_batch(payload: BatchAssembleRequest, db: AsyncSession = Depends(get_async_db)):
+    """
+    一次拼装多个任务，结果按完成顺序推回 (用 index 对应请求里的顺序)：
+        data: {"index": 0, "prompt": [...], "budget": {...}}
+        event: error / data: {"index": 1, "status_code": 404, "detail": "..."}   只影响这一个任务
+        data: [DONE]
+    每个不同的角色卡 / 预设 / 世界书只查库、校验一次；
+    (预设, 角色卡, 用户名) 相同的任务先拼一个，把稳定前缀放进缓存，其余的再并行拼 (线程池)。
+    """
+    jobs = payload.jobs
+
+    # 1. 查库：每个对象只取一次，出错的记下异常 (同一个 session 不能并发查询，逐个来)
+    loaded: Dict[Any, Any] = {}
+
+    async def load(kind: str, obj_id: int, fetch, loader):
+        key = (kind, obj_id)
+        if key not in loaded:
+            try:
+                with metrics.stage("db_fetch"):
+                    obj = await fetch(db, obj_id)
+                loaded[key] = await loader(obj)
+            except HTTPException as e:
+                loaded[key] = e
+        return loaded[key]
+
+    sources: List[Any] = []
+    for job in jobs:
+        parts = [
+            await load("char", job.char_id, fetch_character, partial(load_schema, char_service)),
+            await load("preset", job.preset_id, fetch_preset, partial(load_schema, preset_service)),
+            await load("lorebook", job.lorebook_id, fetch_lorebook, load_world_info)
+            if job.lorebook_id is not None else None,
+        ]
+        error = next((p for p in parts if isinstance(p, HTTPException)), None)
+        sources.append(error or parts)
+
+    # 2. 按稳定前缀的缓存键分组：组里第一个拼完，其余的就能直接用缓存的前缀
+    groups: Dict[Any, List[int]] = {}
+    for i, job in enumerate(jobs):
+        groups.setdefault((job.preset_id, job.char_id, job.user_name), []).append(i)
+
+    # 队列里放 (index, SSE 文本)；每个任务不管成功失败都必须交一条
+    results: "asyncio.Queue[Tuple[int, str]]" = asyncio.Queue()
+    semaphore = asyncio.Semaphore(max(config.ASSEMBLE_BATCH_CONCURRENCY, 1))
+
+    def error_event(i: int, status_code: int, detail: Any) -> str:
+        return _sse({"index": i, "status_code": status_code, "detail": detail}, event="error")
+
+    async def run_one(i: int):
+        job, source = jobs[i], sources[i]
+        try:
+            if isinstance(source, HTTPException):
+                raise source
+            async with semaphore:
+                try:
+                    assembler = await run_in_threadpool(
+                        build_assembler, *source, job.messages, job.user_name, job.chat_id
+                    )
+                except Exception as e:
+                    raise HTTPException(status_code=500, detail=f"Assembly failed: {str(e)}")
+                final_messages = await run_assembly(assembler)
+            event = _sse({
+                "index": i,
+                "total_messages": len(final_messages),
+                "prompt": final_messages,
+                "budget": assembler.budget.as_dict(),
+            })
+        except HTTPException as e:
+            event = error_event(i, e.status_code, e.detail)
+        except Exception as e:
+            # 宏 / 正则 / 序列化等意外错误也只影响这一个任务
+            event = error_event(i, 500, f"Assembly failed: {str(e)}")
+        await results.put((i, event))
+
+    async def run_group(indexes: List[int]):
+        await run_one(indexes[0])
+        # 一个任务意外挂掉不影响组里其他任务交结果
+        await asyncio.gather(*(run_one(i) for i in indexes[1:]), return_exceptions=True)
+
+    # 3. 结果按完成顺序推回；前端断开时取消还没跑完的任务
+    async def event_stream():
+        tasks = [asyncio.create_task(run_group(indexes)) for indexes in groups.values()]
+        finished = asyncio.gather(*tasks, return_exceptions=True)
+        delivered: Set[int] = set()
+        try:
+            # 任务都结束了、队列也空了就不再等 (万一有任务没交结果也不会卡住)
+            while len(delivered) < len(jobs) and not (finished.done() and results.empty()):
+                getter = asyncio.ensure_future(results.get())
+                await asyncio.wait({getter, finished}, return_when=asyncio.FIRST_COMPLETED)
+                if not getter.done():
+                    getter.cancel()
+                    continue
+                i, event = getter.result()
+                delivered.add(i)
+                yield event
+            for i in range(len(jobs)):
+                if i not in delivered:
+                    yield error_event(i, 500, "Assembly task exited without a result")
+            yield "data: [DONE]\n\n"
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+def cache_stats() -> Dict[str, Dict[str, Any]]:
+    """各个缓存的命中统计 (调试接口和 /metrics 共用)"""
+    return {
+        "models": model_cache.stats(),
+        "responses": response_cache.stats(),
+        "preset_plans": preset_plan_cache.stats(),
+        "system_prefix": prefix_cache.stats(),
+        "world_info": world_info_cache.stats(),
+        "regex_scripts": regex_script_cache.stats(),
+        "lorebook_vectors": lorebook_vector_cache.stats(),
+        "chat_vectors": chat_vector_cache.stats(),
+    }
+
+@router.get("/debug/cache", summary="[调试] 缓存命中统计")
+async def debug_cache_stats():
+    return cache_stats()
+
+def _sse(data: dict, event: Optional[str] = None) -> str:
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+# --- 对话接口：拼装后发给上游 LLM ---
+@router.post("/completions", summary="对话补全 (SSE 流式)")
+async def chat_completions(payload: CompletionRequest, request: Request, db: AsyncSession = Depends(get_async_db)):
+    """
+    拼装 Prompt 后转发给 OpenAI 兼容的上游，逐个 token 以 SSE 推给前端：
+        data: {"delta": "..."}   增量文本
+        event: error             上游出错
+        data: [DONE]             结束
+    前端断开时停止读取上游并关闭上游连接。
+    """
+    # 1. 异步查库；校验 + 拼装是 CPU 活，在线程池里跑，不阻塞事件循环
+    assembler, final_messages = await _assemble(payload, db)
+    params = llm.build_params(assembler.preset, model=payload.model)
+    # 稳定前缀交给上游做 prompt cache (按配置，默认不加)
+    final_messages, params = llm.apply_prompt_cache(final_messages, params, assembler.prefix)
+
+    # 2. 转发给上游
+    return await relay_completion(request, final_messages, params, payload.stream, assembler.budget.as_dict())
+
+async def relay_completion(
+    request: Request,
+    messages: List[Dict[str, str]],
+    params: Dict[str, Any],
+    stream: bool,
+    budget: Dict[str, Any],
+    on_finish: Optional[Callable[[str], Awaitable[None]]] = None,
+):
+    """
+    把拼好的消息发给上游。
+    on_finish (可选) 在结束后拿到完整回复 (前端中途断开时是已收到的部分)，用于保存。
+    """
+    # 1. 非流式：收齐再一次性返回
+    if not stream:
+        parts: List[str] = []
+        try:
+            async for delta in timed_stream(messages, params):
+                parts.append(delta)
+        except llm.UpstreamError as e:
+            raise HTTPException(status_code=502, detail=e.detail)
+        content = "".join(parts)
+        if on_finish and content:
+            await on_finish(content)
+        return {"content": content, "budget": budget}
+
+    # 2. 流式：前端读一块，我们才从上游取下一块 (背压)
+    async def event_stream():
+        upstream = timed_stream(messages, params)
+        parts: List[str] = []
+        try:
+            async for delta in upstream:
+                if await request.is_disconnected():
+                    break
+                parts.append(delta)
+                yield _sse({"delta": delta})
+            else:
+                yield "data: [DONE]\n\n"
+        except llm.UpstreamError as e:
+            yield _sse({"status_code": e.status_code, "detail": e.detail}, event="error")
+        finally:
+            # 前端断开 / 出错时立刻关闭上游流，不再占着连接。
+            # 断开时 Starlette 会取消这个任务，收尾要屏蔽取消，否则已收到的部分来不及保存
+            with anyio.CancelScope(shield=True):
+                await upstream.aclose()
+                if on_finish and parts:
+                    await on_finish("".join(parts))
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+async def timed_stream(messages: List[Dict[str, str]], params: Dict[str, Any]):
+    """llm.stream_chat 外面包一层：记首 token 时间 (TTFT)、总耗时和上游错误"""
+    start = time.perf_counter()
+    first = True
+    upstream = llm.stream_chat(messages, params)
+    try:
+        async for delta in upstream:
+            if first:
+                first = False
+                ttft = time.perf_counter() - start
+                metrics.upstream_ttft.observe(ttft)
+                metrics.record("upstream_ttft", ttft)
+            yield delta
+    except llm.UpstreamUnreachable:
+        metrics.upstream_errors.inc("unreachable")
+        raise
+    except llm.UpstreamError as e:
+        metrics.upstream_errors.inc(str(e.status_code))
+        raise
+    else:
+        metrics.upstream_duration.observe(time.perf_counter() - start)
+    finally:
+        await upstream.aclose()
@@ -0,0 +1,212 @@
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core import config, llm, metrics
+from app.core.database import AsyncSessionLocal, get_async_db
+from app.core.macro_engine import MacroContext, expand_macros
+from app.core.model_cache import stamp_of
+from app.core.regex_scripts import ROLE_PLACEMENT, get_regex_scripts
+from app.api.endpoints.chat import load_assembler, relay_completion, run_assembly
+
+from app.modules.character import service as char_service
+from app.modules.preset import service as preset_service
+from app.modules.chat import service as chat_service
+from app.modules.chat import summary as summary_service
+from app.modules.chat.models import SummaryJobModel
+
+router = APIRouter()
+
+# --- 请求体模型 ---
+class ChatCreateRequest(BaseModel):
+    char_id: int
+    preset_id: int
+    lorebook_id: Optional[int] = None
+    user_name: str = "User"
+    # 是否把角色卡的开场白 (first_mes) 作为第一条消息
+    with_greeting: bool = True
+
+class MessageCreateRequest(BaseModel):
+    role: str = "user"
+    content: str
+
+class TurnRequest(BaseModel):
+    # 只需要带本轮的新消息，历史由服务端保存
+    content: str
+    # 模型名 (可选)：不填就用 .env 里的 CHAT_MODEL
+    model: Optional[str] = None
+    stream: bool = True
+
+class MessageOut(BaseModel):
+    id: int
+    role: str
+    content: str
+    token_count: int
+
+    class Config:
+        from_attributes = True
+
+class MessagePage(BaseModel):
+    items: List[MessageOut]
+    # 下一页的游标 (传给 before_id)；没有更早的消息时为 None
+    next_before_id: Optional[int] = None
+
+async def _get_chat_or_404(db: AsyncSession, chat_id: int):
+    chat = await chat_service.get_chat(db, chat_id)
+    if not chat:
+        raise HTTPException(status_code=404, detail="Chat not found")
+    return chat
+
+async def _apply_regex_scripts(db: AsyncSession, chat, role: str, content: str) -> str:
+    """保存前跑一遍角色卡的正则脚本 (只跑既不是 promptOnly 也不是 markdownOnly 的)"""
+    placement = ROLE_PLACEMENT.get(role)
+    char = await char_service.get_character(db, chat.char_id)
+    if placement is None or char is None:
+        return content
+    card = await char_service.load_schema(char)
+    scripts = get_regex_scripts(card, char.id, stamp_of(char))
+    if not scripts:
+        return content
+    ctx = MacroContext(char_name=card.data.name, user_name=chat.user_name)
+    return await run_in_threadpool(scripts.apply, content, placement, macros=lambda text: expand_macros(text, ctx))
+
+@router.post("/", summary="新建聊天")
+async def create_chat(payload: ChatCreateRequest, db: AsyncSession = Depends(get_async_db)):
+    char = await char_service.get_character(db, payload.char_id)
+    if not char:
+        raise HTTPException(status_code=404, detail="Character not found")
+    if not await preset_service.get_preset(db, payload.preset_id):
+        raise HTTPException(status_code=404, detail="Preset not found")
+
+    greeting = ""
+    if payload.with_greeting:
+        greeting = (await char_service.load_schema(char)).data.first_mes or ""
+
+    return await chat_service.create_chat(
+        db,
+        char_id=payload.char_id,
+        preset_id=payload.preset_id,
+        lorebook_id=payload.lorebook_id,
+        user_name=payload.user_name,
+        greeting=greeting,
+    )
+
+@router.get("/{chat_id}", summary="聊天详情")
+async def read_chat(chat_id: int, db: AsyncSession = Depends(get_async_db)):
+    return await _get_chat_or_404(db, chat_id)
+
+@router.post("/{chat_id}/messages", response_model=MessageOut, summary="追加一条消息")
+async def append_message(chat_id: int, payload: MessageCreateRequest, db: AsyncSession = Depends(get_async_db)):
+    chat = await _get_chat_or_404(db, chat_id)
+    content = await _apply_regex_scripts(db, chat, payload.role, payload.content)
+    return await chat_service.append_message(db, chat_id, payload.role, content)
+
+@router.get("/{chat_id}/messages", response_model=MessagePage, summary="分页读取聊天记录 (从新到旧)")
+async def list_messages(
+    chat_id: int,
+    before_id: Optional[int] = None,
+    limit: int = Query(50, ge=1, le=500),
+    db: AsyncSession = Depends(get_async_db),
+):
+    await _get_chat_or_404(db, chat_id)
+    items = await chat_service.list_messages(db, chat_id, before_id=before_id, limit=limit)
+    next_before_id = items[-1].id if len(items) == limit else None
+    return {"items": items, "next_before_id": next_before_id}
+
+@router.get("/{chat_id}/summary", summary="最新的历史总结 + 后台总结任务的状态")
+async def read_summary(chat_id: int, db: AsyncSession = Depends(get_async_db)):
+    await _get_chat_or_404(db, chat_id)
+    return {
+        "summary": await chat_service.latest_summary(db, chat_id),
+        # 没有排队中 / 失败的任务时为 None
+        "job": await db.get(SummaryJobModel, chat_id),
+    }
+
+async def _assemble_turn(db: AsyncSession, chat):
+    """按预设的 token 预算只从库里取需要的那段历史，再拼装"""
+    # 1. 预算上限 = 上下文 - 回复预留；系统段还要再占一部分，拼装时会再精确裁剪
+    with metrics.stage("db_fetch"):
+        preset = await preset_service.get_preset(db, chat.preset_id)
+        if not preset:
+            raise HTTPException(status_code=404, detail="Preset not found")
+        preset_schema = await preset_service.load_schema(preset)
+        # 有历史总结时，总结覆盖的消息不取，总结本身也要占预算
+        summary = await chat_service.latest_summary(db, chat.id) if config.SUMMARY_ENABLED else None
+        window = await chat_service.load_window(
+            db,
+            chat,
+            preset_schema.openai_max_context - preset_schema.openai_max_tokens
+            - (summary.token_count if summary else 0),
+            summary=summary,
+        )
+
+    # 2. 窗口之前的旧消息里，和最近对话相关的按相似度召回
+    memories = None
+    if config.VECTOR_ENABLED:
+        with metrics.stage("recall"):
+            memories = await chat_service.recall_messages(db, chat, window)
+
+    # 3. 拼装 ({{setvar}} / {{setglobalvar}} 会改变量，拼完写回)
+    variables = dict(chat.variables or {})
+    global_before = await chat_service.load_global_variables(db)
+    global_variables = dict(global_before)
+    assembler = await load_assembler(
+        db,
+        char_id=chat.char_id,
+        preset_id=chat.preset_id,
+        history=window,
+        user_name=chat.user_name,
+        lorebook_id=chat.lorebook_id,
+        chat_id=chat.id,
+        variables=variables,
+        global_variables=global_variables,
+        memories=memories,
+        summary={"content": summary.content, "up_to_id": summary.up_to_id} if summary else None,
+    )
+    final_messages = await run_assembly(assembler)
+    if variables != (chat.variables or {}):
+        await chat_service.save_variables(db, chat, variables)
+    await chat_service.save_global_variables(db, global_before, global_variables)
+    return assembler, final_messages
+
+@router.post("/{chat_id}/assemble", summary="[调试] 预览这个聊天下一轮的 Prompt")
+async def debug_assemble_chat(chat_id: int, db: AsyncSession = Depends(get_async_db)):
+    chat = await _get_chat_or_404(db, chat_id)
+    assembler, final_messages = await _assemble_turn(db, chat)
+    return {
+        "info": "Assembly Success",
+        "total_messages": len(final_messages),
+        "prompt": final_messages,
+        "budget": assembler.budget.as_dict()
+    }
+
+@router.post("/{chat_id}/completions", summary="发送一轮对话 (SSE 流式)")
+async def chat_turn(chat_id: int, payload: TurnRequest, request: Request, db: AsyncSession = Depends(get_async_db)):
+    """
+    保存用户消息 -> 按预算取历史拼装 -> 转发上游 -> 保存 AI 回复。
+    返回格式同 /api/chat/completions。
+    """
+    # 1. 先落库用户消息 (过一遍正则脚本)
+    chat = await _get_chat_or_404(db, chat_id)
+    content = await _apply_regex_scripts(db, chat, "user", payload.content)
+    await chat_service.append_message(db, chat_id, "user", content)
+    await db.refresh(chat)
+
+    # 2. 拼装
+    assembler, final_messages = await _assemble_turn(db, chat)
+    params = llm.build_params(assembler.preset, model=payload.model)
+    final_messages, params = llm.apply_prompt_cache(final_messages, params, assembler.prefix)
+
+    # 3. 回复结束后保存 (流式时请求的 session 可能已关闭，单独开一个)
+    #    历史长到阈值时顺便排一个后台总结任务 (只落库入队，不等模型)
+    async def save_reply(content: str):
+        async with AsyncSessionLocal() as session:
+            content = await _apply_regex_scripts(session, chat, "assistant", content)
+            await chat_service.append_message(session, chat_id, "assistant", content)
+            await summary_service.maybe_enqueue(session, chat_id, assembler.preset)
+
+    return await relay_completion(
+        request, final_messages, params, payload.stream, assembler.budget.as_dict(), on_finish=save_reply
+    )
@@ -0,0 +1,32 @@
+import json
+from typing import Literal, Optional
+from fastapi import APIRouter, File, Form, UploadFile
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import iterate_in_threadpool
+
+from app.core import config
+from app.modules.importer import service
+from app.modules.importer.sources import iter_items
+
+router = APIRouter()
+
+@router.post("/", summary="批量导入角色卡 / 预设 / 世界书")
+async def bulk_import(
+    file: UploadFile = File(..., description="ZIP / tar(.gz) / NDJSON / JSON / PNG 角色卡"),
+    kind: Optional[Literal["character", "preset", "lorebook"]] = Form(None, description="不填则按内容自动识别"),
+):
+    """
+    以 NDJSON 流式返回进度，每处理完一条输出一行：
+        {"index": 0, "name": "a.png", "status": "created", "kind": "character", "id": 12}
+        {"index": 1, "name": "b.json", "status": "duplicate", "kind": "preset", "id": 3}
+        {"index": 2, "name": "c.json", "status": "error", "detail": "..."}
+    最后一行是汇总：{"done": true, "total": 3, "created": 1, ...}
+    """
+    # 拆包是阻塞 IO，放到线程池里逐条读
+    items = iterate_in_threadpool(iter_items(file.file, file.filename or "", config.IMPORT_MAX_ITEM_BYTES))
+
+    async def progress():
+        async for event in service.import_items(items, kind=kind):
+            yield json.dumps(event, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(progress(), media_type="application/x-ndjson")
@@ -1,18 +1,21 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from app.core.database import get_db
+from fastapi import APIRouter, Depends, HTTPException, Request
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.database import get_async_db
+from app.core.http_cache import cached_json_response
 from app.modules.lorebook import service
+from app.modules.lorebook.models import LorebookModel
 from app.schemas.lorebook import LorebookV3
 
 router = APIRouter()
 
 @router.post("/", summary="上传世界书")
-def create_lorebook(lb: LorebookV3, db: Session = Depends(get_db)):
-    return service.create_lorebook(db, lb.model_dump())
+async def create_lorebook(lb: LorebookV3, request: Request, db: AsyncSession = Depends(get_async_db)):
+    return await service.create_lorebook(db, lb.model_dump(), source=await request.json())
 
 @router.get("/{lb_id}", summary="获取世界书")
-def read_lorebook(lb_id: int, db: Session = Depends(get_db)):
-    db_lb = service.get_lorebook(db, lb_id)
+async def read_lorebook(lb_id: int, request: Request, db: AsyncSession = Depends(get_async_db)):
+    db_lb = await service.get_lorebook(db, lb_id)
     if db_lb is None:
         raise HTTPException(status_code=404, detail="Lorebook not found")
-    return db_lb
\ No newline at end of file
+    # 按版本缓存序列化好的 JSON，带 ETag (匹配时 304) 和 gzip / br 压缩
+    return await cached_json_response(request, LorebookModel.__tablename__, db_lb)
\ No newline at end of file
@@ -0,0 +1,28 @@
+from typing import Iterable
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from app.core.metrics import registry
+from app.api.endpoints.chat import cache_stats
+
+router = APIRouter()
+
+def _cache_metrics() -> Iterable[str]:
+    """各个缓存的命中统计，抓取时才读"""
+    stats = cache_stats()
+    for name, kind, doc in (
+        ("hits", "counter", "Cache hits"),
+        ("misses", "counter", "Cache misses"),
+        ("size", "gauge", "Entries currently cached"),
+    ):
+        metric = f"prisma_cache_{name}_total" if kind == "counter" else f"prisma_cache_{name}"
+        yield f"# HELP {metric} {doc}"
+        yield f"# TYPE {metric} {kind}"
+        for cache, values in stats.items():
+            yield f'{metric}{{cache="{cache}"}} {values[name]}'
+
+registry.add_collector(_cache_metrics)
+
+@router.get("/metrics", summary="Prometheus 指标", response_class=PlainTextResponse)
+def read_metrics():
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
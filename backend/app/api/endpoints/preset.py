@@ -1,18 +1,21 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from app.core.database import get_db
+from fastapi import APIRouter, Depends, HTTPException, Request
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.database import get_async_db
+from app.core.http_cache import cached_json_response
 from app.modules.preset import service
+from app.modules.preset.models import PresetModel
 from app.schemas.preset import SillyTavernPreset
 
 router = APIRouter()
 
 @router.post("/upload", summary="创建预设")
-def create_preset(preset: SillyTavernPreset, db: Session = Depends(get_db)):
-    return service.create_preset(db, preset.model_dump())
+async def create_preset(preset: SillyTavernPreset, request: Request, db: AsyncSession = Depends(get_async_db)):
+    return await service.create_preset(db, preset.model_dump(), source=await request.json())
 
 @router.get("/{preset_id}", summary="获取预设")
-def read_preset(preset_id: int, db: Session = Depends(get_db)):
-    db_preset = service.get_preset(db, preset_id)
+async def read_preset(preset_id: int, request: Request, db: AsyncSession = Depends(get_async_db)):
+    db_preset = await service.get_preset(db, preset_id)
     if db_preset is None:
         raise HTTPException(status_code=404, detail="Preset not found")
-    return db_preset
\ No newline at end of file
+    # 按版本缓存序列化好的 JSON，带 ETag (匹配时 304) 和 gzip / br 压缩
+    return await cached_json_response(request, PresetModel.__tablename__, db_preset)
\ No newline at end of file
@@ -0,0 +1,77 @@
+"""
+压缩存储的 JSON 列
+
+角色卡 / 预设 / 世界书的完整 JSON 动辄几十上百 KB，而且大量是重复的提示词文本，
+压缩后通常只剩 1/4 ~ 1/6。存成 BLOB：
+    1 字节格式头 + 压缩后的 UTF-8 JSON
+    \\x01  zlib
+    \\x02  zstd (装了 zstandard 且 BLOB_CODEC=zstd 时写入；读取只要装了就能读)
+旧数据库里是明文 JSON (TEXT)，读取时原样兼容；启动时的迁移会把它们改写成压缩格式。
+列本身配合 deferred() 使用：不访问 .data 就不会从库里读出来，更不会解压。
+"""
+import json
+import zlib
+from typing import Any, Optional
+
+from sqlalchemy.types import LargeBinary, TypeDecorator
+
+from app.core import config
+
+CODEC_ZLIB = b"\x01"
+CODEC_ZSTD = b"\x02"
+
+try:
+    import zstandard
+except ImportError:  # 可选依赖
+    zstandard = None
+
+
+def _zstd_codec() -> bool:
+    return config.BLOB_CODEC == "zstd" and zstandard is not None
+
+
+def compress_json(value: Any) -> bytes:
+    raw = json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    if _zstd_codec():
+        return CODEC_ZSTD + zstandard.ZstdCompressor(level=config.BLOB_LEVEL).compress(raw)
+    return CODEC_ZLIB + zlib.compress(raw, config.BLOB_LEVEL)
+
+
+def decompress_json(value: Any) -> Any:
+    # 旧数据：明文 JSON
+    if isinstance(value, str):
+        return json.loads(value)
+    value = bytes(value)
+    head, body = value[:1], value[1:]
+    if head == CODEC_ZLIB:
+        return json.loads(zlib.decompress(body))
+    if head == CODEC_ZSTD:
+        if zstandard is None:
+            raise RuntimeError("Blob is zstd-compressed but the zstandard package is not installed")
+        return json.loads(zstandard.ZstdDecompressor().decompress(body))
+    # 没有格式头：当作明文 JSON 的 bytes
+    return json.loads(value)
+
+
+class _RawBlob(LargeBinary):
+    """结果不做 bytes() 转换：旧行是 TEXT，原样交给 CompressedJSON 判断"""
+
+    def result_processor(self, dialect, coltype):
+        return None
+
+
+class CompressedJSON(TypeDecorator):
+    """写入时压缩、读出时解压的 JSON 列"""
+
+    impl = _RawBlob
+    cache_ok = True
+
+    def process_bind_param(self, value: Any, dialect) -> Optional[bytes]:
+        if value is None:
+            return None
+        return compress_json(value)
+
+    def process_result_value(self, value: Any, dialect) -> Any:
+        if value is None:
+            return None
+        return decompress_json(value)
@@ -0,0 +1,75 @@
+"""
+通用的带版本 LRU 缓存
+
+预设执行计划、世界书索引这类「根据某个对象编译出来、对象不变就一直能用」的东西，
+都按 (对象 ID, 版本) 缓存。版本由调用方提供 (比如更新时间)，对象一改版本就变，
+旧条目不会再被命中，最终被 LRU 淘汰掉。
+"""
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Callable, Dict, Generic, Hashable, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+
+
+class VersionedLRUCache(Generic[T]):
+    def __init__(self, maxsize: int = 64):
+        self.maxsize = maxsize
+        self._data: "OrderedDict[Tuple[Hashable, Hashable], T]" = OrderedDict()
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_build(self, key: Hashable, version: Hashable, builder: Callable[[], T]) -> T:
+        """命中就直接返回；否则调用 builder 生成并放入缓存"""
+        full_key = (key, version)
+        with self._lock:
+            value = self._data.get(full_key)
+            if value is not None:
+                self._data.move_to_end(full_key)
+                self.hits += 1
+                return value
+            self.misses += 1
+
+        # 构建放在锁外面，避免大对象卡住其他请求
+        value = builder()
+        with self._lock:
+            self._data[full_key] = value
+            self._data.move_to_end(full_key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+        return value
+
+    def peek(self, key: Hashable, version: Hashable) -> Optional[T]:
+        """只查不建：命中返回对象，否则返回 None"""
+        full_key = (key, version)
+        with self._lock:
+            value = self._data.get(full_key)
+            if value is None:
+                return None
+            self._data.move_to_end(full_key)
+            self.hits += 1
+            return value
+
+    def invalidate(self, key: Optional[Hashable] = None) -> None:
+        """删除某个对象的所有版本；不传 key 就全部清空"""
+        with self._lock:
+            if key is None:
+                self._data.clear()
+                return
+            for full_key in [k for k in self._data if k[0] == key]:
+                del self._data[full_key]
+
+    def stats(self) -> Dict[str, Any]:
+        """命中统计 (调试 / 监控用)"""
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+    def __len__(self) -> int:
+        return len(self._data)
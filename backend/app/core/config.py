@@ -0,0 +1,119 @@
+"""
+后端配置：从环境变量 / backend/.env 读取
+
+模块没有单独配置 Key / URL 时，继承 GLOBAL_LLM_KEY / GLOBAL_LLM_URL (见 .env 里的说明)。
+"""
+import os
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+def _get_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    return int(value) if value else default
+
+
+def _get_float(name: str, default: float) -> float:
+    value = os.getenv(name)
+    return float(value) if value else default
+
+
+# --- 全局基底 ---
+GLOBAL_LLM_KEY = os.getenv("GLOBAL_LLM_KEY", "")
+GLOBAL_LLM_URL = os.getenv("GLOBAL_LLM_URL") or "https://api.openai.com/v1"
+
+# --- 主对话模块 ---
+CHAT_MODEL = os.getenv("CHAT_MODEL", "")
+CHAT_API_KEY = os.getenv("CHAT_API_KEY") or GLOBAL_LLM_KEY
+CHAT_API_URL = (os.getenv("CHAT_API_URL") or GLOBAL_LLM_URL).rstrip("/")
+
+# --- 工具模块 (后台总结) ---
+UTILITY_MODEL = os.getenv("UTILITY_MODEL") or CHAT_MODEL
+UTILITY_API_KEY = os.getenv("UTILITY_API_KEY") or GLOBAL_LLM_KEY
+UTILITY_API_URL = (os.getenv("UTILITY_API_URL") or GLOBAL_LLM_URL).rstrip("/")
+
+# --- 上游连接池 (整个应用共用一个 httpx.AsyncClient) ---
+UPSTREAM_MAX_CONNECTIONS = _get_int("UPSTREAM_MAX_CONNECTIONS", 100)
+UPSTREAM_MAX_KEEPALIVE = _get_int("UPSTREAM_MAX_KEEPALIVE", 20)
+UPSTREAM_KEEPALIVE_EXPIRY = _get_float("UPSTREAM_KEEPALIVE_EXPIRY", 60.0)
+UPSTREAM_CONNECT_TIMEOUT = _get_float("UPSTREAM_CONNECT_TIMEOUT", 10.0)
+# 流式输出时两个 chunk 之间最长等待时间 (推理模型思考可能很久)
+UPSTREAM_READ_TIMEOUT = _get_float("UPSTREAM_READ_TIMEOUT", 300.0)
+
+# --- 上游 prompt cache 提示 (见 llm.apply_prompt_cache) ---
+# 逗号分隔，默认不加 (不认识这些字段的上游可能报错)：
+#   key         请求体带 prompt_cache_key = 稳定前缀的哈希 (OpenAI)
+#   breakpoint  稳定前缀的最后一条消息标上 cache_control (Anthropic 风格，OpenRouter / LiteLLM 会透传)
+PROMPT_CACHE = {m.strip() for m in os.getenv("PROMPT_CACHE", "").lower().split(",") if m.strip()}
+# 前缀太短时不打断点 (Anthropic 要求至少 1024 token 才缓存)
+PROMPT_CACHE_MIN_TOKENS = _get_int("PROMPT_CACHE_MIN_TOKENS", 1024)
+
+# --- 批量拼装 (/api/chat/assemble/batch) ---
+# 一次最多几个任务、同时拼几个 (线程池里跑)
+ASSEMBLE_BATCH_MAX_JOBS = _get_int("ASSEMBLE_BATCH_MAX_JOBS", 64)
+ASSEMBLE_BATCH_CONCURRENCY = _get_int("ASSEMBLE_BATCH_CONCURRENCY", min(4, os.cpu_count() or 1))
+
+# --- 历史总结 (后台任务，见 modules/chat/summary.py) ---
+SUMMARY_ENABLED = os.getenv("SUMMARY_ENABLED", "1").lower() not in ("0", "false", "no")
+# 还没被总结覆盖的消息超过 openai_max_context 的这个比例时，排一个总结任务
+SUMMARY_TRIGGER_RATIO = _get_float("SUMMARY_TRIGGER_RATIO", 0.75)
+# 最近这么多 (占 上下文 - 回复预留 的比例) 的消息保持原文，不总结
+SUMMARY_KEEP_RATIO = _get_float("SUMMARY_KEEP_RATIO", 0.4)
+# 每次交给工具模型的原文上限 (token)，更长的分几次滚动总结
+SUMMARY_CHUNK_TOKENS = _get_int("SUMMARY_CHUNK_TOKENS", 4096)
+# 总结的长度上限 (工具模型的 max_tokens)
+SUMMARY_MAX_TOKENS = _get_int("SUMMARY_MAX_TOKENS", 512)
+# 同时跑几个总结任务
+SUMMARY_CONCURRENCY = _get_int("SUMMARY_CONCURRENCY", 2)
+# 失败后隔多久才允许再次触发 (秒)
+SUMMARY_RETRY_SECONDS = _get_float("SUMMARY_RETRY_SECONDS", 300.0)
+# 总结放进 prompt 时的格式 ({{summary}} 换成总结内容)
+SUMMARY_TEMPLATE = os.getenv("SUMMARY_TEMPLATE", "[Summary of the story so far]\n{{summary}}")
+
+# --- 数据库 (SQLite) ---
+DB_POOL_SIZE = _get_int("DB_POOL_SIZE", 10)
+DB_MAX_OVERFLOW = _get_int("DB_MAX_OVERFLOW", 10)
+DB_POOL_TIMEOUT = _get_float("DB_POOL_TIMEOUT", 30.0)
+SQLITE_MMAP_SIZE = _get_int("SQLITE_MMAP_SIZE", 256 * 1024 * 1024)
+SQLITE_CACHE_KB = _get_int("SQLITE_CACHE_KB", 64 * 1024)
+SQLITE_BUSY_TIMEOUT_MS = _get_int("SQLITE_BUSY_TIMEOUT_MS", 5000)
+
+# --- 批量导入 ---
+# 校验用的进程数 (0 = 不开进程池，在线程池里校验)
+IMPORT_WORKERS = _get_int("IMPORT_WORKERS", min(4, os.cpu_count() or 1))
+# 每个事务插入多少条
+IMPORT_BATCH_SIZE = _get_int("IMPORT_BATCH_SIZE", 200)
+# 单个条目 (JSON / PNG 里的角色数据) 的大小上限，防止压缩炸弹
+IMPORT_MAX_ITEM_BYTES = _get_int("IMPORT_MAX_ITEM_BYTES", 16 * 1024 * 1024)
+
+# --- JSON 大字段压缩 ---
+# zlib (标准库) 或 zstd (需要 pip install zstandard，没装时自动用 zlib)
+BLOB_CODEC = os.getenv("BLOB_CODEC", "zlib").lower()
+BLOB_LEVEL = _get_int("BLOB_LEVEL", 6)
+
+# --- 角色卡正则脚本 ---
+# 单个脚本单次执行的超时，超时次数达到上限后隔离该脚本
+REGEX_SCRIPT_TIMEOUT_MS = _get_int("REGEX_SCRIPT_TIMEOUT_MS", 50)
+REGEX_SCRIPT_MAX_STRIKES = _get_int("REGEX_SCRIPT_MAX_STRIKES", 3)
+# 上传时试跑：每条构造输入的长度和超时
+REGEX_PROBE_LENGTH = _get_int("REGEX_PROBE_LENGTH", 2000)
+REGEX_PROBE_TIMEOUT_MS = _get_int("REGEX_PROBE_TIMEOUT_MS", 20)
+
+# --- 编译好的世界书 (见 core/world_info_artifact.py) ---
+# 关键词自动机 + 词条表写成文件，多个 worker 只读 mmap 共享同一份；关掉时每个进程各自在内存里编译
+WORLD_INFO_MMAP = os.getenv("WORLD_INFO_MMAP", "1").lower() not in ("0", "false", "no")
+WORLD_INFO_DIR = os.getenv("WORLD_INFO_DIR", "./world_info")
+
+# --- 本地向量检索 (世界书词条 / 较早的聊天记录) ---
+VECTOR_ENABLED = os.getenv("VECTOR_ENABLED", "1").lower() not in ("0", "false", "no")
+# 向量文件 (numpy memmap) 存放目录
+VECTOR_DIR = os.getenv("VECTOR_DIR", "./vectors")
+# 嵌入模型：默认 hashing (离线、确定性)，其他实现注册到 vector_store.EMBEDDERS
+VECTOR_EMBEDDER = os.getenv("VECTOR_EMBEDDER", "hashing")
+VECTOR_DIM = _get_int("VECTOR_DIM", 256)
+# 每轮最多召回几条、相似度下限、召回内容最多占多少 token
+VECTOR_TOP_K = _get_int("VECTOR_TOP_K", 8)
+VECTOR_MIN_SCORE = _get_float("VECTOR_MIN_SCORE", 0.25)
+VECTOR_BUDGET_TOKENS = _get_int("VECTOR_BUDGET_TOKENS", 1024)
@@ -1,24 +1,65 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import AsyncAttrs, AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
+from app.core import config
+
 # 1. 定义数据库地址
 # 这里我们使用本地的 sqlite 文件，它会自动在项目根目录生成一个 test.db
 SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
+# 异步版本用 aiosqlite 驱动，指向同一个文件
+ASYNC_DATABASE_URL = SQLALCHEMY_DATABASE_URL.replace("sqlite://", "sqlite+aiosqlite://", 1)
+
+# SQLite 调优：每个新连接建立时执行
+# - WAL：读写互不阻塞，上传时照样能读
+# - synchronous=NORMAL：WAL 模式下安全且少很多 fsync
+# - mmap / cache_size：热数据直接走内存
+# - busy_timeout：写锁被占用时等一会儿，而不是直接报 database is locked
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    f"PRAGMA mmap_size={config.SQLITE_MMAP_SIZE}",
+    f"PRAGMA cache_size=-{config.SQLITE_CACHE_KB}",
+    "PRAGMA temp_store=MEMORY",
+    f"PRAGMA busy_timeout={config.SQLITE_BUSY_TIMEOUT_MS}",
+)
+
+def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for pragma in SQLITE_PRAGMAS:
+        cursor.execute(pragma)
+    cursor.close()
 
 # 2. 创建引擎 (Engine)
 # check_same_thread=False 是 SQLite 专门需要的配置
 engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
+    SQLALCHEMY_DATABASE_URL,
+    connect_args={"check_same_thread": False},
+    pool_size=config.DB_POOL_SIZE,
+    max_overflow=config.DB_MAX_OVERFLOW,
 )
+event.listen(engine, "connect", _apply_sqlite_pragmas)
+
+# 异步引擎：接口都用它，查库时不占线程池
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    pool_size=config.DB_POOL_SIZE,
+    max_overflow=config.DB_MAX_OVERFLOW,
+    pool_timeout=config.DB_POOL_TIMEOUT,
+)
+event.listen(async_engine.sync_engine, "connect", _apply_sqlite_pragmas)
 
 # 3. 创建会话工厂 (SessionLocal)
 # 以后我们在代码里要操作数据库，就通过这个 SessionLocal 领号
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# 异步会话工厂：提交后不让对象过期，返回给 FastAPI 序列化时不用再查一次库
+AsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False, autoflush=False)
 
 # 4. 创建基类 (Base)
 # 所有的数据库模型都要继承这个 Base，这样 SQLAlchemy 才知道它们是表
-Base = declarative_base()
+# AsyncAttrs：异步会话里读延迟加载的列用 await obj.awaitable_attrs.data
+Base = declarative_base(cls=AsyncAttrs)
 
 # 5. 依赖项 (Dependency)
 # 这是一个工具函数，给 FastAPI 的接口用的。
@@ -28,4 +69,9 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+# 异步版本的依赖项，接口里用 Depends(get_async_db)
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
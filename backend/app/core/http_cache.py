@@ -0,0 +1,131 @@
+"""
+大对象 GET 接口的响应缓存
+
+角色卡 / 预设 / 世界书的 GET 每次都走 jsonable_encoder 重新编码，一个 100 KB 的预设就要好几毫秒，
+而前端会反复拉同一个对象。这里按 (表名, ID) + 版本戳缓存：
+    - 序列化好的 JSON bytes (有 orjson 用 orjson)
+    - 内容哈希做的强 ETag：请求带 If-None-Match 且匹配时直接 304，不读 data、不序列化
+    - gzip / br 压缩结果 (按需生成，每个版本每种编码只压一次)
+响应带 Cache-Control: no-cache，浏览器每次都会带 If-None-Match 来验证。
+"""
+import gzip
+import hashlib
+import json
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from fastapi import Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import inspect
+
+from app.core.model_cache import response_cache, stamp_of
+
+try:
+    import orjson
+except ImportError:  # 可选依赖，没装就用标准库
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # 可选依赖，没装就只支持 gzip
+    brotli = None
+
+# 小于这个大小的响应不压缩 (压缩省下的字节抵不上开销)
+MIN_COMPRESS_SIZE = 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+@dataclass
+class CachedBody:
+    raw: bytes
+    etag: str
+    encoded: Dict[str, bytes] = field(default_factory=dict)
+
+    def encode(self, encoding: str) -> bytes:
+        body = self.encoded.get(encoding)
+        if body is None:
+            if encoding == "br":
+                body = brotli.compress(self.raw, quality=BROTLI_QUALITY)
+            else:
+                body = gzip.compress(self.raw, compresslevel=GZIP_LEVEL, mtime=0)
+            self.encoded[encoding] = body
+        return body
+
+
+def _default(value: Any) -> Any:
+    # JSON 没有的类型 (datetime 等) 交给 jsonable_encoder：和改用缓存之前的输出一致，装没装 orjson 都一样
+    return jsonable_encoder(value)
+
+
+def dumps(value: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(value, default=_default)
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"), default=_default).encode("utf-8")
+
+
+def row_dict(row: Any) -> Dict[str, Any]:
+    """ORM 行的所有列 (和直接返回 ORM 对象时的字段一致)"""
+    return {attr.key: getattr(row, attr.key) for attr in inspect(row).mapper.column_attrs}
+
+
+def _build(row: Any) -> CachedBody:
+    raw = dumps(row_dict(row))
+    return CachedBody(raw=raw, etag=f'"{hashlib.blake2b(raw, digest_size=16).hexdigest()}"')
+
+
+def _etag_matches(header: Optional[str], etag: str) -> bool:
+    # If-None-Match 用弱比较：W/"x" 和 "x" 视为相同
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in header.split(","))
+
+
+def _pick_encoding(header: Optional[str]) -> Optional[str]:
+    """按 Accept-Encoding 的 q 值选 br / gzip；同分时优先 br"""
+    if not header:
+        return None
+    offered: Dict[str, float] = {}
+    for part in header.split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        offered[name.strip().lower()] = q
+
+    candidates: List[str] = ["br", "gzip"] if brotli is not None else ["gzip"]
+    best, best_q = None, 0.0
+    for encoding in candidates:
+        q = offered.get(encoding, offered.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+async def cached_json_response(request: Request, table: str, row: Any) -> Response:
+    """返回带 ETag 的 JSON；行的 data 列是延迟加载的，只有缓存没命中时才读"""
+    key, version = (table, row.id), stamp_of(row)
+    cached = response_cache.peek(key, version)
+    if cached is None:
+        await row.awaitable_attrs.data
+        cached = await run_in_threadpool(response_cache.get_or_build, key, version, lambda: _build(row))
+
+    headers = {"ETag": cached.etag, "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+    if _etag_matches(request.headers.get("if-none-match"), cached.etag):
+        return Response(status_code=304, headers=headers)
+
+    body = cached.raw
+    if len(body) >= MIN_COMPRESS_SIZE:
+        encoding = _pick_encoding(request.headers.get("accept-encoding"))
+        if encoding:
+            # 每个版本每种编码只压一次，之后直接复用
+            body = cached.encoded.get(encoding) or await run_in_threadpool(cached.encode, encoding)
+            headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type="application/json", headers=headers)
@@ -0,0 +1,182 @@
+"""
+LLM 调用接口封装 (OpenAI 兼容上游)
+
+整个应用共用一个 httpx.AsyncClient：连接保持 keep-alive，能用 HTTP/2 就用 HTTP/2，
+每轮对话不用重新握手。客户端在应用启动时创建、关闭时释放 (见 main.py 的 lifespan)。
+httpx 在创建客户端时才导入：只导入 app (脚本 / 迁移) 时不加载。
+"""
+import json
+from typing import TYPE_CHECKING, Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from app.core import config
+from app.schemas.preset import SillyTavernPreset
+
+if TYPE_CHECKING:
+    import httpx
+
+    from app.core.prompt_prefix import SystemPrefix
+
+_client: Optional["httpx.AsyncClient"] = None
+
+
+class UpstreamError(Exception):
+    """上游返回了错误状态码或无法解析的数据"""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(f"Upstream error {status_code}: {detail}")
+        self.status_code = status_code
+        self.detail = detail
+
+
+class UpstreamUnreachable(UpstreamError):
+    """连不上上游 / 读超时 (httpx 的网络错误)"""
+
+    def __init__(self, error: Exception):
+        super().__init__(502, f"Upstream unreachable: {error}")
+
+
+def _http2_available() -> bool:
+    # HTTP/2 需要 h2 包 (pip install httpx[http2])，没装就退回 HTTP/1.1
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def create_http_client() -> "httpx.AsyncClient":
+    import httpx
+
+    return httpx.AsyncClient(
+        http2=_http2_available(),
+        limits=httpx.Limits(
+            max_connections=config.UPSTREAM_MAX_CONNECTIONS,
+            max_keepalive_connections=config.UPSTREAM_MAX_KEEPALIVE,
+            keepalive_expiry=config.UPSTREAM_KEEPALIVE_EXPIRY,
+        ),
+        timeout=httpx.Timeout(
+            config.UPSTREAM_READ_TIMEOUT,
+            connect=config.UPSTREAM_CONNECT_TIMEOUT,
+        ),
+    )
+
+
+async def startup() -> None:
+    global _client
+    if _client is None:
+        _client = create_http_client()
+
+
+async def shutdown() -> None:
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def get_http_client() -> "httpx.AsyncClient":
+    """取共享的客户端；脚本里没走 lifespan 时按需创建"""
+    global _client
+    if _client is None:
+        _client = create_http_client()
+    return _client
+
+
+def build_params(preset: SillyTavernPreset, model: Optional[str] = None) -> Dict[str, Any]:
+    """从预设里取出生成参数"""
+    return {
+        "model": model or config.CHAT_MODEL,
+        "temperature": preset.temperature,
+        "top_p": preset.top_p,
+        "frequency_penalty": preset.frequency_penalty,
+        "presence_penalty": preset.presence_penalty,
+        "max_tokens": preset.openai_max_tokens,
+    }
+
+
+def apply_prompt_cache(
+    messages: List[Dict[str, Any]], params: Dict[str, Any], prefix: Optional["SystemPrefix"]
+) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    """
+    按 PROMPT_CACHE 配置告诉上游哪一段是稳定前缀 (messages 的前 len(prefix.messages) 条)。
+    返回新的 (messages, params)，不改传进来的对象。
+    """
+    if prefix is None or not prefix.messages or not config.PROMPT_CACHE:
+        return messages, params
+
+    # 1. 同一个前缀用同一个键，上游按键路由到同一份缓存
+    if "key" in config.PROMPT_CACHE:
+        params = {**params, "prompt_cache_key": prefix.hash}
+
+    # 2. 断点：前缀最后一条消息改成内容块的形式，带上 cache_control
+    if "breakpoint" in config.PROMPT_CACHE and prefix.tokens >= config.PROMPT_CACHE_MIN_TOKENS:
+        last = len(prefix.messages) - 1
+        marked = {
+            **messages[last],
+            "content": [{
+                "type": "text",
+                "text": messages[last]["content"],
+                "cache_control": {"type": "ephemeral"},
+            }],
+        }
+        messages = messages[:last] + [marked] + messages[last + 1:]
+    return messages, params
+
+
+def _headers(api_key: Optional[str] = None) -> Dict[str, str]:
+    headers = {"Accept": "text/event-stream"}
+    api_key = config.CHAT_API_KEY if api_key is None else api_key
+    if api_key:
+        headers["Authorization"] = f"Bearer {api_key}"
+    return headers
+
+
+async def stream_chat(
+    messages: List[Dict[str, str]],
+    params: Dict[str, Any],
+    api_url: Optional[str] = None,
+    api_key: Optional[str] = None,
+) -> AsyncIterator[str]:
+    """
+    流式请求上游，逐个 yield 增量文本。
+    调用方不取下一块，这里就不会继续读上游 (天然背压)；
+    调用方关闭生成器时，async with 退出，上游连接随之取消。
+    连不上 / 超时抛 UpstreamUnreachable (也是 UpstreamError)。
+    api_url / api_key 默认用主对话模块的配置 (工具模型传 UTILITY_*)。
+    """
+    import httpx
+
+    body = {**params, "messages": messages, "stream": True}
+    client = get_http_client()
+    try:
+        async with client.stream(
+            "POST", f"{api_url or config.CHAT_API_URL}/chat/completions", json=body, headers=_headers(api_key)
+        ) as resp:
+            if resp.status_code >= 400:
+                detail = (await resp.aread()).decode("utf-8", errors="replace")
+                raise UpstreamError(resp.status_code, detail[:500])
+
+            async for line in resp.aiter_lines():
+                # SSE：只关心 "data: ..." 行，空行和注释跳过
+                if not line.startswith("data:"):
+                    continue
+                data = line[5:].strip()
+                if data == "[DONE]":
+                    break
+                try:
+                    chunk = json.loads(data)
+                except json.JSONDecodeError:
+                    raise UpstreamError(502, f"Bad chunk from upstream: {data[:200]}")
+
+                for choice in chunk.get("choices") or []:
+                    content = (choice.get("delta") or {}).get("content")
+                    if content:
+                        yield content
+    except httpx.HTTPError as e:
+        # 网络错误统一换成 UpstreamError，调用方不用再认识 httpx
+        raise UpstreamUnreachable(e) from e
+
+
+async def complete(messages: List[Dict[str, str]], params: Dict[str, Any], **kwargs: Any) -> str:
+    """不需要逐块处理时：把流式结果拼成完整文本 (后台任务用)"""
+    return "".join([chunk async for chunk in stream_chat(messages, params, **kwargs)])
@@ -0,0 +1,537 @@
+"""
+宏引擎 (Macro Engine)
+
+旧写法是每个宏做一遍 str.replace，宏越多、历史越长就越慢。
+这里把模板一次性切分成「纯文本 + 宏调用」的编译形式并缓存起来，
+展开时只需要线性走一遍，每个宏交给注册表里的处理函数。
+
+支持的语法与酒馆一致：
+    {{char}} / {{user}}                 简单宏
+    {{setvar::name::value}}             双冒号分隔参数
+    {{random:a,b,c}} / {{roll:1d6}}     单冒号参数
+    {{// 注释}}                         注释，输出为空
+    {{trim}}                            删除自身两侧的换行
+宏参数里可以继续嵌套宏，例如 {{setvar::a::{{getvar::b}}}}。
+未注册的宏原样保留。
+"""
+import random
+import re
+import zlib
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+# --- 编译产物 ---
+
+@dataclass(frozen=True)
+class MacroCall:
+    """一个宏调用：名字 (已转小写) + 参数 (每个参数本身也是编译好的模板)"""
+    name: str
+    args: Tuple["Template", ...]
+    raw: str  # 原始文本，宏未注册时原样输出
+
+
+class _Trim:
+    """{{trim}} 标记：展开时吃掉两侧的换行"""
+    __slots__ = ()
+
+    def __repr__(self) -> str:
+        return "TRIM"
+
+
+TRIM = _Trim()
+
+# 模板 = 纯文本 / 宏调用 / TRIM 组成的元组
+Template = Tuple[Union[str, MacroCall, _Trim], ...]
+
+
+# --- 展开时的上下文 ---
+
+@dataclass
+class MacroContext:
+    """一次拼装共享的宏上下文 (变量在同一轮内是累积的)"""
+    char_name: str = "Assistant"
+    user_name: str = "User"
+    # 角色卡字段 (description / personality / scenario ...)，按需填充
+    card_fields: Dict[str, str] = field(default_factory=dict)
+    # 聊天记录 (用于 lastMessage 等宏)
+    history: List[Dict[str, str]] = field(default_factory=list)
+    # 局部变量 ({{setvar}} / {{getvar}})，由调用方按聊天保存
+    variables: Dict[str, Any] = field(default_factory=dict)
+    # 全局变量 ({{setglobalvar}} / {{getglobalvar}})，由调用方保存 (所有聊天共享)
+    global_variables: Dict[str, Any] = field(default_factory=dict)
+    # 随机数来源；{{pick}} 用 seed 保证同一聊天结果稳定
+    rng: random.Random = field(default_factory=random.Random)
+    seed: str = ""
+    now: Callable[[], datetime] = datetime.now
+    max_prompt: int = 0
+    # 纯宏 (结果只取决于上下文，比如 {{char}}) 的结果缓存，同一轮只算一次
+    memo: Dict[str, str] = field(default_factory=dict)
+
+
+MacroHandler = Callable[[MacroContext, List[str]], str]
+
+
+class MacroRegistry:
+    """宏处理函数注册表：名字不区分大小写"""
+
+    def __init__(self):
+        self._handlers: Dict[str, MacroHandler] = {}
+        # 无参数且结果在一轮内不变的宏，展开时会记在 ctx.memo 里
+        self.pure: set = set()
+        # 结果只取决于参数、角色卡 / 用户名 / 预设和变量的宏 (不看聊天记录、时间、随机数)，纯宏也算
+        # 只含这类宏的段，变量相同时每轮结果都一样 (见 is_stable / prompt_prefix)
+        self.stable: set = set()
+
+    def register(self, *names: str, pure: bool = False, stable: bool = False):
+        """装饰器：@registry.register("char", "charIfNotGroup", pure=True)"""
+        def decorator(func: MacroHandler) -> MacroHandler:
+            for name in names:
+                name = name.lower()
+                self._handlers[name] = func
+                for group, flag in ((self.pure, pure), (self.stable, pure or stable)):
+                    if flag:
+                        group.add(name)
+                    else:
+                        group.discard(name)
+            return func
+        return decorator
+
+    def get(self, name: str) -> Optional[MacroHandler]:
+        return self._handlers.get(name)
+
+    def __contains__(self, name: str) -> bool:
+        return name.lower() in self._handlers
+
+    def names(self) -> List[str]:
+        return sorted(self._handlers)
+
+
+registry = MacroRegistry()
+
+
+# --- 编译 (切分) ---
+
+_TOKEN_RE = re.compile(r"\{\{|\}\}")
+
+
+def _split_call(body: List[Union[str, MacroCall, _Trim]], raw: str) -> Union[MacroCall, _Trim, None]:
+    """
+    把 {{ 和 }} 之间的内容拆成宏名 + 参数。
+    body 是已经切分好的片段 (里面可能有嵌套宏)；宏名只能出现在第一个纯文本片段里。
+    """
+    if not body or not isinstance(body[0], str):
+        return None
+    head = body[0]
+
+    # 注释：{{// ...}}
+    if head.startswith("//"):
+        return MacroCall("//", (), raw)
+
+    # 1. 先找宏名和参数的分隔符：优先 "::"，其次单个 ":"
+    sep_pos = head.find("::")
+    single = head.find(":")
+    if sep_pos == -1 and single == -1:
+        if len(body) > 1:
+            return None
+        name = head.strip().lower()
+        if name == "trim":
+            return TRIM
+        return MacroCall(name, (), raw)
+
+    if sep_pos != -1 and single == sep_pos:
+        name = head[:sep_pos].strip().lower()
+        rest = [head[sep_pos + 2:]] + body[1:]
+        # 2. 按 "::" 把剩余片段切成多个参数
+        args: List[List[Union[str, MacroCall, _Trim]]] = [[]]
+        for part in rest:
+            if isinstance(part, str):
+                pieces = part.split("::")
+                for i, piece in enumerate(pieces):
+                    if i > 0:
+                        args.append([])
+                    if piece:
+                        args[-1].append(piece)
+            else:
+                args[-1].append(part)
+        return MacroCall(name, tuple(tuple(a) for a in args), raw)
+
+    # 单冒号：{{roll:1d6}} / {{random:a,b}}，冒号后面整体是一个参数
+    name = head[:single].strip().lower()
+    arg = [head[single + 1:]] if head[single + 1:] else []
+    return MacroCall(name, (tuple(arg + list(body[1:])),), raw)
+
+
+@lru_cache(maxsize=8192)
+def compile_template(text: str) -> Template:
+    """
+    把模板切分成编译形式 (带缓存)。
+    同一段文本 (预设条目、历史消息) 每轮都会出现，只切分一次。
+    """
+    if not text or "{{" not in text:
+        return (text,) if text else ()
+
+    # 栈：每层是 (当前片段列表, 这一层 {{ 在原文中的起点)
+    stack: List[Tuple[List[Union[str, MacroCall, _Trim]], int]] = [([], 0)]
+    pos = 0
+    for m in _TOKEN_RE.finditer(text):
+        if m.start() > pos:
+            stack[-1][0].append(text[pos:m.start()])
+        pos = m.end()
+
+        if m.group() == "{{":
+            stack.append(([], m.start()))
+            continue
+
+        # "}}" 但没有对应的 "{{"：当普通文本
+        if len(stack) == 1:
+            stack[-1][0].append("}}")
+            continue
+
+        body, start = stack.pop()
+        raw = text[start:m.end()]
+        call = _split_call(body, raw)
+        stack[-1][0].append(call if call is not None else raw)
+
+    if pos < len(text):
+        stack[-1][0].append(text[pos:])
+
+    # 没闭合的 "{{"：从最外层那个开始，后面全部当普通文本
+    if len(stack) > 1:
+        start = stack[1][1]
+        del stack[1:]
+        stack[0][0].append(text[start:])
+
+    return _merge_literals(stack[0][0])
+
+
+def _merge_literals(parts: List[Union[str, MacroCall, _Trim]]) -> Template:
+    """相邻的纯文本合并成一段，展开时少拼接几次"""
+    merged: List[Union[str, MacroCall, _Trim]] = []
+    for part in parts:
+        if isinstance(part, str) and merged and isinstance(merged[-1], str):
+            merged[-1] += part
+        elif part != "":
+            merged.append(part)
+    return tuple(merged)
+
+
+# --- 展开 ---
+
+def render_template(template: Template, ctx: MacroContext) -> str:
+    """线性走一遍编译好的模板，拼出最终文本"""
+    out: List[str] = []
+    strip_next = False
+    for part in template:
+        if isinstance(part, str):
+            piece = part
+        elif part is TRIM:
+            # 吃掉前面已输出内容末尾的换行，并标记吃掉后面的换行
+            while out:
+                out[-1] = out[-1].rstrip("\r\n")
+                if out[-1]:
+                    break
+                out.pop()
+            strip_next = True
+            continue
+        else:
+            # 纯宏命中缓存时省掉一次函数调用
+            piece = ctx.memo.get(part.name)
+            if piece is None:
+                piece = _call(part, ctx)
+
+        if strip_next:
+            piece = piece.lstrip("\r\n")
+            if not piece:
+                continue
+            strip_next = False
+        out.append(piece)
+    return "".join(out)
+
+
+def _call(call: MacroCall, ctx: MacroContext) -> str:
+    if not call.args and call.name in registry.pure:
+        value = ctx.memo.get(call.name)
+        if value is None:
+            value = ctx.memo[call.name] = str(registry.get(call.name)(ctx, []))
+        return value
+
+    handler = registry.get(call.name)
+    if handler is None:
+        return call.raw
+    args = [render_template(a, ctx) for a in call.args]
+    result = handler(ctx, args)
+    return "" if result is None else str(result)
+
+
+@lru_cache(maxsize=8192)
+def is_stable(template: Template) -> bool:
+    """
+    变量相同时，展开结果 (和对变量的修改) 是否每轮都一样：
+    只含纯文本、{{trim}}、registry.stable 里的宏 (参数也都稳定) 和未注册的宏 (原样输出)。
+    """
+    for part in template:
+        if not isinstance(part, MacroCall):
+            continue
+        if part.name in registry and part.name not in registry.stable:
+            return False
+        if not all(is_stable(arg) for arg in part.args):
+            return False
+    return True
+
+
+def expand_macros(text: str, ctx: MacroContext) -> str:
+    """入口：编译 (命中缓存) + 展开"""
+    if not text:
+        return ""
+    if "{{" not in text:
+        return text
+    return render_template(compile_template(text), ctx)
+
+
+# --- 内置宏 (酒馆常用宏) ---
+
+@registry.register("char", "charIfNotGroup", "group", "groupNotMuted", pure=True)
+def _macro_char(ctx: MacroContext, args: List[str]) -> str:
+    return ctx.char_name
+
+
+@registry.register("user", pure=True)
+def _macro_user(ctx: MacroContext, args: List[str]) -> str:
+    return ctx.user_name
+
+
+def _card_field(name: str) -> MacroHandler:
+    def handler(ctx: MacroContext, args: List[str]) -> str:
+        return ctx.card_fields.get(name, "")
+    return handler
+
+
+registry.register("description", pure=True)(_card_field("description"))
+registry.register("personality", pure=True)(_card_field("personality"))
+registry.register("scenario", pure=True)(_card_field("scenario"))
+registry.register("persona", pure=True)(_card_field("persona"))
+registry.register("mesExamples", "mesExamplesRaw", pure=True)(_card_field("mes_example"))
+registry.register("charPrompt", pure=True)(_card_field("system_prompt"))
+registry.register("charJailbreak", "charInstruction", pure=True)(_card_field("post_history_instructions"))
+registry.register("charVersion", "char_version", pure=True)(_card_field("character_version"))
+registry.register("creatorNotes", "charCreatorNotes", pure=True)(_card_field("creator_notes"))
+
+
+@registry.register("newline", pure=True)
+def _macro_newline(ctx: MacroContext, args: List[str]) -> str:
+    return "\n"
+
+
+@registry.register("noop", "//", "original", pure=True)
+def _macro_empty(ctx: MacroContext, args: List[str]) -> str:
+    return ""
+
+
+@registry.register("banned", stable=True)
+def _macro_banned(ctx: MacroContext, args: List[str]) -> str:
+    # 酒馆里用于屏蔽词，这里只需要把它从文本里去掉
+    return ""
+
+
+@registry.register("reverse", stable=True)
+def _macro_reverse(ctx: MacroContext, args: List[str]) -> str:
+    return (args[0] if args else "")[::-1]
+
+
+@registry.register("maxPrompt", pure=True)
+def _macro_max_prompt(ctx: MacroContext, args: List[str]) -> str:
+    return str(ctx.max_prompt)
+
+
+# --- 随机 ---
+
+def _choices(args: List[str]) -> List[str]:
+    # {{random::a::b}} 是多个参数；{{random:a,b}} 是一个逗号分隔的参数
+    if len(args) == 1:
+        return [c.strip() for c in args[0].split(",")]
+    return args
+
+
+@registry.register("random")
+def _macro_random(ctx: MacroContext, args: List[str]) -> str:
+    choices = _choices(args)
+    return ctx.rng.choice(choices) if choices else ""
+
+
+@registry.register("pick", stable=True)
+def _macro_pick(ctx: MacroContext, args: List[str]) -> str:
+    # 和 random 一样，但同一个聊天里结果固定
+    choices = _choices(args)
+    if not choices:
+        return ""
+    key = (ctx.seed + "\x00" + "\x00".join(choices)).encode("utf-8")
+    return choices[zlib.crc32(key) % len(choices)]
+
+
+_DICE_RE = re.compile(r"^\s*(\d*)d(\d+)\s*([+-]\s*\d+)?\s*$", re.IGNORECASE)
+
+
+@registry.register("roll")
+def _macro_roll(ctx: MacroContext, args: List[str]) -> str:
+    formula = args[0].strip() if args else ""
+    if formula.isdigit():
+        formula = "1d" + formula
+    m = _DICE_RE.match(formula)
+    if not m:
+        return ""
+    count = int(m.group(1) or 1)
+    sides = int(m.group(2))
+    if sides <= 0:
+        return "0"
+    total = sum(ctx.rng.randint(1, sides) for _ in range(count))
+    if m.group(3):
+        total += int(m.group(3).replace(" ", ""))
+    return str(total)
+
+
+# --- 时间 ---
+
+def _format_time(now: datetime) -> str:
+    # 与酒馆的 moment().format("LT") 一致，例如 "3:07 PM"
+    return f"{now.hour % 12 or 12}:{now.minute:02d} {'PM' if now.hour >= 12 else 'AM'}"
+
+
+@registry.register("time")
+def _macro_time(ctx: MacroContext, args: List[str]) -> str:
+    return _format_time(ctx.now())
+
+
+@registry.register("date")
+def _macro_date(ctx: MacroContext, args: List[str]) -> str:
+    now = ctx.now()
+    return f"{now.strftime('%B')} {now.day}, {now.year}"
+
+
+@registry.register("weekday")
+def _macro_weekday(ctx: MacroContext, args: List[str]) -> str:
+    return ctx.now().strftime("%A")
+
+
+@registry.register("isotime")
+def _macro_isotime(ctx: MacroContext, args: List[str]) -> str:
+    return ctx.now().strftime("%H:%M")
+
+
+@registry.register("isodate")
+def _macro_isodate(ctx: MacroContext, args: List[str]) -> str:
+    return ctx.now().strftime("%Y-%m-%d")
+
+
+@registry.register("datetimeformat")
+def _macro_datetimeformat(ctx: MacroContext, args: List[str]) -> str:
+    # 只支持 strftime 风格的格式串
+    return ctx.now().strftime(args[0]) if args else ""
+
+
+def _time_utc(offset: int) -> MacroHandler:
+    def handler(ctx: MacroContext, args: List[str]) -> str:
+        # ctx.now() 默认是本地时间 (不带时区)，astimezone 按本地时区换算成 UTC
+        return _format_time(ctx.now().astimezone(timezone.utc) + timedelta(hours=offset))
+    return handler
+
+
+# {{time_UTC+8}} 这种宏名里带参数，把常见的时区都注册上
+for _offset in range(-12, 15):
+    registry.register(f"time_UTC{_offset:+d}")(_time_utc(_offset))
+
+
+# --- 聊天记录 ---
+
+def _last(ctx: MacroContext, role: Optional[str]) -> str:
+    for msg in reversed(ctx.history):
+        if role is None or msg.get("role") == role:
+            return msg.get("content", "")
+    return ""
+
+
+@registry.register("lastMessage")
+def _macro_last_message(ctx: MacroContext, args: List[str]) -> str:
+    return _last(ctx, None)
+
+
+@registry.register("lastUserMessage", "input")
+def _macro_last_user(ctx: MacroContext, args: List[str]) -> str:
+    return _last(ctx, "user")
+
+
+@registry.register("lastCharMessage")
+def _macro_last_char(ctx: MacroContext, args: List[str]) -> str:
+    return _last(ctx, "assistant")
+
+
+@registry.register("lastMessageId")
+def _macro_last_message_id(ctx: MacroContext, args: List[str]) -> str:
+    return str(max(len(ctx.history) - 1, 0))
+
+
+# --- 变量 ---
+
+def _to_number(value: Any) -> Optional[float]:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _format_number(value: float) -> Union[int, float]:
+    return int(value) if float(value).is_integer() else value
+
+
+def _var_macros(scope: str, store: Callable[[MacroContext], Dict[str, Any]]) -> None:
+    """局部 / 全局变量的一整套宏"""
+
+    @registry.register(f"set{scope}var", stable=True)
+    def _set(ctx: MacroContext, args: List[str]) -> str:
+        if args:
+            store(ctx)[args[0].strip()] = args[1] if len(args) > 1 else ""
+        return ""
+
+    @registry.register(f"get{scope}var", stable=True)
+    def _get(ctx: MacroContext, args: List[str]) -> str:
+        if not args:
+            return ""
+        value = store(ctx).get(args[0].strip(), "")
+        return "" if value is None else str(value)
+
+    @registry.register(f"add{scope}var", stable=True)
+    def _add(ctx: MacroContext, args: List[str]) -> str:
+        if not args:
+            return ""
+        name = args[0].strip()
+        value = args[1] if len(args) > 1 else ""
+        current = store(ctx).get(name, "")
+        a, b = _to_number(current if current != "" else 0), _to_number(value)
+        if a is not None and b is not None:
+            store(ctx)[name] = _format_number(a + b)
+        else:
+            store(ctx)[name] = f"{current}{value}"
+        return ""
+
+    @registry.register(f"inc{scope}var", stable=True)
+    def _inc(ctx: MacroContext, args: List[str]) -> str:
+        if not args:
+            return ""
+        name = args[0].strip()
+        value = _format_number((_to_number(store(ctx).get(name, 0)) or 0) + 1)
+        store(ctx)[name] = value
+        return str(value)
+
+    @registry.register(f"dec{scope}var", stable=True)
+    def _dec(ctx: MacroContext, args: List[str]) -> str:
+        if not args:
+            return ""
+        name = args[0].strip()
+        value = _format_number((_to_number(store(ctx).get(name, 0)) or 0) - 1)
+        store(ctx)[name] = value
+        return str(value)
+
+
+_var_macros("", lambda ctx: ctx.variables)
+_var_macros("global", lambda ctx: ctx.global_variables)
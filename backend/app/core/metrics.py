@@ -0,0 +1,226 @@
+"""
+轻量指标 + 分阶段计时
+
+不依赖 prometheus_client：计数器 / 直方图就是几个带锁的数组，/metrics 时按 Prometheus 文本格式输出。
+一次 observe 只是一次 bisect 加几个加法，常开也没什么开销。
+
+分阶段计时：
+    with metrics.stage("db_fetch"):
+        ...
+结束时记入 prisma_stage_seconds{stage="db_fetch"}；如果当前请求开着 trace (见 TimingMiddleware)，
+同时累加到这个请求的 trace 里，响应头 Server-Timing 会带上各阶段耗时。
+线程池里的代码也能记：run_in_threadpool 会带上当前的 context，trace 是同一个 dict。
+"""
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from threading import Lock
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# 默认的耗时分桶 (秒)
+TIME_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# token 数分桶
+TOKEN_BUCKETS = (256, 512, 1024, 2048, 4096, 8192, 16384, 32768, 65536, 131072)
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Counter:
+    def __init__(self, name: str, doc: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.doc = doc
+        self.labels = tuple(labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = Lock()
+
+    def inc(self, *label_values: str, amount: float = 1.0) -> None:
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = list(self._values.items())
+        for values, total in items:
+            lines.append(f"{self.name}{_format_labels(self.labels, values)} {_format_value(total)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, doc: str, labels: Sequence[str] = (), buckets: Sequence[float] = TIME_BUCKETS):
+        self.name = name
+        self.doc = doc
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        # 每组标签：[各桶计数 (非累计，最后一格是 +Inf), 总和, 总数]
+        self._series: Dict[Tuple[str, ...], list] = {}
+        self._lock = Lock()
+
+    def observe(self, value: float, *label_values: str) -> None:
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = [(values, list(counts), total, count) for values, (counts, total, count) in self._series.items()]
+        for values, counts, total, count in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                le = _format_labels(self.labels, values, f'le="{_format_value(bound)}"')
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            labels = _format_labels(self.labels, values)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List = []
+        # 抓取时才算的指标 (比如缓存统计)：返回若干行文本
+        self._collectors: List[Callable[[], Iterable[str]]] = []
+
+    def counter(self, name: str, doc: str, labels: Sequence[str] = ()) -> Counter:
+        metric = Counter(name, doc, labels)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, doc: str, labels: Sequence[str] = (), buckets: Sequence[float] = TIME_BUCKETS) -> Histogram:
+        metric = Histogram(name, doc, labels, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector: Callable[[], Iterable[str]]) -> None:
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            lines.extend(collector())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+# --- 指标定义 ---
+http_requests = registry.counter(
+    "prisma_http_requests_total", "HTTP requests", ("method", "route", "status"))
+http_duration = registry.histogram(
+    "prisma_http_request_duration_seconds", "HTTP request duration (until the body is fully sent)", ("method", "route"))
+stage_duration = registry.histogram(
+    "prisma_stage_seconds", "Time spent per request stage", ("stage",))
+assembled_tokens = registry.histogram(
+    "prisma_assembled_tokens", "Prompt tokens per assembly", ("part",), buckets=TOKEN_BUCKETS)
+upstream_ttft = registry.histogram(
+    "prisma_upstream_ttft_seconds", "Time from upstream request to first token")
+upstream_duration = registry.histogram(
+    "prisma_upstream_duration_seconds", "Time from upstream request to the last token")
+upstream_errors = registry.counter(
+    "prisma_upstream_errors_total", "Upstream failures", ("status",))
+
+
+# --- 分阶段计时 ---
+_trace: ContextVar[Optional[Dict[str, float]]] = ContextVar("prisma_trace", default=None)
+
+
+def start_trace() -> Dict[str, float]:
+    """当前请求开始记录各阶段耗时，返回 {阶段: 秒} (结束时读它)"""
+    trace: Dict[str, float] = {}
+    _trace.set(trace)
+    return trace
+
+
+def record(name: str, seconds: float) -> None:
+    stage_duration.observe(seconds, name)
+    trace = _trace.get()
+    if trace is not None:
+        trace[name] = trace.get(name, 0.0) + seconds
+
+
+class stage:
+    """with stage("world_info"): ...  计一段代码的耗时"""
+    __slots__ = ("name", "start")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self) -> "stage":
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        record(self.name, time.perf_counter() - self.start)
+
+
+def server_timing(trace: Dict[str, float]) -> str:
+    """Server-Timing 响应头：db_fetch;dur=1.23, world_info;dur=0.45 (毫秒)"""
+    return ", ".join(f"{name};dur={seconds * 1000:.2f}" for name, seconds in trace.items())
+
+
+def _route_template(scope) -> str:
+    """匹配到的路由模板；include_router 带前缀时新版 FastAPI 把完整路径放在 effective_route_context 里"""
+    context = (scope.get("fastapi") or {}).get("effective_route_context")
+    return getattr(context, "path", None) or getattr(scope.get("route"), "path", None) or "unmatched"
+
+
+class TimingMiddleware:
+    """
+    纯 ASGI 中间件 (比 BaseHTTPMiddleware 轻)：记录每个请求的耗时和状态码，
+    按路由模板 (/api/character/{char_id}) 而不是实际路径打标签，避免标签爆炸。
+    响应头带上 Server-Timing (发响应头之前已经记下的阶段)。
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        trace = start_trace()
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if trace:
+                    headers = list(message.get("headers", []))
+                    headers.append((b"server-timing", server_timing(trace).encode("latin-1")))
+                    message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            route = _route_template(scope)
+            method = scope["method"]
+            http_duration.observe(time.perf_counter() - start, method, route)
+            http_requests.inc(method, route, str(status))
@@ -0,0 +1,170 @@
+"""
+数据库结构迁移 (带版本号，启动时检查一次)
+
+版本号存在 SQLite 的 PRAGMA user_version 里。启动时 migrate() 先读这个值：
+已经是最新版本就直接返回 (一条 PRAGMA 查询)，否则按顺序执行还没执行过的步骤，
+每执行完一步就把版本号写进去。
+每一步都是幂等的 (建表 checkfirst、只改写还没迁移的行……)，
+多个 worker 同时启动、同一步跑了两遍也没关系。
+
+加新表 / 新列 / 新索引时，在 MIGRATIONS 末尾追加一步，不要改已有的步骤。
+
+手动执行并回收磁盘空间 (在 backend 目录下)：
+    python -m app.core.migrations
+"""
+import json
+from datetime import datetime
+from typing import Callable, Dict, List, Tuple
+
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Engine
+
+from app.core.blob import compress_json, decompress_json
+
+BLOB_TABLES = ("characters", "presets", "lorebooks")
+
+
+def compress_legacy_blobs(bind: Engine, batch_size: int = 200) -> Dict[str, int]:
+    """
+    旧版本把 data 存成明文 JSON (TEXT)，改写成压缩的 BLOB，返回每张表改写了多少行。
+    只处理 typeof(data) = 'text' 的行 (SQLite 判断类型只看记录头，不读内容)。
+    """
+    migrated: Dict[str, int] = {}
+    existing = set(inspect(bind).get_table_names())
+    for table in BLOB_TABLES:
+        if table not in existing:
+            continue
+        count = 0
+        while True:
+            # 每批一个事务，大库迁移时也不会长时间占着写锁
+            with bind.begin() as conn:
+                rows = conn.execute(
+                    text(f"SELECT id, data FROM {table} WHERE typeof(data) = 'text' LIMIT :n"),
+                    {"n": batch_size},
+                ).all()
+                if not rows:
+                    break
+                conn.execute(
+                    text(f"UPDATE {table} SET data = :data WHERE id = :id"),
+                    [{"id": row.id, "data": compress_json(json.loads(row.data))} for row in rows],
+                )
+                count += len(rows)
+        if count:
+            migrated[table] = count
+    return migrated
+
+
+def create_tables(bind: Engine) -> None:
+    """按 models 建表 (已存在的表跳过)"""
+    # 所有 models 都要先导入，才会注册到 Base.metadata 上
+    from app.core.database import Base
+    from app.modules.character import models as _character  # noqa: F401
+    from app.modules.chat import models as _chat  # noqa: F401
+    from app.modules.importer import models as _importer  # noqa: F401
+    from app.modules.lorebook import models as _lorebook  # noqa: F401
+    from app.modules.preset import models as _preset  # noqa: F401
+
+    Base.metadata.create_all(bind=bind)
+
+
+def create_character_search(bind: Engine) -> None:
+    """角色卡列表索引 + 全文搜索表 (FTS5 虚拟表 create_all 建不了)"""
+    from app.modules.character.search import ensure_search_schema
+
+    ensure_search_schema(bind)
+
+
+def backfill_content_hashes(bind: Engine, batch_size: int = 200) -> Dict[str, int]:
+    """
+    以前单个上传不记内容指纹，批量导入再导同样的内容会认不出来、重复创建。
+    给还没有指纹的角色卡 / 预设 / 世界书补上，返回每张表处理了多少行。
+    内容相同的多个对象只记最早的那个 (和导入时一样)。
+    """
+    from app.modules.importer.fingerprint import content_hash
+
+    filled: Dict[str, int] = {}
+    existing = set(inspect(bind).get_table_names())
+    if "content_hashes" not in existing:
+        return filled
+    for table, kind in (("characters", "character"), ("presets", "preset"), ("lorebooks", "lorebook")):
+        if table not in existing:
+            continue
+        count, last_id = 0, 0
+        while True:
+            # 按 id 分批，每批一个事务；内容重复记不进去的行也不会被反复读
+            with bind.begin() as conn:
+                rows = conn.execute(
+                    text(
+                        f"SELECT t.id, t.data FROM {table} t WHERE t.id > :last AND NOT EXISTS ("
+                        "SELECT 1 FROM content_hashes h WHERE h.kind = :kind AND h.object_id = t.id"
+                        ") ORDER BY t.id LIMIT :n"
+                    ),
+                    {"last": last_id, "kind": kind, "n": batch_size},
+                ).all()
+                if not rows:
+                    break
+                now = datetime.now()
+                conn.execute(
+                    text(
+                        "INSERT OR IGNORE INTO content_hashes (kind, content_hash, object_id, create_date) "
+                        "VALUES (:kind, :hash, :id, :now)"
+                    ),
+                    [
+                        {"kind": kind, "hash": content_hash(decompress_json(row.data)), "id": row.id, "now": now}
+                        for row in rows
+                    ],
+                )
+                count += len(rows)
+                last_id = rows[-1].id
+        filled[table] = count
+    return filled
+
+
+# (名称, 步骤)：版本号 = 已执行的步骤数
+MIGRATIONS: List[Tuple[str, Callable[[Engine], object]]] = [
+    ("create tables", create_tables),
+    ("compress legacy json blobs", compress_legacy_blobs),
+    ("character list indexes and fts", create_character_search),
+    ("chat summaries and summary jobs", create_tables),
+    ("content hashes for uploaded objects", backfill_content_hashes),
+    ("global variables", create_tables),
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def get_version(bind: Engine) -> int:
+    with bind.connect() as conn:
+        return conn.exec_driver_sql("PRAGMA user_version").scalar() or 0
+
+
+def migrate(bind: Engine) -> List[str]:
+    """把数据库升级到 SCHEMA_VERSION，返回这次执行了哪些步骤 (已是最新时为空)"""
+    version = get_version(bind)
+    applied: List[str] = []
+    for number, (name, step) in enumerate(MIGRATIONS[version:], start=version + 1):
+        step(bind)
+        with bind.begin() as conn:
+            conn.exec_driver_sql(f"PRAGMA user_version = {number}")
+        applied.append(name)
+    return applied
+
+
+def vacuum(bind: Engine) -> None:
+    """压缩后旧数据占的页不会自动还给文件系统，VACUUM 重写整个库"""
+    with bind.connect() as conn:
+        conn.execution_options(isolation_level="AUTOCOMMIT").execute(text("VACUUM"))
+
+
+if __name__ == "__main__":
+    import os
+
+    from app.core.database import engine
+
+    path = "./test.db"
+    before = os.path.getsize(path) if os.path.exists(path) else 0
+    print("applied migrations:", migrate(engine) or "none")
+    print("compressed rows:", compress_legacy_blobs(engine) or "none")
+    vacuum(engine)
+    after = os.path.getsize(path) if os.path.exists(path) else 0
+    print(f"database size: {before / 1024:.0f} KB -> {after / 1024:.0f} KB")
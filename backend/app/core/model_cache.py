@@ -0,0 +1,47 @@
+"""
+校验后的模型缓存
+
+数据库里存的是原始 JSON，每轮对话都重新 TavernCardV3(**data) / SillyTavernPreset(**data)
+太浪费了 (一个 133 KB 的预设校验一次就要好几毫秒)。
+这里按 (表名, ID) + 更新时间缓存校验好的 Pydantic 对象：
+    - 对象没变就一直命中，校验成本每个版本只付一次
+    - 写入时由 service 显式失效 (SQLite 删除后 ID 可能被复用)
+注意：缓存里的对象是共享的，拿到之后只读，不要原地修改。
+
+data 列是压缩存储 + 延迟加载的：命中缓存时根本不读这一列，没命中才从库里读出、解压、校验。
+"""
+from typing import Any, Callable, Hashable, TypeVar
+
+from fastapi.concurrency import run_in_threadpool
+
+from app.core.cache import VersionedLRUCache
+
+T = TypeVar("T")
+
+model_cache: VersionedLRUCache[Any] = VersionedLRUCache(maxsize=256)
+# GET 接口序列化好的响应 (见 http_cache.py)，同样按版本缓存
+response_cache: VersionedLRUCache[Any] = VersionedLRUCache(maxsize=128)
+
+
+def stamp_of(row: Any) -> Hashable:
+    """数据库行的版本戳：有更新时间用更新时间，没有就用创建时间"""
+    return getattr(row, "update_date", None) or row.create_date
+
+
+async def load_validated(table: str, row: Any, validate: Callable[[Any], T]) -> T:
+    """
+    取缓存里校验好的对象；validate 接收 row.data。
+    缓存没命中时才 await 读出 data (延迟加载的列)，校验放到线程池里跑。
+    """
+    key, version = (table, row.id), stamp_of(row)
+    cached = model_cache.peek(key, version)
+    if cached is not None:
+        return cached
+    raw = await row.awaitable_attrs.data
+    return await run_in_threadpool(model_cache.get_or_build, key, version, lambda: validate(raw))
+
+
+def invalidate(table: str, obj_id: Hashable) -> None:
+    """写入后调用：丢掉这个对象所有版本的缓存 (校验结果 + 序列化好的响应)"""
+    model_cache.invalidate((table, obj_id))
+    response_cache.invalidate((table, obj_id))
@@ -0,0 +1,142 @@
+"""
+预设编译器 (Preset Compiler)
+
+同一个预设在成千上万轮对话里是完全一样的，没必要每轮都重新遍历 prompt_order、
+建 prompt_map、判断启用状态。这里把 SillyTavernPreset 一次性编译成不可变的
+段列表 (CompiledPreset)，每轮拼装时只需要填充里面的动态槽位。
+injection_position = 1 (聊天内) 的条目不进段列表，单独放在 injections 里，
+拼装时按 injection_depth 插进聊天记录 (见 ContextAssembler._inject)。
+"""
+from dataclasses import dataclass
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+from app.core.cache import VersionedLRUCache
+from app.core.macro_engine import Template, compile_template
+from app.schemas.preset import SillyTavernPreset
+
+# --- 段类型 ---
+SEG_STATIC = "static"          # 纯文本，不含宏，原样输出
+SEG_MACRO = "macro"            # 预设里写死的文本，但含 {{...}}，每轮需要展开
+SEG_CARD_FIELD = "card_field"  # 引用角色卡字段 (description / personality ...)
+SEG_WORLD_INFO = "world_info"  # 世界书插槽 (before / after)
+SEG_HISTORY = "history"        # 聊天记录的分界线
+
+# 预设里的标记 ID -> 角色卡 data 上的字段名
+CARD_FIELD_MAP: Dict[str, str] = {
+    "charDescription": "description",
+    "charPersonality": "personality",
+    "scenario": "scenario",
+    "dialogueExamples": "mes_example",
+}
+
+# 世界书插槽 ID -> 插入位置
+WORLD_INFO_SLOTS: Dict[str, str] = {
+    "worldInfoBefore": "before",
+    "worldInfoAfter": "after",
+}
+
+HISTORY_MARKER = "chatHistory"
+
+# injection_position：0 = 按 prompt_order 的位置 (相对)，1 = 插在聊天记录里倒数第 injection_depth 条之前
+INJECTION_RELATIVE = 0
+INJECTION_IN_CHAT = 1
+# 酒馆的 injection_order 默认值：同一深度按它从小到大排，越大越靠近末尾
+DEFAULT_INJECTION_ORDER = 100
+
+
+@dataclass(frozen=True)
+class PromptSegment:
+    """执行计划里的一段"""
+    kind: str
+    identifier: str
+    role: str = "system"
+    # static / macro 段：预设里的文本
+    text: str = ""
+    # card_field 段：字段名；world_info 段：before / after
+    ref: str = ""
+    # macro 段：编译好的宏模板，每轮直接展开
+    template: Template = ()
+    # 聊天内注入：倒数第几条消息之前 (0 = 最后)、同一深度里的顺序
+    depth: int = 0
+    order: int = DEFAULT_INJECTION_ORDER
+
+
+@dataclass(frozen=True)
+class CompiledPreset:
+    """编译好的预设：有序、已过滤的段列表"""
+    segments: Tuple[PromptSegment, ...]
+    has_history_marker: bool
+    # 聊天内注入的条目 (static / macro 段，带 depth / order)
+    injections: Tuple[PromptSegment, ...] = ()
+
+
+def compile_preset(preset: SillyTavernPreset) -> CompiledPreset:
+    """把预设解析成段列表 (只做一次)"""
+    # 1. 获取排序列表 (默认取第一个顺序配置)
+    if preset.prompt_order:
+        order_list = [(item.identifier, item.enabled) for item in preset.prompt_order[0].order]
+    else:
+        # 如果没配置顺序，就按 prompts 列表原本的顺序
+        order_list = [(p.identifier, p.enabled) for p in preset.prompts]
+
+    # 2. 建立查询字典，方便按 ID 找内容
+    prompt_map = {p.identifier: p for p in preset.prompts}
+
+    # 3. 按顺序把每个启用的 Prompt 归类成段
+    segments = []
+    injections = []
+    for pid, enabled in order_list:
+        if not enabled:
+            continue
+        p_def = prompt_map.get(pid)
+        if p_def is None or not p_def.enabled:
+            continue
+
+        if pid == HISTORY_MARKER:
+            segments.append(PromptSegment(SEG_HISTORY, pid, p_def.role))
+        elif pid in CARD_FIELD_MAP:
+            segments.append(PromptSegment(SEG_CARD_FIELD, pid, p_def.role, ref=CARD_FIELD_MAP[pid]))
+        elif pid in WORLD_INFO_SLOTS:
+            segments.append(PromptSegment(SEG_WORLD_INFO, pid, p_def.role, ref=WORLD_INFO_SLOTS[pid]))
+        else:
+            # 其他情况（Main, Jailbreak, NSFW 等）直接使用预设里写好的内容
+            content = p_def.content
+            if not content or not content.strip():
+                continue
+            # 聊天内注入的条目单独放 (标记类条目不支持注入，按相对位置处理)
+            if p_def.injection_position == INJECTION_IN_CHAT:
+                order = getattr(p_def, "injection_order", None)
+                injections.append(text_segment(
+                    pid, p_def.role, content, depth=max(p_def.injection_depth, 0),
+                    order=DEFAULT_INJECTION_ORDER if order is None else int(order),
+                ))
+            else:
+                segments.append(text_segment(pid, p_def.role, content))
+
+    return CompiledPreset(
+        segments=tuple(segments),
+        has_history_marker=any(s.kind == SEG_HISTORY for s in segments),
+        injections=tuple(injections),
+    )
+
+
+def text_segment(identifier: str, role: str, content: str, **kwargs: Any) -> PromptSegment:
+    """预设 / 角色卡里写死的文本：含宏就预先编译成模板"""
+    if "{{" in content:
+        return PromptSegment(SEG_MACRO, identifier, role, text=content, template=compile_template(content), **kwargs)
+    return PromptSegment(SEG_STATIC, identifier, role, text=content, **kwargs)
+
+
+# 全局共享的计划缓存：按 (preset_id, version) 缓存编译结果，LRU 淘汰
+preset_plan_cache: VersionedLRUCache[CompiledPreset] = VersionedLRUCache(maxsize=64)
+
+
+def get_preset_plan(
+    preset: SillyTavernPreset,
+    preset_id: Optional[Hashable] = None,
+    version: Any = None,
+) -> CompiledPreset:
+    """有 ID 就走缓存；临时预设 (没有 ID) 直接编译"""
+    if preset_id is None:
+        return compile_preset(preset)
+    return preset_plan_cache.get_or_build(preset_id, version, lambda: compile_preset(preset))
@@ -1,5 +1,22 @@
-import re
-from typing import List, Dict, Any, Optional
+import time
+from typing import List, Dict, Any, Hashable, Optional, Tuple
+from app.core import config, metrics, semantic_memory
+from app.core.macro_engine import MacroContext, compile_template, expand_macros, is_stable, render_template
+from app.core.regex_scripts import PLACEMENT_WORLD_INFO, get_regex_scripts
+from app.core.prompt_prefix import SystemPrefix, changed, content_hash, digest, prefix_cache, variables_text
+from app.core.preset_compiler import (
+    PromptSegment,
+    SEG_CARD_FIELD,
+    SEG_HISTORY,
+    SEG_MACRO,
+    SEG_STATIC,
+    SEG_WORLD_INFO,
+    get_preset_plan,
+    text_segment,
+)
+from app.core.token_budget import TokenBudget, fit_suffix
+from app.core.tokenizer import Tokenizer, count_message, get_tokenizer
+from app.core.world_info import AFTER_POSITIONS, WorldInfoIndex, get_world_info_index, world_info_states
 from app.schemas.character import TavernCardV3
 from app.schemas.preset import SillyTavernPreset
 from app.schemas.lorebook import LorebookV3
@@ -11,102 +28,409 @@ class ContextAssembler:
         preset: SillyTavernPreset, 
         history: List[Dict[str, str]], 
         user_name: str = "User",
-        lorebook: Optional[LorebookV3] = None
+        lorebook: Optional[LorebookV3] = None,
+        preset_id: Optional[Hashable] = None,
+        preset_version: Any = None,
+        lorebook_id: Optional[Hashable] = None,
+        lorebook_version: Any = None,
+        card_id: Optional[Hashable] = None,
+        card_version: Any = None,
+        chat_id: Optional[Hashable] = None,
+        variables: Optional[Dict[str, Any]] = None,
+        global_variables: Optional[Dict[str, Any]] = None,
+        tokenizer: Optional[Tokenizer] = None,
+        memories: Optional[List[Dict[str, Any]]] = None,
+        recall_budget: Optional[int] = None,
+        summary: Optional[Dict[str, Any]] = None,
+        world_info_index: Optional[WorldInfoIndex] = None
     ):
+        # 历史总结 {"content", "up_to_id"}：代替 id <= up_to_id 的消息 (调用方取窗口时一般已经跳过了)
+        self.summary = summary if summary and summary.get("content") else None
+        if self.summary is not None and self.summary.get("up_to_id") is not None:
+            up_to = self.summary["up_to_id"]
+            if history and history[0].get("id") is not None and history[0]["id"] <= up_to:
+                history = [msg for msg in history if msg.get("id") is None or msg["id"] > up_to]
+
         self.card = card
         self.preset = preset
         self.history = history
         self.user_name = user_name
         self.lorebook = lorebook
+
+        # 预设的执行计划 (按 ID + 版本缓存，同一个预设只编译一次)
+        self.plan = get_preset_plan(preset, preset_id, preset_version)
+        # 聊天内注入：预设里 injection_position = 1 的条目 + 角色卡的 depth_prompt
+        self.injections = self.plan.injections + self._depth_prompt(card)
+        # 稳定前缀的缓存键 (见 prompt_prefix)；没有 ID 的临时预设 / 角色卡不缓存
+        self._prefix_key = (preset_id, card_id, user_name) if preset_id is not None and card_id is not None else None
+        self._prefix_version = (preset_version, card_version)
+        self.prefix: Optional[SystemPrefix] = None
+
+        # 世界书索引 (同样按 ID + 版本缓存)，扫描结果在第一次用到时才算
+        # 调用方可以直接传入取好的索引 (比如 mmap 的编译文件，见 world_info_artifact)，这时不需要 lorebook
+        self.world_info_index = world_info_index or (
+            get_world_info_index(lorebook, lorebook_id, lorebook_version) if lorebook else None
+        )
+        self._world_info: Optional[Dict[str, str]] = None
+        # 本轮宏展开的累计耗时 (见 metrics)
+        self._macro_seconds = 0.0
+
+        # 语义召回：召回的词条 / 旧消息 (memories，由调用方从库里取好) 在 recall_budget 内放进世界书插槽
+        if recall_budget is None:
+            recall_budget = config.VECTOR_BUDGET_TOKENS if config.VECTOR_ENABLED else 0
+        self.recall_budget = recall_budget
+        self.memories = memories or []
+        self.lorebook_vectors = (
+            semantic_memory.get_lorebook_store(self.world_info_index, lorebook_id, lorebook_version)
+            if self.world_info_index is not None and recall_budget > 0 else None
+        )
+
+        # 角色卡的正则脚本 (按卡片 ID + 版本缓存，只编译一次)
+        self.regex_scripts = get_regex_scripts(card, card_id, card_version)
+        # 有聊天 ID 时世界书走增量扫描 (只扫新消息)
+        self.chat_id = chat_id
+
+        # Token 预算：上下文总长减去给回复预留的部分
+        self.tokenizer = tokenizer or get_tokenizer()
+        self.budget = TokenBudget(
+            max_context=preset.openai_max_context,
+            reserved_for_response=preset.openai_max_tokens,
+            available=max(preset.openai_max_context - preset.openai_max_tokens, 0),
+            tokenizer=self.tokenizer.name,
+        )
         
         # 提取角色名 (优先用 data.name)
         self.char_name = card.data.name or card.name or "Assistant"
 
+        # 宏上下文：整轮拼装共用，{{setvar}} 写入的变量对后面的段可见
+        # variables / global_variables 由调用方传入时会被原地修改，方便拼完写回
+        data = card.data
+        self.macro_ctx = MacroContext(
+            char_name=self.char_name,
+            user_name=user_name,
+            card_fields={
+                "description": data.description,
+                "personality": data.personality,
+                "scenario": data.scenario,
+                "mes_example": data.mes_example,
+                "system_prompt": data.system_prompt,
+                "post_history_instructions": data.post_history_instructions,
+                "character_version": data.character_version,
+                "creator_notes": data.creator_notes,
+            },
+            history=history,
+            variables=variables if variables is not None else {},
+            global_variables=global_variables if global_variables is not None else {},
+            seed=self.char_name,
+            max_prompt=preset.openai_max_context,
+        )
+
+    @staticmethod
+    def _depth_prompt(card: TavernCardV3) -> Tuple[PromptSegment, ...]:
+        """角色卡的 depth_prompt: {"prompt": ..., "depth": 4, "role": "system"}"""
+        depth_prompt = card.data.extensions.depth_prompt or {}
+        prompt = depth_prompt.get("prompt") or ""
+        if not isinstance(prompt, str) or not prompt.strip():
+            return ()
+        try:
+            depth = max(int(depth_prompt.get("depth", 4)), 0)
+        except (TypeError, ValueError):
+            depth = 4
+        role = depth_prompt.get("role") or "system"
+        return (text_segment("depth_prompt", role, prompt, depth=depth),)
+
     def _replace_macros(self, text: str) -> str:
-        """宏替换：把 {{char}} 变成角色名"""
-        if not text:
+        """宏替换：{{char}} / {{user}} / {{getvar}} 等 (见 macro_engine)"""
+        return expand_macros(text, self.macro_ctx)
+
+    def _render_segment(self, seg: PromptSegment) -> str:
+        """填充一个段的动态内容"""
+        # 1. 纯文本：编译时已经确定，直接用
+        if seg.kind == SEG_STATIC:
+            return seg.text
+
+        # 世界书先扫描 (单独计时，不算在宏展开里)
+        text = self._get_world_info().get(seg.ref, "") if seg.kind == SEG_WORLD_INFO else None
+
+        # 宏展开的耗时累加起来，拼装结束时记一次 (每段都记一次开销太大)
+        start = time.perf_counter()
+        try:
+            # 2. 预设文本里有宏，需要每轮展开
+            if seg.kind == SEG_MACRO:
+                return render_template(seg.template, self.macro_ctx)
+
+            # 3. 角色卡字段 (描述 / 性格 / 场景 / 对话示例)
+            if seg.kind == SEG_CARD_FIELD:
+                return self._replace_macros(getattr(self.card.data, seg.ref, "") or "")
+
+            # 4. 世界书：扫描最近的聊天记录，按位置拼入激活的词条
+            if text is not None:
+                return self._replace_macros(text)
             return ""
-        # 简单替换，以后可以加更多
-        text = text.replace("{{char}}", self.char_name)
-        text = text.replace("{{user}}", self.user_name)
-        return text
-    def _get_prompt_content(self, identifier: str, preset_content: str) -> str:
-        """根据 ID 决定是用预设里的词，还是去角色卡里找"""
-        
-        # 1. 角色描述
-        if identifier == "charDescription":
-            return self.card.data.description
-            
-        # 2. 角色性格
-        elif identifier == "charPersonality":
-            return self.card.data.personality
-            
-        # 3. 场景设定
-        elif identifier == "scenario":
-            return self.card.data.scenario
-            
-        # 4. 对话示例
-        elif identifier == "dialogueExamples":
-            return self.card.data.mes_example
-            
-        # 5. 世界书 (简化版：暂时只拼在一起)
-        elif identifier in ["worldInfoBefore", "worldInfoAfter"]:
-            # 这里以后可以接真正的世界书扫描逻辑
-            return "" 
-            
-        # 6. 其他情况（Main, Jailbreak, NSFW 等）
-        # 直接使用预设里写好的内容
-        return preset_content
-    def assemble(self) -> List[Dict[str, str]]:
-        """主入口：生成最终的消息列表"""
-        final_messages = []
-        
-        # --- A. 处理系统指令 (System Prompts) ---
-        # 1. 获取排序列表 (默认取第一个顺序配置)
-        if self.preset.prompt_order:
-            order_list = self.preset.prompt_order[0].order
-        else:
-            # 如果没配置顺序，就按 prompts 列表原本的顺序
-            order_list = [{"identifier": p.identifier, "enabled": p.enabled} for p in self.preset.prompts]
-
-        # 2. 建立查询字典，方便按 ID 找内容
-        prompt_map = {p.identifier: p for p in self.preset.prompts}
-
-        # 3. 按顺序组装
-        for item in order_list:
-            # 如果禁用了就不拼
-            if not item.enabled: # 注意：Pydantic 模型里访问属性用 . 而不是 ['']
-                continue
-                
-            pid = item.identifier
-            if pid not in prompt_map:
-                continue
-                
-            p_def = prompt_map[pid]
-            if not p_def.enabled:
-                continue
+        finally:
+            self._macro_seconds += time.perf_counter() - start
+
+    def _get_world_info(self) -> Dict[str, str]:
+        """扫描一次世界书，before / after 两个插槽共用结果"""
+        if self._world_info is None:
+            active: List[int] = []
+            if self.world_info_index is None:
+                self._world_info = {}
+            else:
+                with metrics.stage("world_info"):
+                    if self.chat_id is not None:
+                        state = world_info_states.get(self.chat_id, self.world_info_index)
+                        active = state.update(self.history)
+                    else:
+                        active = self.world_info_index.scan(self.history)
+                    self._world_info = self.world_info_index.render(active)
+
+            # 语义召回的词条 / 旧消息接在关键词激活的词条后面
+            if self.recall_budget > 0:
+                with metrics.stage("recall"):
+                    recalled = self._recall(active)
+                for slot, text in recalled.items():
+                    current = self._world_info.get(slot, "")
+                    self._world_info[slot] = f"{current}\n{text}" if current else text
+
+            # 世界书内容也要过 promptOnly 的正则脚本
+            if self.regex_scripts:
+                self._world_info = {
+                    slot: self.regex_scripts.apply(text, PLACEMENT_WORLD_INFO, prompt=True,
+                                                   macros=self._replace_macros)
+                    for slot, text in self._world_info.items()
+                }
+        return self._world_info
+
+    def _recall(self, active: List[int]) -> Dict[str, str]:
+        """
+        向量召回：没被关键词激活的相关词条 + 历史窗口之外的相关旧消息。
+        两类放在一起按相似度排，在 recall_budget 内贪心选；
+        词条按插入顺序放进它自己的位置，旧消息按时间顺序放在 after 插槽。
+        """
+        if self.recall_budget <= 0:
+            return {}
 
-            # 特殊处理：Chat History 不在这里拼，它是分界线
-            if pid == "chatHistory":
+        # 1. 候选：(相似度, (类别, 排序键, 插槽), 文本)
+        candidates = []
+        if self.lorebook_vectors is not None:
+            index = self.world_info_index
+            queries = semantic_memory.query_vectors(self.history)
+            for i, score in semantic_memory.recall_entries(index, self.lorebook_vectors, queries, active):
+                entry = index.entries[i]
+                if entry.content and entry.content.strip():
+                    slot = "after" if entry.position in AFTER_POSITIONS else "before"
+                    candidates.append((score, (0, i, slot), entry.content))
+        for memory in self.memories:
+            name = self.char_name if memory["role"] == "assistant" else self.user_name
+            candidates.append((memory["score"], (1, memory["id"], "after"), f"{name}: {memory['content']}"))
+
+        # 2. 按预算挑选，再按位置 / 原顺序排好
+        picked, used = semantic_memory.pack(candidates, self.recall_budget, self.tokenizer)
+        self.budget.recall_tokens = used
+        self.budget.recalled = len(picked)
+        slots: Dict[str, List[str]] = {}
+        for _, (_, _, slot), text in sorted(picked, key=lambda item: item[1]):
+            slots.setdefault(slot, []).append(text)
+        return {slot: "\n".join(texts) for slot, texts in slots.items()}
+
+    def _segment_is_stable(self, seg: PromptSegment) -> bool:
+        """这一段的内容是否每轮都一样 (世界书插槽按当前内容判断，内容本身进版本号)"""
+        if seg.kind == SEG_STATIC:
+            return True
+        if seg.kind == SEG_MACRO:
+            return is_stable(seg.template)
+        if seg.kind == SEG_CARD_FIELD:
+            return is_stable(compile_template(getattr(self.card.data, seg.ref, "") or ""))
+        if seg.kind == SEG_WORLD_INFO:
+            return is_stable(compile_template(self._get_world_info().get(seg.ref, "")))
+        return False
+
+    def _render_segments(self, segments) -> Tuple[List[Dict[str, str]], Optional[int]]:
+        """逐段填充，返回 (非空的系统消息, 聊天记录插入的位置；没遇到 chatHistory 时为 None)"""
+        messages: List[Dict[str, str]] = []
+        history_at = None
+        for seg in segments:
+            # Chat History 是分界线：记下位置，预算算完再插入
+            if seg.kind == SEG_HISTORY:
+                history_at = len(messages)
                 continue
 
-            # 获取真实内容
-            raw_content = self._get_prompt_content(pid, p_def.content)
-            
-            # 如果内容不为空，就处理宏并加入
-            if raw_content and raw_content.strip():
-                final_content = self._replace_macros(raw_content)
-                final_messages.append({
-                    "role": p_def.role, # 通常是 "system"
-                    "content": final_content
+            content = self._render_segment(seg)
+            # 如果内容不为空，就加入
+            if content and content.strip():
+                messages.append({
+                    "role": seg.role, # 通常是 "system"
+                    "content": content
                 })
+        return messages, history_at
+
+    def _build_prefix(self, end: int) -> SystemPrefix:
+        ctx = self.macro_ctx
+        variables, global_variables = dict(ctx.variables), dict(ctx.global_variables)
+        messages, _ = self._render_segments(self.plan.segments[:end])
+        with metrics.stage("token_count"):
+            tokens = sum(count_message(self.tokenizer, m["content"]) for m in messages)
+        return SystemPrefix(
+            tuple(messages), end, tokens, content_hash(messages),
+            variables=changed(variables, ctx.variables),
+            global_variables=changed(global_variables, ctx.global_variables),
+        )
+
+    def _get_prefix(self) -> SystemPrefix:
+        """
+        计划开头连续的稳定段 (到第一个会变的段 / chatHistory 为止) 拼成的前缀，
+        按 (预设, 角色卡, 用户名) + 版本缓存；前缀里的世界书插槽按内容摘要区分版本。
+        """
+        # 1. 找前缀的终点，顺便收集其中世界书插槽的内容
+        segments = self.plan.segments
+        end = len(segments)
+        world_info: List[str] = []
+        for i, seg in enumerate(segments):
+            if not self._segment_is_stable(seg):
+                end = i
+                break
+            if seg.kind == SEG_WORLD_INFO:
+                world_info.append(self._get_world_info().get(seg.ref, ""))
+
+        # 2. 查缓存 (临时预设 / 角色卡直接拼)；开始时的变量也算版本的一部分
+        if self._prefix_key is None:
+            return self._build_prefix(end)
+        ctx = self.macro_ctx
+        world_info.append(variables_text(ctx.variables, ctx.global_variables))
+        version = (*self._prefix_version, self.tokenizer.name, end, digest(world_info))
+        prefix = prefix_cache.get_or_build(self._prefix_key, version, lambda: self._build_prefix(end))
+
+        # 3. 命中时把前缀对变量的修改写回 (刚拼出来的话这一步什么也不变)
+        ctx.variables.update(prefix.variables)
+        ctx.global_variables.update(prefix.global_variables)
+        return prefix
+
+    def _render_history(self, messages: List[Dict[str, str]], start: int = 0) -> List[Dict[str, str]]:
+        """把历史记录加进去：messages 是 self.history[start:]，先过 promptOnly 的正则脚本，再展开宏"""
+        if self.regex_scripts:
+            messages = self.regex_scripts.apply_history(
+                messages, total=len(self.history), start=start, prompt=True, macros=self._replace_macros
+            )
+        start = time.perf_counter()
+        rendered = [
+            {"role": msg["role"], "content": self._replace_macros(msg["content"])}
+            for msg in messages
+        ]
+        self._macro_seconds += time.perf_counter() - start
+        return rendered
+
+    def _render_injections(self) -> Dict[int, List[Dict[str, str]]]:
+        """
+        展开聊天内注入，按深度分组 {深度: [消息]}。
+        同一深度按 order 从小到大 (一样时按定义顺序)，相邻同角色的合并成一条 (和酒馆一致)。
+        """
+        groups: Dict[int, List[Dict[str, str]]] = {}
+        for seg in sorted(self.injections, key=lambda s: (s.depth, s.order)):
+            content = self._render_segment(seg)
+            if not content or not content.strip():
+                continue
+            messages = groups.setdefault(seg.depth, [])
+            if messages and messages[-1]["role"] == seg.role:
+                messages[-1]["content"] += "\n" + content
+            else:
+                messages.append({"role": seg.role, "content": content})
+        return groups
+
+    @staticmethod
+    def _inject(history: List[Dict[str, str]], groups: Dict[int, List[Dict[str, str]]]) -> List[Dict[str, str]]:
+        """
+        一遍拼出带注入的聊天记录 (不在长列表里反复 insert)：深度 d 的注入放在倒数第 d 条消息之前，0 = 最后。
+        深度从末尾数，裁剪只丢最旧的消息，所以注入和最近消息的相对位置不受裁剪影响；
+        深度超过保留下来的条数时放在保留部分的最前面 (深的在前)。注入本身不会被裁掉，token 预先扣掉了。
+        """
+        if not groups:
+            return history
+        n = len(history)
+        depths = sorted(groups, reverse=True)
+        # 从深到浅 (位置从前到后)，两次注入之间的消息整段切片复制；够不着的深度都落在最前面
+        # 第一次注入之前通常是最长的一段，直接切片当作结果列表，少复制一遍
+        out = history[:max(n - depths[0], 0)]
+        copied = len(out)
+        for depth in depths:
+            at = max(n - depth, 0)
+            out.extend(history[copied:at])
+            out.extend(groups[depth])
+            copied = at
+        out.extend(history[copied:])
+        return out
+
+    def _fit_history(self, remaining: int) -> List[Dict[str, str]]:
+        """在剩余额度内保留尽可能多的最近消息"""
+        tokenizer = self.tokenizer
+
+        # 1. 按原文计数 (按文本缓存)，前缀和 + 二分找出最长的后缀
+        counts = [count_message(tokenizer, msg["content"]) for msg in self.history]
+        start = fit_suffix(counts, remaining)
+
+        # 2. 只展开保留下来的消息
+        kept = self._render_history(self.history[start:], start)
+
+        # 3. 正则脚本 / 宏展开后长度会变，复核一遍；超出就从最旧的开始再丢
+        kept_counts = [count_message(tokenizer, msg["content"]) for msg in kept]
+        total = sum(kept_counts)
+        drop = 0
+        while total > remaining and drop < len(kept):
+            total -= kept_counts[drop]
+            drop += 1
+
+        self.budget.history_tokens = total
+        self.budget.history_kept = len(kept) - drop
+        self.budget.history_dropped = len(self.history) - self.budget.history_kept
+        return kept[drop:]
+
+    def _render_summary(self) -> List[Dict[str, str]]:
+        """历史总结按 SUMMARY_TEMPLATE 包成一条系统消息 (总结是模型写的，不展开宏)"""
+        if self.summary is None:
+            return []
+        return [{"role": "system", "content": config.SUMMARY_TEMPLATE.replace("{{summary}}", self.summary["content"])}]
+
+    def assemble(self) -> List[Dict[str, str]]:
+        """主入口：生成最终的消息列表"""
+        self._macro_seconds = 0.0
+
+        # --- A. 开头每轮不变的系统段直接用缓存的前缀 (复制一份，调用方改了也不影响缓存) ---
+        prefix = self.prefix = self._get_prefix()
+        system_messages = [dict(m) for m in prefix.messages]
+
+        # --- B. 剩下的段按编译好的计划逐段填充 ---
+        rest, history_at = self._render_segments(self.plan.segments[prefix.segments:])
+        system_messages.extend(rest)
+        # 历史记录插入的位置 (预设里没有 chatHistory 标记时放在最后)
+        history_at = len(system_messages) if history_at is None else history_at + len(prefix.messages)
+
+        # 聊天内注入、历史总结也先展开，和系统段一样优先占预算
+        injections = self._render_injections()
+        summary_messages = self._render_summary()
+
+        # --- C. Token 预算：系统段优先，剩下的额度留给聊天记录 ---
+        with metrics.stage("token_count"):
+            system_tokens = prefix.tokens + sum(count_message(self.tokenizer, m["content"]) for m in rest)
+            injection_tokens = sum(
+                count_message(self.tokenizer, m["content"]) for group in injections.values() for m in group
+            )
+            summary_tokens = sum(count_message(self.tokenizer, m["content"]) for m in summary_messages)
+            system_tokens += injection_tokens + summary_tokens
+        with metrics.stage("history"):
+            # 总结代替的是最早的那部分历史，放在聊天记录最前面
+            history_messages = summary_messages + self._inject(
+                self._fit_history(self.budget.available - system_tokens), injections
+            )
+        metrics.record("macros", self._macro_seconds)
 
-        # --- B. 处理聊天记录 (Chat History) ---
-        # 把前端传来的历史记录加进去
-        for msg in self.history:
-            final_messages.append({
-                "role": msg["role"],
-                "content": self._replace_macros(msg["content"])
-            })
+        self.budget.system_tokens = system_tokens
+        self.budget.injection_tokens = injection_tokens
+        self.budget.injected = sum(len(group) for group in injections.values())
+        self.budget.summary_tokens = summary_tokens
+        self.budget.summary_up_to = (self.summary.get("up_to_id") or 0) if self.summary else 0
+        self.budget.prefix_messages = len(prefix.messages)
+        self.budget.prefix_tokens = prefix.tokens
+        self.budget.prefix_hash = prefix.hash
+        self.budget.total_tokens = system_tokens + self.budget.history_tokens
 
-        return final_messages
\ No newline at end of file
+        return system_messages[:history_at] + history_messages + system_messages[history_at:]
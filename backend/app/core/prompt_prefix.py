@@ -0,0 +1,67 @@
+"""
+稳定的系统前缀
+
+同一个 (预设, 角色卡, 用户名) 下，计划开头那几段系统消息每轮都一模一样，变的只是后面的聊天记录。
+这一段 (到第一个会变的段或者 chatHistory 标记为止) 连同 token 数、内容哈希一起缓存：
+    - 命中时跳过这几段的宏展开和 token 计数
+    - 内容哈希和进程无关，可以交给上游做 prompt cache 的键 / 断点 (见 llm.apply_prompt_cache)
+
+哪些段算稳定：纯文本；只含稳定宏的预设文本 / 角色卡字段 (见 macro_engine.is_stable)；
+世界书插槽的内容随扫描结果变，把内容的摘要放进版本号，激活的词条不变就一直命中。
+{{getvar}} / {{setvar}} 这类宏的结果取决于变量：拼装开始时的变量也进版本号，
+前缀里对变量的修改记下来，命中时照样写回，后面的段看到的变量和没缓存时一样。
+"""
+import hashlib
+import json
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, Sequence, Tuple
+
+from app.core.cache import VersionedLRUCache
+
+
+@dataclass(frozen=True)
+class SystemPrefix:
+    """拼装结果开头那几条每轮不变的系统消息"""
+    messages: Tuple[Dict[str, str], ...]
+    # 覆盖了计划里的前几段 (后面的段照常每轮填充)
+    segments: int
+    tokens: int
+    # 内容的 sha256 (十六进制)
+    hash: str
+    # 展开前缀时改过的变量 {名字: 改完的值}
+    variables: Dict[str, Any] = field(default_factory=dict)
+    global_variables: Dict[str, Any] = field(default_factory=dict)
+
+
+def content_hash(messages: Sequence[Dict[str, str]]) -> str:
+    """按 (role, content) 逐条算哈希，和字典顺序 / 进程无关"""
+    h = hashlib.sha256()
+    for msg in messages:
+        h.update(msg["role"].encode("utf-8"))
+        h.update(b"\x00")
+        h.update(msg["content"].encode("utf-8"))
+        h.update(b"\x1e")
+    return h.hexdigest()
+
+
+def digest(texts: Iterable[str]) -> bytes:
+    """一组文本的短摘要 (当版本号用，不用把整段世界书留在缓存键里)"""
+    h = hashlib.blake2b(digest_size=16)
+    for text in texts:
+        h.update(text.encode("utf-8"))
+        h.update(b"\x1e")
+    return h.digest()
+
+
+def changed(before: Dict[str, Any], after: Dict[str, Any]) -> Dict[str, Any]:
+    """after 里新增或改过的变量"""
+    return {k: v for k, v in after.items() if k not in before or before[k] != v}
+
+
+def variables_text(*stores: Dict[str, Any]) -> str:
+    """变量的规范文本 (键排序)，用来算版本摘要"""
+    return json.dumps(stores, sort_keys=True, ensure_ascii=False, default=str)
+
+
+# 按 ((preset_id, card_id, user_name), (预设版本, 角色卡版本, 分词器, 段数, 世界书 + 变量摘要)) 缓存
+prefix_cache: VersionedLRUCache[SystemPrefix] = VersionedLRUCache(maxsize=256)
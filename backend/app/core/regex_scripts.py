@@ -0,0 +1,377 @@
+"""
+角色卡正则脚本 (extensions.regex_scripts)
+
+和酒馆的行为保持一致：
+    findRegex     "/pattern/flags" 或不带斜杠的纯 pattern (没有 flags)
+    replaceString {{match}} = 整个匹配，$1 / $<name> = 分组 (分组内容会先去掉 trimStrings)，再展开宏
+    placement     作用在哪类文本上：1 用户输入 / 2 AI 输出 / 5 世界书 / 6 推理过程
+    promptOnly    只改发给模型的 Prompt，不改保存的消息
+    markdownOnly  只改前端显示 (后端不处理)
+    都不勾        保存消息时就改写
+    minDepth / maxDepth  只作用于一定深度的消息 (0 = 最新一条)
+
+脚本是用户写的，一条糟糕的正则 (比如 (a|aa)+$) 能让一个 worker 卡死。所以：
+    1. 每个卡片版本只解析 / 编译一次 (按 ID + 版本缓存)
+    2. 用第三方 regex 模块执行，每个脚本每次调用都有超时 (REGEX_SCRIPT_TIMEOUT_MS)；
+       同一脚本超时次数达到 REGEX_SCRIPT_MAX_STRIKES 就隔离，不再执行
+    3. 上传时先用构造的「最坏输入」试跑一遍，会灾难性回溯的脚本直接隔离：
+       在卡片数据里标记 disabled + quarantined (原因)，前端能看到
+"""
+import logging
+import re
+from dataclasses import dataclass, field
+from functools import lru_cache
+from threading import Lock
+from typing import Any, Callable, Dict, FrozenSet, Hashable, Iterable, List, Optional, Tuple
+
+from app.core import config
+from app.core.cache import VersionedLRUCache
+from app.schemas.character import TavernCardV3
+
+@lru_cache(maxsize=None)
+def _load_engine() -> Tuple[Any, bool]:
+    """(正则模块, 是否支持超时)；regex 第一次编译脚本时才导入，不拖慢启动"""
+    try:
+        import regex
+    except ImportError:  # 没装 regex 时退回标准库：没有超时，只能靠上传时的检查
+        return re, False
+    return regex, True
+
+logger = logging.getLogger(__name__)
+
+# --- placement (和酒馆的 regex_placement 一致) ---
+PLACEMENT_USER_INPUT = 1
+PLACEMENT_AI_OUTPUT = 2
+PLACEMENT_SLASH_COMMAND = 3
+PLACEMENT_WORLD_INFO = 5
+PLACEMENT_REASONING = 6
+
+ROLE_PLACEMENT = {"user": PLACEMENT_USER_INPUT, "assistant": PLACEMENT_AI_OUTPUT}
+
+# JS 的 \s 包含这些 Unicode 空白；其余 \w \d \b 只认 ASCII (用 ASCII 标志)
+_JS_SPACE = r"\t\n\v\f\r \u00a0\u1680\u2000-\u200a\u2028\u2029\u202f\u205f\u3000\ufeff"
+_JS_FLAGS = frozenset("dgimsuy")
+_GROUP_REF = re.compile(r"\$(\d+)|\$<([^>]+)>")
+_MATCH_MACRO = re.compile(r"\{\{match\}\}", re.IGNORECASE)
+
+
+class RegexScriptError(ValueError):
+    pass
+
+
+# --- 1. 解析 ---
+
+def split_regex(find: str) -> Tuple[str, str]:
+    """"/pattern/flags" -> (pattern, flags)；不是这个格式就整个当 pattern"""
+    if len(find) >= 2 and find.startswith("/"):
+        end = find.rfind("/")
+        flags = find[end + 1:]
+        if end > 0 and set(flags) <= _JS_FLAGS and len(set(flags)) == len(flags):
+            return find[1:end], flags
+    return find, ""
+
+
+def _translate(pattern: str) -> str:
+    """JS 正则语法 -> Python：\\k<name>、[^] / []、Unicode 的 \\s"""
+    out: List[str] = []
+    in_class = False
+    i = 0
+    while i < len(pattern):
+        ch = pattern[i]
+        if ch == "\\" and i + 1 < len(pattern):
+            nxt = pattern[i + 1]
+            if nxt == "k" and pattern.startswith("<", i + 2):
+                end = pattern.find(">", i + 3)
+                if end > 0:
+                    out.append(f"(?P={pattern[i + 3:end]})")
+                    i = end + 1
+                    continue
+            if nxt == "s":
+                out.append(_JS_SPACE if in_class else f"[{_JS_SPACE}]")
+            elif nxt == "S" and not in_class:
+                out.append(f"[^{_JS_SPACE}]")
+            else:
+                out.append(pattern[i:i + 2])
+            i += 2
+            continue
+        if not in_class and pattern.startswith("[^]", i):
+            out.append(r"[\s\S]")
+            i += 3
+            continue
+        if ch == "[" and not in_class:
+            # JS 的 [] 是空集合 (什么都不匹配)，Python 会把 ] 当成字面量
+            if pattern.startswith("[]", i):
+                out.append("(?!)")
+                i += 2
+                continue
+            in_class = True
+        if ch == "]" and in_class:
+            in_class = False
+        out.append(ch)
+        i += 1
+    return "".join(out)
+
+
+def compile_pattern(find: str) -> Tuple[Any, int]:
+    """返回 (编译好的正则, 替换次数)：带 g 全部替换 (0)，否则只替换第一个 (1)"""
+    source, flags = split_regex(find)
+    if not source:
+        raise RegexScriptError("Empty pattern")
+    engine, _ = _load_engine()
+    re_flags = engine.ASCII
+    if "i" in flags:
+        re_flags |= engine.IGNORECASE
+    if "m" in flags:
+        re_flags |= engine.MULTILINE
+    if "s" in flags:
+        re_flags |= engine.DOTALL
+    try:
+        compiled = engine.compile(_translate(source), re_flags)
+    except Exception as e:
+        raise RegexScriptError(f"Invalid pattern: {e}")
+    return compiled, 0 if "g" in flags else 1
+
+
+def _parse_replacement(replace: str) -> Tuple[Any, ...]:
+    """替换模板拆成 (字面量 | 分组号 | 分组名) 的序列，每次匹配时不用再解析"""
+    replace = _MATCH_MACRO.sub("$0", replace or "")
+    parts: List[Any] = []
+    pos = 0
+    for m in _GROUP_REF.finditer(replace):
+        if m.start() > pos:
+            parts.append(replace[pos:m.start()])
+        parts.append(int(m.group(1)) if m.group(1) is not None else ("name", m.group(2)))
+        pos = m.end()
+    if pos < len(replace):
+        parts.append(replace[pos:])
+    return tuple(parts)
+
+
+def _int_or_none(value: Any) -> Optional[int]:
+    try:
+        return None if value is None or value == "" else int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+# --- 2. 编译后的脚本 ---
+
+@dataclass(frozen=True)
+class CompiledScript:
+    # 在卡片 regex_scripts 里的下标：脚本名经常重复 ("New Script" / 空)，隔离状态按下标记
+    index: int
+    name: str
+    pattern: Any
+    count: int
+    replacement: Tuple[Any, ...]
+    has_macros: bool
+    trim: Tuple[str, ...]
+    placement: FrozenSet[int]
+    prompt_only: bool
+    markdown_only: bool
+    min_depth: Optional[int]
+    max_depth: Optional[int]
+
+    def applies(self, placement: int, prompt: bool, depth: Optional[int]) -> bool:
+        if placement not in self.placement or self.markdown_only:
+            return False
+        # Prompt 里只跑 promptOnly；保存消息时只跑两者都没勾的
+        if self.prompt_only != prompt:
+            return False
+        if depth is not None:
+            if self.min_depth is not None and self.min_depth >= -1 and depth < self.min_depth:
+                return False
+            if self.max_depth is not None and self.max_depth >= 0 and depth > self.max_depth:
+                return False
+        return True
+
+    def _group(self, m: Any, ref: Any) -> str:
+        try:
+            value = m.group(ref[1]) if isinstance(ref, tuple) else m.group(ref)
+        except (IndexError, _load_engine()[0].error):
+            value = None
+        if not value:
+            return ""
+        for t in self.trim:
+            value = value.replace(t, "")
+        return value
+
+    def run(self, text: str, macros: Optional[Callable[[str], str]], timeout: Optional[float]) -> str:
+        def repl(m: Any) -> str:
+            out = "".join(p if isinstance(p, str) else self._group(m, p) for p in self.replacement)
+            return macros(out) if macros and self.has_macros else out
+
+        if _load_engine()[1]:
+            return self.pattern.sub(repl, text, count=self.count, timeout=timeout)
+        return self.pattern.sub(repl, text, count=self.count)
+
+
+@dataclass
+class CompiledScripts:
+    """一张卡的全部脚本 (按卡片版本缓存，多个请求共用)"""
+    scripts: Tuple[CompiledScript, ...] = ()
+    # 脚本下标 -> (脚本名, 隔离原因) (编译失败 / 试跑超时 / 运行时多次超时)；名字只用于报告
+    quarantined: Dict[int, Tuple[str, str]] = field(default_factory=dict)
+    # 脚本下标 -> 运行时超时次数；同一个缓存对象被线程池里的多个请求共用，改的时候加锁
+    strikes: Dict[int, int] = field(default_factory=dict)
+    _lock: Lock = field(default_factory=Lock, repr=False, compare=False)
+
+    def __bool__(self) -> bool:
+        return bool(self.scripts)
+
+    def apply(
+        self,
+        text: str,
+        placement: int,
+        prompt: bool = False,
+        depth: Optional[int] = None,
+        macros: Optional[Callable[[str], str]] = None,
+    ) -> str:
+        """按顺序跑所有适用的脚本"""
+        timeout = config.REGEX_SCRIPT_TIMEOUT_MS / 1000
+        for script in self.scripts:
+            if not text or script.index in self.quarantined or not script.applies(placement, prompt, depth):
+                continue
+            try:
+                text = script.run(text, macros, timeout)
+            except TimeoutError:
+                self._strike(script)
+        return text
+
+    def apply_history(
+        self,
+        messages: Iterable[Dict[str, str]],
+        total: int,
+        start: int = 0,
+        prompt: bool = True,
+        macros: Optional[Callable[[str], str]] = None,
+    ) -> List[Dict[str, str]]:
+        """
+        批量处理一段聊天记录：messages 是完整记录 (共 total 条) 里从 start 开始的部分，
+        深度按完整记录算 (最新一条是 0)。没有适用脚本的消息原样返回。
+        """
+        out = []
+        for i, msg in enumerate(messages, start=start):
+            placement = ROLE_PLACEMENT.get(msg.get("role"))
+            if placement is None:
+                out.append(msg)
+                continue
+            content = self.apply(msg["content"], placement, prompt=prompt, depth=total - 1 - i, macros=macros)
+            out.append(msg if content is msg["content"] else {**msg, "content": content})
+        return out
+
+    def _strike(self, script: CompiledScript) -> None:
+        with self._lock:
+            count = self.strikes.get(script.index, 0) + 1
+            self.strikes[script.index] = count
+            if count >= config.REGEX_SCRIPT_MAX_STRIKES:
+                self.quarantined[script.index] = (script.name, f"timed out {count} times")
+        logger.warning(
+            "regex script #%d %r timed out (%d/%d)", script.index, script.name, count, config.REGEX_SCRIPT_MAX_STRIKES
+        )
+
+    def report(self) -> List[Dict[str, Any]]:
+        """被隔离的脚本 [{"index", "name", "reason"}]，按下标排序"""
+        with self._lock:
+            items = sorted(self.quarantined.items())
+        return [{"index": i, "name": name, "reason": reason} for i, (name, reason) in items]
+
+
+def _compile_script(index: int, script: Any) -> CompiledScript:
+    extra = script.model_extra or {}
+    pattern, count = compile_pattern(script.findRegex)
+    replacement = _parse_replacement(script.replaceString or "")
+    return CompiledScript(
+        index=index,
+        name=script.scriptName,
+        pattern=pattern,
+        count=count,
+        replacement=replacement,
+        has_macros=any(isinstance(p, str) and "{{" in p for p in replacement),
+        trim=tuple(t for t in extra.get("trimStrings") or [] if t),
+        placement=frozenset(int(p) for p in extra.get("placement") or []),
+        prompt_only=bool(extra.get("promptOnly")),
+        markdown_only=bool(extra.get("markdownOnly")),
+        min_depth=_int_or_none(extra.get("minDepth")),
+        max_depth=_int_or_none(extra.get("maxDepth")),
+    )
+
+
+def compile_scripts(card: TavernCardV3) -> CompiledScripts:
+    """编译卡片上的所有脚本；禁用的跳过，编译失败 / 上传时被隔离的记进 quarantined"""
+    compiled: List[CompiledScript] = []
+    quarantined: Dict[int, Tuple[str, str]] = {}
+    for index, script in enumerate(card.data.extensions.regex_scripts):
+        extra = script.model_extra or {}
+        if extra.get("disabled"):
+            if extra.get("quarantined"):
+                quarantined[index] = (script.scriptName, str(extra["quarantined"]))
+            continue
+        try:
+            compiled.append(_compile_script(index, script))
+        except RegexScriptError as e:
+            quarantined[index] = (script.scriptName, str(e))
+    return CompiledScripts(scripts=tuple(compiled), quarantined=quarantined)
+
+
+regex_script_cache: VersionedLRUCache[CompiledScripts] = VersionedLRUCache(maxsize=64)
+
+
+def get_regex_scripts(card: TavernCardV3, card_id: Optional[Hashable] = None, version: Any = None) -> CompiledScripts:
+    """按 (卡片 ID, 版本) 缓存编译结果；没有 ID 时每次都编译"""
+    if card_id is None:
+        return compile_scripts(card)
+    return regex_script_cache.get_or_build(card_id, version, lambda: compile_scripts(card))
+
+
+# --- 3. 上传时的检查 ---
+
+def _probe_inputs(source: str) -> List[str]:
+    """
+    构造容易触发回溯的输入：pattern 里出现过的字符 (外加几个常见字符) 大量重复，
+    结尾接一个匹配不上的字符，逼正则把所有拆分方式都试一遍。
+    """
+    chars = {c for c in source if c.isalnum() or c in " \n\t.,-_"} | {"a", "0", " ", "\n"}
+    repeat = config.REGEX_PROBE_LENGTH
+    inputs = [c * repeat + "\x00!" for c in sorted(chars)[:24]]
+    inputs.append("ab " * (repeat // 3) + "\x00")
+    return inputs
+
+
+def check_script(find: str) -> Optional[str]:
+    """有问题返回原因，没问题返回 None"""
+    try:
+        pattern, _ = compile_pattern(find)
+    except RegexScriptError as e:
+        return str(e)
+    if not _load_engine()[1]:
+        return None
+    timeout = config.REGEX_PROBE_TIMEOUT_MS / 1000
+    source, _ = split_regex(find)
+    for probe in _probe_inputs(source):
+        try:
+            pattern.search(probe, timeout=timeout)
+        except TimeoutError:
+            return f"catastrophic backtracking (probe of {len(probe)} chars exceeded {config.REGEX_PROBE_TIMEOUT_MS} ms)"
+    return None
+
+
+def quarantine_scripts(raw_json: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    上传时调用：逐个检查卡片里的脚本，有问题的原地标记
+        disabled: true, quarantined: "原因"
+    返回 [{"index": 在 regex_scripts 里的下标, "name": 脚本名, "reason": 原因}] (脚本名可能重复)。
+    已经禁用的脚本不检查。
+    """
+    data = raw_json.get("data")
+    scripts = ((data or {}).get("extensions") or {}).get("regex_scripts") if isinstance(data, dict) else None
+    report: List[Dict[str, Any]] = []
+    for index, script in enumerate(scripts or []):
+        if not isinstance(script, dict) or script.get("disabled") or not script.get("findRegex"):
+            continue
+        reason = check_script(str(script["findRegex"]))
+        if reason:
+            script["disabled"] = True
+            script["quarantined"] = reason
+            report.append({"index": index, "name": script.get("scriptName"), "reason": reason})
+    return report
@@ -0,0 +1,185 @@
+"""
+语义召回：世界书词条 + 较早的聊天记录
+
+关键词扫描只认字面命中，这里再用向量相似度补一层 (向量存储见 vector_store)：
+    - 世界书：每本按 (ID, 版本) 建一个向量索引，召回没被关键词激活、但和最近对话相关的词条
+    - 聊天：每个聊天一个向量索引，消息追加时增量写入，只召回已经滑出历史窗口的旧消息
+查询用最近 QUERY_DEPTH 条消息，每条一个查询向量，批量检索后按名次轮流合并。
+召回结果在 token 预算内按相似度贪心放进世界书的 before / after 插槽 (见 ContextAssembler)。
+
+numpy / vector_store 用到时才导入 (启动时不加载)，这个模块本身很轻，可以放心在顶层导入。
+"""
+import os
+from typing import TYPE_CHECKING, Any, Dict, Hashable, Iterable, List, Optional, Sequence, Tuple
+
+from app.core import config
+from app.core.cache import VersionedLRUCache
+from app.core.tokenizer import Tokenizer
+from app.core.world_info import WorldInfoIndex
+
+if TYPE_CHECKING:
+    import numpy as np
+
+    from app.core.vector_store import VectorStore
+
+# 取最近几条消息当查询
+QUERY_DEPTH = 2
+# 一次嵌入多少条 (建索引 / 补索引时)
+EMBED_BATCH = 512
+
+
+def _store_path(name: str) -> str:
+    return os.path.join(config.VECTOR_DIR, name)
+
+
+def _upsert_texts(store: "VectorStore", items: Sequence[Tuple[int, str]]) -> None:
+    from app.core.vector_store import get_embedder
+
+    embedder = get_embedder()
+    for start in range(0, len(items), EMBED_BATCH):
+        batch = items[start:start + EMBED_BATCH]
+        store.upsert([i for i, _ in batch], embedder.embed([text for _, text in batch]))
+
+
+# --- 世界书 ---
+def entry_text(entry) -> str:
+    """词条用来算向量的文本：名称 + 关键词 + 内容"""
+    parts = [entry.name or "", " ".join(entry.keys), entry.content or ""]
+    return "\n".join(p for p in parts if p)
+
+
+def build_lorebook_store(
+    index: WorldInfoIndex, lorebook_id: Optional[Hashable] = None, version: Any = None
+) -> "VectorStore":
+    """词条按 index.entries 的下标存；磁盘上的版本对不上 (或没有) 就整本重建"""
+    from app.core.vector_store import VectorStore, get_embedder
+
+    path = None if lorebook_id is None else _store_path(f"lorebook_{lorebook_id}")
+    store = VectorStore(path, get_embedder())
+    stamp = str(version)
+    if store.meta.get("version") != stamp or len(store) != len(index.entries):
+        store.clear(version=stamp)
+        _upsert_texts(store, [(i, entry_text(e)) for i, e in enumerate(index.entries)])
+    return store
+
+
+# 按 (lorebook_id, (版本, 嵌入模型)) 缓存，换了模型也会重建
+lorebook_vector_cache: "VersionedLRUCache[VectorStore]" = VersionedLRUCache(maxsize=32)
+
+
+def get_lorebook_store(
+    index: WorldInfoIndex, lorebook_id: Optional[Hashable] = None, version: Any = None
+) -> "VectorStore":
+    from app.core.vector_store import embedder_key, get_embedder
+
+    if lorebook_id is None:
+        return build_lorebook_store(index)
+    key = (version, embedder_key(get_embedder()))
+    return lorebook_vector_cache.get_or_build(
+        lorebook_id, key, lambda: build_lorebook_store(index, lorebook_id, version)
+    )
+
+
+# --- 聊天记录 ---
+chat_vector_cache: "VersionedLRUCache[VectorStore]" = VersionedLRUCache(maxsize=256)
+
+
+def get_chat_store(chat_id: Hashable) -> "VectorStore":
+    """聊天的向量索引 (打开的文件按 LRU 保留)"""
+    from app.core.vector_store import VectorStore, embedder_key, get_embedder
+
+    return chat_vector_cache.get_or_build(
+        chat_id, embedder_key(get_embedder()),
+        lambda: VectorStore(_store_path(f"chat_{chat_id}"), get_embedder()),
+    )
+
+
+def index_messages(chat_id: Hashable, messages: Sequence[Tuple[int, str]], up_to: Optional[int] = None) -> None:
+    """
+    增量写入消息 [(消息 ID, 内容)]，空消息跳过。
+    up_to：ID 不超过它的消息都处理过了 (包括跳过的空消息)，记进 meta 的 indexed_up_to，补建时从这里往后查
+    """
+    items = [(i, text) for i, text in messages if text and text.strip()]
+    store = get_chat_store(chat_id)
+    if items:
+        _upsert_texts(store, items)
+    if up_to is not None and up_to > store.meta.get("indexed_up_to", 0):
+        store.update_meta(indexed_up_to=up_to)
+
+
+# --- 检索 ---
+def query_vectors(history: List[Dict[str, Any]], depth: int = QUERY_DEPTH) -> "np.ndarray":
+    """最近 depth 条消息各出一个查询向量"""
+    from app.core.vector_store import get_embedder
+
+    texts = [m.get("content", "") for m in history[-depth:]] if depth > 0 else []
+    return get_embedder().embed([t for t in texts if t and t.strip()])
+
+
+def best_hits(results: Iterable[List[Tuple[int, float]]], k: int, min_score: float) -> List[Tuple[int, float]]:
+    """
+    合并多个查询的结果：按名次轮流取 (每个查询的第 1 名，再第 2 名……)，
+    免得某一条消息 (比如和前面内容高度重复的) 把名额全占了。
+    同一个 ID 取最高分，低于 min_score 的丢掉，最多 k 个。
+    """
+    ranked = [[hit for hit in hits if hit[1] >= min_score] for hits in results]
+    best: Dict[int, float] = {}
+    rank = 0
+    while len(best) < k and any(rank < len(hits) for hits in ranked):
+        for hits in ranked:
+            if rank < len(hits) and len(best) < k:
+                obj_id, score = hits[rank]
+                best[obj_id] = max(score, best.get(obj_id, score))
+        rank += 1
+    return sorted(best.items(), key=lambda item: (-item[1], item[0]))
+
+
+def recall_entries(
+    index: WorldInfoIndex,
+    store: "VectorStore",
+    queries: "np.ndarray",
+    active: Iterable[int],
+    k: Optional[int] = None,
+    min_score: Optional[float] = None,
+) -> List[Tuple[int, float]]:
+    """召回没有被关键词激活的词条 [(词条下标, 相似度)]"""
+    if not len(queries):
+        return []
+    k = config.VECTOR_TOP_K if k is None else k
+    min_score = config.VECTOR_MIN_SCORE if min_score is None else min_score
+    results = store.search(queries, k, exclude=set(active) | index.constant_ids)
+    return best_hits(results, k, min_score)
+
+
+def recall_messages(
+    chat_id: Hashable,
+    history: List[Dict[str, Any]],
+    before_id: Optional[int],
+    k: Optional[int] = None,
+    min_score: Optional[float] = None,
+) -> List[Tuple[int, float]]:
+    """召回 ID < before_id (历史窗口之前) 的旧消息 [(消息 ID, 相似度)]"""
+    queries = query_vectors(history)
+    if not len(queries):
+        return []
+    k = config.VECTOR_TOP_K if k is None else k
+    min_score = config.VECTOR_MIN_SCORE if min_score is None else min_score
+    results = get_chat_store(chat_id).search(queries, k, below=before_id)
+    return best_hits(results, k, min_score)
+
+
+def pack(
+    items: List[Tuple[float, Any, str]], budget: int, tokenizer: Tokenizer
+) -> Tuple[List[Tuple[float, Any, str]], int]:
+    """
+    items 是 [(相似度, 任意标记, 文本)]，按相似度从高到低放，放不下的跳过继续看下一条。
+    返回 (放进去的条目, 用掉的 token 数)。
+    """
+    picked: List[Tuple[float, Any, str]] = []
+    used = 0
+    for item in sorted(items, key=lambda it: -it[0]):
+        tokens = tokenizer.count(item[2])
+        if used + tokens <= budget:
+            picked.append(item)
+            used += tokens
+    return picked, used
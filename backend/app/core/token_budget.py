@@ -0,0 +1,59 @@
+"""
+Token 预算
+
+预算 = openai_max_context - openai_max_tokens (给回复预留的部分)。
+先把系统段全部算进去，剩下的额度留给聊天记录：
+对每条消息的 token 数求前缀和，二分找出能放下的最长「最近 N 条」。
+"""
+from bisect import bisect_left
+from dataclasses import asdict, dataclass
+from itertools import accumulate
+from typing import Any, Dict, List, Sequence
+
+
+@dataclass
+class TokenBudget:
+    """一次拼装的预算明细 (会返回给前端)"""
+    max_context: int = 0
+    reserved_for_response: int = 0
+    available: int = 0
+    system_tokens: int = 0
+    history_tokens: int = 0
+    history_kept: int = 0
+    history_dropped: int = 0
+    # 语义召回 (词条 + 旧消息) 占用的 token 和条数，已经算在 system_tokens 里
+    recall_tokens: int = 0
+    recalled: int = 0
+    # 插进聊天记录的注入 (预设 injection_position = 1 / 角色卡 depth_prompt)：token 数 (已经算在 system_tokens 里) 和条数
+    injection_tokens: int = 0
+    injected: int = 0
+    # 历史总结 (见 modules/chat/summary.py)：token 数 (已经算在 system_tokens 里)、覆盖到哪条消息
+    summary_tokens: int = 0
+    summary_up_to: int = 0
+    # 开头每轮不变的系统消息 (见 prompt_prefix)：条数、token 数 (已经算在 system_tokens 里)、内容哈希
+    prefix_messages: int = 0
+    prefix_tokens: int = 0
+    prefix_hash: str = ""
+    total_tokens: int = 0
+    tokenizer: str = ""
+
+    def as_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+def fit_suffix(counts: Sequence[int], budget: int) -> int:
+    """
+    返回能放进 budget 的最长后缀的起点下标。
+    prefix[k] = 前 k 条的总数，后缀 [k:] 的总数 = total - prefix[k]，
+    要求 total - prefix[k] <= budget，即找第一个 prefix[k] >= total - budget 的 k。
+    """
+    if not counts:
+        return 0
+    if budget <= 0:
+        return len(counts)
+    prefix: List[int] = [0]
+    prefix.extend(accumulate(counts))
+    need = prefix[-1] - budget
+    if need <= 0:
+        return 0
+    return bisect_left(prefix, need)
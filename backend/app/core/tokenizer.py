@@ -0,0 +1,95 @@
+"""
+Token 计数
+
+默认用 UTF-8 字节数启发式估算，不依赖任何分词库，速度快：
+    - ASCII 字符大约 4 个算 1 个 token
+    - 中日韩等多字节字符大约 1 个字算 1 个 token
+需要精确计数时可以换成 tiktoken (装了才能用)。
+同一条消息每轮都会被重新计数，所以外面包了一层按文本缓存。
+"""
+import math
+from functools import lru_cache
+from typing import Callable, Dict, Optional, Protocol
+
+# 每条消息额外的格式开销 (role、分隔符等)，与 OpenAI 的计法接近
+MESSAGE_OVERHEAD = 4
+
+
+class Tokenizer(Protocol):
+    name: str
+
+    def count(self, text: str) -> int:
+        ...
+
+
+class HeuristicTokenizer:
+    """CJK 友好的字节启发式估算"""
+    name = "heuristic"
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        chars = len(text)
+        extra_bytes = len(text.encode("utf-8")) - chars
+        if extra_bytes == 0:
+            return math.ceil(chars / 4)
+        # 多字节字符以 3 字节 (CJK) 为主：每个多出 2 字节，按此估出多字节字符数
+        wide = min(chars, math.ceil(extra_bytes / 2))
+        return math.ceil((chars - wide) / 4) + wide
+
+
+class TiktokenTokenizer:
+    """精确计数 (需要安装 tiktoken)"""
+
+    def __init__(self, encoding: str = "cl100k_base"):
+        import tiktoken  # 可选依赖，用到时才导入
+
+        self.name = f"tiktoken:{encoding}"
+        self._encoding = tiktoken.get_encoding(encoding)
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        return len(self._encoding.encode(text, disallowed_special=()))
+
+
+class CachedTokenizer:
+    """按文本缓存计数结果，历史消息每轮重复计数时直接命中"""
+
+    def __init__(self, base: Tokenizer, maxsize: int = 65536):
+        self.base = base
+        self.name = base.name
+        self.count: Callable[[str], int] = lru_cache(maxsize=maxsize)(base.count)
+
+
+# 可用的分词器 (名字 -> 工厂函数)，新的分词器注册到这里即可
+TOKENIZERS: Dict[str, Callable[[], Tokenizer]] = {
+    "heuristic": HeuristicTokenizer,
+    "tiktoken": TiktokenTokenizer,
+}
+
+_current: Optional[CachedTokenizer] = None
+
+
+def get_tokenizer() -> CachedTokenizer:
+    """当前全局使用的分词器 (默认启发式)"""
+    global _current
+    if _current is None:
+        _current = CachedTokenizer(HeuristicTokenizer())
+    return _current
+
+
+def set_tokenizer(name_or_tokenizer) -> CachedTokenizer:
+    """切换分词器：传名字 ("heuristic" / "tiktoken") 或者一个实现了 count() 的对象"""
+    global _current
+    if isinstance(name_or_tokenizer, str):
+        base = TOKENIZERS[name_or_tokenizer]()
+    else:
+        base = name_or_tokenizer
+    _current = CachedTokenizer(base)
+    return _current
+
+
+def count_message(tokenizer: Tokenizer, content: str) -> int:
+    """一条消息的 token 数 (含格式开销)"""
+    return tokenizer.count(content) + MESSAGE_OVERHEAD
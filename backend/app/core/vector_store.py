@@ -0,0 +1,370 @@
+"""
+本地向量索引
+
+不依赖外部向量服务：向量按行存在一个 float32 的 numpy 数组里，落盘时是 memmap 文件，
+同一台机器上的多个进程共享页缓存，打开不需要整块读进内存。
+    <dir>/vectors.f32   行向量 (容量按倍数增长)
+    <dir>/ids.i64       每行对应的对象 ID，-1 表示空行 (删除后留下的，可复用)
+    <dir>/meta.json     维度、嵌入模型、已用行数，以及调用方自己的字段 (比如世界书版本)
+    <dir>/lock          跨进程的文件锁 (fcntl.flock)：写独占、读共享，多个 worker 同时追加不会抢同一行
+
+向量都是 L2 归一化的，余弦相似度就是点积：一批查询一次矩阵乘法，argpartition 取 top-k。
+
+嵌入模型可插拔：默认是特征哈希 (HashingEmbedder)，纯本地、结果确定，离线也能跑；
+换成别的模型时注册到 EMBEDDERS 即可。meta.json 里记着模型名和维度，对不上就整个重建。
+"""
+import json
+import math
+import os
+import re
+import zlib
+from collections import Counter
+from contextlib import contextmanager
+from functools import lru_cache
+from threading import Lock
+from typing import Any, Callable, Collection, Dict, Iterator, List, Optional, Protocol, Sequence, Tuple
+
+import numpy as np
+
+from app.core import config
+
+try:
+    import fcntl
+except ImportError:  # Windows 没有 flock：只保证进程内安全，只能单个 worker 写
+    fcntl = None
+
+VECTORS_FILE = "vectors.f32"
+IDS_FILE = "ids.i64"
+META_FILE = "meta.json"
+LOCK_FILE = "lock"
+
+# 最小容量 (行)，之后每次翻倍
+MIN_CAPACITY = 64
+
+
+class Embedder(Protocol):
+    name: str
+    dim: int
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        """返回 (len(texts), dim) 的 float32 数组，每行 L2 归一化 (空文本为全 0)"""
+        ...
+
+
+# 中日韩文字没有空格分词，按字切开再取相邻两字
+_CJK = "\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff"
+_TOKEN = re.compile(f"[{_CJK}]+|[^\\W_{_CJK}]+")
+_IS_CJK = re.compile(f"[{_CJK}]")
+
+
+class HashingEmbedder:
+    """
+    特征哈希：词 (中日韩为单字 + 相邻两字) 用 crc32 映射到 dim 个桶里，带正负号减少碰撞偏差，
+    词频取 1 + log(tf)。同样的文本在任何机器、任何进程里得到的向量都一样。
+    """
+    name = "hashing"
+
+    def __init__(self, dim: int = 256, cache_size: int = 65536):
+        self.dim = dim
+        self._slot: Callable[[str], Tuple[int, float]] = lru_cache(maxsize=cache_size)(self._hash)
+
+    def _hash(self, feature: str) -> Tuple[int, float]:
+        h = zlib.crc32(feature.encode("utf-8"))
+        return h % self.dim, (1.0 if h & 0x80000000 else -1.0)
+
+    @staticmethod
+    def features(text: str) -> List[str]:
+        feats: List[str] = []
+        for token in _TOKEN.findall(text.lower()):
+            if _IS_CJK.match(token):
+                feats.extend(token)
+                feats.extend(token[i:i + 2] for i in range(len(token) - 1))
+            else:
+                feats.append(token)
+        return feats
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature, tf in Counter(self.features(text or "")).items():
+                idx, sign = self._slot(feature)
+                out[row, idx] += sign * (1.0 + math.log(tf))
+        norms = np.linalg.norm(out, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        out /= norms
+        return out
+
+
+# 可用的嵌入模型 (名字 -> 工厂函数，参数是维度)，新的模型注册到这里即可
+EMBEDDERS: Dict[str, Callable[[int], Embedder]] = {
+    "hashing": HashingEmbedder,
+}
+
+_current: Optional[Embedder] = None
+
+
+def get_embedder() -> Embedder:
+    """当前全局使用的嵌入模型 (默认 VECTOR_EMBEDDER / VECTOR_DIM)"""
+    global _current
+    if _current is None:
+        _current = EMBEDDERS[config.VECTOR_EMBEDDER](config.VECTOR_DIM)
+    return _current
+
+
+def set_embedder(name_or_embedder, dim: Optional[int] = None) -> Embedder:
+    """切换嵌入模型：传名字或者一个实现了 embed() 的对象"""
+    global _current
+    if isinstance(name_or_embedder, str):
+        _current = EMBEDDERS[name_or_embedder](dim or config.VECTOR_DIM)
+    else:
+        _current = name_or_embedder
+    return _current
+
+
+def embedder_key(embedder: Embedder) -> str:
+    """写进 meta.json 的模型标识，模型或维度变了旧向量就不能用了"""
+    return f"{embedder.name}:{embedder.dim}"
+
+
+class VectorStore:
+    """
+    一组 (ID -> 向量)。path 为 None 时只放在内存里 (临时世界书用)。
+    同一进程内用线程锁，进程之间用 lock 文件上的 flock：写 (追加 / 删除 / 清空) 独占，查询共享。
+    拿到锁之后先看 meta.json 有没有被别的进程换过 (inode + 修改时间)，换过就重新读 meta、重新映射，
+    所以新行的位置总是按最新的 count 分配，两个 worker 同时追加也不会写到同一行。
+    """
+
+    def __init__(self, path: Optional[str], embedder: Embedder):
+        self.path = path
+        self.dim = embedder.dim
+        self.embedder = embedder_key(embedder)
+        self.meta: Dict[str, Any] = {}
+        self.count = 0
+        self._vectors = np.zeros((0, self.dim), dtype=np.float32)
+        self._ids = np.zeros(0, dtype=np.int64)
+        self._rows: Dict[int, int] = {}
+        self._free: List[int] = []
+        self._meta_stamp: Tuple[int, int] = (0, 0)
+        self._lock = Lock()
+        self._lock_fd: Optional[int] = None
+        if path is not None:
+            os.makedirs(path, exist_ok=True)
+            if fcntl is not None:
+                self._lock_fd = os.open(self._file(LOCK_FILE), os.O_RDWR | os.O_CREAT, 0o644)
+            with self._locked(exclusive=True):
+                self._load()
+
+    def __del__(self):
+        if getattr(self, "_lock_fd", None) is not None:
+            os.close(self._lock_fd)
+            self._lock_fd = None
+
+    @contextmanager
+    def _locked(self, exclusive: bool) -> Iterator[None]:
+        """进程内的线程锁 + 跨进程的文件锁 (写独占，读共享)"""
+        with self._lock:
+            if self._lock_fd is None:
+                yield
+                return
+            fcntl.flock(self._lock_fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+
+    # --- 文件 ---
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def _read_meta(self) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self._file(META_FILE), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_meta(self) -> None:
+        meta = {**self.meta, "dim": self.dim, "embedder": self.embedder, "count": self.count}
+        tmp = self._file(META_FILE + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(tmp, self._file(META_FILE))
+        self._meta_stamp = self._stat_meta()
+
+    def _stat_meta(self) -> Tuple[int, int]:
+        """meta.json 每次都是写临时文件再替换，inode 会变；和修改时间一起判断有没有被改过"""
+        st = os.stat(self._file(META_FILE))
+        return st.st_ino, st.st_mtime_ns
+
+    def _map(self, capacity: int) -> None:
+        """把两个文件映射成 capacity 行 (文件不够长就先扩)"""
+        for name, width in ((VECTORS_FILE, self.dim * 4), (IDS_FILE, 8)):
+            with open(self._file(name), "a+b") as f:
+                if os.fstat(f.fileno()).st_size < capacity * width:
+                    f.truncate(capacity * width)
+        self._vectors = np.memmap(self._file(VECTORS_FILE), dtype=np.float32, mode="r+", shape=(capacity, self.dim))
+        self._ids = np.memmap(self._file(IDS_FILE), dtype=np.int64, mode="r+", shape=(capacity,))
+
+    def _load(self, writable: bool = True) -> None:
+        meta = self._read_meta()
+        if not meta or meta.get("dim") != self.dim or meta.get("embedder") != self.embedder:
+            if writable:
+                self._reset({})
+            else:
+                # 只拿着共享锁 (查询) 时不能改文件：先当成空的，下次写入时再重建
+                self.meta, self.count, self._rows, self._free = {}, 0, {}, []
+            return
+        self.meta = {k: v for k, v in meta.items() if k not in ("dim", "embedder", "count")}
+        self.count = int(meta.get("count", 0))
+        self._meta_stamp = self._stat_meta()
+        capacity = os.path.getsize(self._file(IDS_FILE)) // 8 if os.path.exists(self._file(IDS_FILE)) else 0
+        self._map(max(capacity, self.count, MIN_CAPACITY))
+        self._reindex()
+
+    def _reindex(self) -> None:
+        ids = self._ids[:self.count]
+        self._rows = {int(i): row for row, i in enumerate(ids.tolist()) if i >= 0}
+        self._free = [row for row, i in enumerate(ids.tolist()) if i < 0]
+
+    def _refresh(self, writable: bool = True) -> None:
+        """别的进程改过文件就重新读 meta、重新映射 (调用方已经拿着文件锁，writable 表示是不是独占的)"""
+        if self.path is None:
+            return
+        try:
+            stamp = self._stat_meta()
+        except OSError:
+            return
+        if stamp != self._meta_stamp:
+            self._load(writable)
+
+    def _reset(self, meta: Dict[str, Any]) -> None:
+        self.meta = dict(meta)
+        self.count = 0
+        self._rows, self._free = {}, []
+        if self.path is None:
+            self._vectors = np.zeros((MIN_CAPACITY, self.dim), dtype=np.float32)
+            self._ids = np.full(MIN_CAPACITY, -1, dtype=np.int64)
+            return
+        for name in (VECTORS_FILE, IDS_FILE):
+            with open(self._file(name), "wb"):
+                pass
+        self._map(MIN_CAPACITY)
+        self._write_meta()
+
+    def _grow(self, need: int) -> None:
+        capacity = len(self._ids)
+        if need <= capacity:
+            return
+        capacity = max(need, capacity * 2, MIN_CAPACITY)
+        if self.path is None:
+            vectors = np.zeros((capacity, self.dim), dtype=np.float32)
+            ids = np.full(capacity, -1, dtype=np.int64)
+            vectors[:self.count] = self._vectors[:self.count]
+            ids[:self.count] = self._ids[:self.count]
+            self._vectors, self._ids = vectors, ids
+        else:
+            self._vectors.flush()
+            self._ids.flush()
+            self._map(capacity)
+
+    # --- 读写 ---
+    def clear(self, **meta: Any) -> None:
+        """清空，并换上新的 meta 字段"""
+        with self._locked(exclusive=True):
+            self._reset(meta)
+
+    def update_meta(self, **meta: Any) -> None:
+        """改调用方自己的 meta 字段 (不动向量)"""
+        with self._locked(exclusive=True):
+            self._refresh()
+            self.meta.update(meta)
+            if self.path is not None:
+                self._write_meta()
+
+    def upsert(self, ids: Sequence[int], vectors: np.ndarray) -> None:
+        """已有的 ID 原地覆盖，新的 ID 优先填空行，否则追加到末尾"""
+        if not len(ids):
+            return
+        with self._locked(exclusive=True):
+            self._refresh()
+            new = sum(1 for i in ids if int(i) not in self._rows)
+            self._grow(self.count + max(new - len(self._free), 0))
+            for obj_id, vector in zip(ids, vectors):
+                obj_id = int(obj_id)
+                row = self._rows.get(obj_id)
+                if row is None:
+                    if self._free:
+                        row = self._free.pop()
+                    else:
+                        row = self.count
+                        self.count += 1
+                    self._rows[obj_id] = row
+                    self._ids[row] = obj_id
+                self._vectors[row] = vector
+            if self.path is not None:
+                self._write_meta()
+
+    def delete(self, ids: Collection[int]) -> None:
+        with self._locked(exclusive=True):
+            self._refresh()
+            for obj_id in ids:
+                row = self._rows.pop(int(obj_id), None)
+                if row is not None:
+                    self._ids[row] = -1
+                    self._vectors[row] = 0.0
+                    self._free.append(row)
+            if self.path is not None:
+                self._write_meta()
+
+    def flush(self) -> None:
+        """把 memmap 刷到磁盘 (正常情况下交给操作系统就行，退出前调用一次)"""
+        with self._lock:
+            if isinstance(self._vectors, np.memmap):
+                self._vectors.flush()
+                self._ids.flush()
+
+    def search(
+        self,
+        queries: np.ndarray,
+        k: int,
+        exclude: Optional[Collection[int]] = None,
+        below: Optional[int] = None,
+    ) -> List[List[Tuple[int, float]]]:
+        """
+        批量余弦 top-k：queries 是 (q, dim) 的归一化向量，每个查询返回 [(ID, 相似度)]，按相似度从高到低。
+        exclude 里的 ID 不返回；below 不为 None 时只返回 ID < below 的。
+        """
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        with self._locked(exclusive=False):
+            self._refresh(writable=False)
+            n = self.count
+            if n == 0 or k <= 0 or len(queries) == 0:
+                return [[] for _ in range(len(queries))]
+            ids = np.array(self._ids[:n])
+            # 1. 一次矩阵乘法算出所有相似度 (向量矩阵按行连续存放，放左边乘更快)
+            scores = (np.asarray(self._vectors[:n]) @ queries.T).T
+
+        # 2. 过滤：空行 / 排除的 / 不在范围内的
+        valid = ids >= 0
+        if below is not None:
+            valid &= ids < below
+        if exclude:
+            valid &= ~np.isin(ids, np.fromiter(exclude, dtype=np.int64))
+        scores[:, ~valid] = -np.inf
+
+        # 3. argpartition 取出每行最大的 k 个，再对这 k 个排序
+        k = min(k, int(valid.sum()))
+        if k == 0:
+            return [[] for _ in range(len(queries))]
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        results: List[List[Tuple[int, float]]] = []
+        for row, cols in enumerate(top):
+            picked = sorted(((float(scores[row, c]), int(ids[c])) for c in cols), reverse=True)
+            results.append([(obj_id, score) for score, obj_id in picked])
+        return results
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __contains__(self, obj_id: int) -> bool:
+        return int(obj_id) in self._rows
@@ -0,0 +1,334 @@
+"""
+世界书扫描 (World Info)
+
+世界书动辄几千个词条，逐条拿关键词去匹配每条消息太慢了。
+这里把一整本世界书的 keys / secondary_keys 编译成 Aho-Corasick 自动机，
+扫描一段文本只需要走一遍字符，耗时只和文本长度有关，和词条数量无关。
+编译结果按 (lorebook_id, version) 缓存，世界书不变就一直复用。
+"""
+from array import array
+from collections import OrderedDict, deque
+from threading import Lock
+from typing import Any, Dict, FrozenSet, Hashable, Iterable, List, Optional, Set, Tuple
+
+from app.core.cache import VersionedLRUCache
+from app.schemas.lorebook import Lorebook, LorebookEntry
+
+# 世界书没写 scan_depth 时默认扫描最近几条消息 (与酒馆默认值一致)
+DEFAULT_SCAN_DEPTH = 2
+
+# 插入到 worldInfoAfter 的位置，其余都放到 worldInfoBefore
+AFTER_POSITIONS = {"after_char", "after"}
+
+# 递归激活最多展开几轮 (词条内容触发其他词条)
+DEFAULT_MAX_RECURSION = 3
+
+
+class AhoCorasick:
+    """多模式匹配自动机：一次扫描找出所有命中的关键词，返回它们对应的值"""
+    __slots__ = ("_goto", "_fail", "_out")
+
+    def __init__(self, patterns: Iterable[Tuple[str, int]]):
+        # 1. 建字典树：_goto[node] = {字符: 子节点}
+        goto: List[Dict[str, int]] = [{}]
+        out: List[Set[int]] = [set()]
+        for pattern, value in patterns:
+            if not pattern:
+                continue
+            node = 0
+            for ch in pattern:
+                nxt = goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(goto)
+                    goto[node][ch] = nxt
+                    goto.append({})
+                    out.append(set())
+                node = nxt
+            out[node].add(value)
+
+        # 2. 按层 BFS 求失配指针，同时把失配节点的输出合并进来
+        fail = [0] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, child in goto[node].items():
+                queue.append(child)
+                f = fail[node]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                fail[child] = goto[f].get(ch, 0)
+                out[child] |= out[fail[child]]
+
+        self._goto = goto
+        self._fail = fail
+        self._out = [tuple(o) for o in out]
+
+    def search(self, text: str) -> Set[int]:
+        """扫描一遍文本，返回所有命中模式的值"""
+        goto, fail, out = self._goto, self._fail, self._out
+        found: Set[int] = set()
+        node = 0
+        for ch in text:
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            if out[node]:
+                found.update(out[node])
+        return found
+
+    def tables(self) -> Tuple["array[int]", ...]:
+        """
+        压平成 6 个 uint32 数组 (写进编译好的世界书文件，见 world_info_artifact)：
+            edge_start / edge_char / edge_target   每个节点的出边，按字符码排序 (CSR)
+            fail                                   失配指针
+            out_start / out_values                 每个节点的输出 (已合并失配节点的输出)
+        """
+        edge_start, edge_char, edge_target = array("I", [0]), array("I"), array("I")
+        for edges in self._goto:
+            for ch, child in sorted(edges.items()):
+                edge_char.append(ord(ch))
+                edge_target.append(child)
+            edge_start.append(len(edge_char))
+        out_start, out_values = array("I", [0]), array("I")
+        for values in self._out:
+            out_values.extend(sorted(values))
+            out_start.append(len(out_values))
+        return edge_start, edge_char, edge_target, array("I", self._fail), out_start, out_values
+
+    def __len__(self) -> int:
+        return len(self._goto)
+
+
+class WorldInfoIndex:
+    """
+    一本世界书编译后的索引。
+    自动机里的值编码为 entry_id * 2 + (是否次要关键词)，一次扫描同时拿到两类命中。
+    """
+
+    def __init__(self, lorebook: Lorebook):
+        self.scan_depth = lorebook.scan_depth if lorebook.scan_depth is not None else DEFAULT_SCAN_DEPTH
+
+        # 1. 只保留启用的词条，按 insertion_order 排好 (稳定排序，同值保持原顺序)
+        self.entries: Tuple[LorebookEntry, ...] = tuple(
+            sorted((e for e in lorebook.entries if e.enabled), key=lambda e: e.insertion_order)
+        )
+        self.constant_ids: FrozenSet[int] = frozenset(
+            i for i, e in enumerate(self.entries) if e.constant
+        )
+        self.selective_ids: FrozenSet[int] = frozenset(
+            i for i, e in enumerate(self.entries) if e.selective and e.secondary_keys
+        )
+
+        # 2. 区分大小写 / 不区分大小写的关键词分别建一个自动机
+        sensitive: List[Tuple[str, int]] = []
+        insensitive: List[Tuple[str, int]] = []
+        for i, entry in enumerate(self.entries):
+            target = sensitive if entry.case_sensitive else insensitive
+            for key in entry.keys:
+                key = key.strip()
+                if key:
+                    target.append((key if entry.case_sensitive else key.lower(), i * 2))
+            if i in self.selective_ids:
+                for key in entry.secondary_keys:
+                    key = key.strip()
+                    if key:
+                        target.append((key if entry.case_sensitive else key.lower(), i * 2 + 1))
+
+        self._sensitive = AhoCorasick(sensitive) if sensitive else None
+        self._insensitive = AhoCorasick(insensitive) if insensitive else None
+
+        # 词条内容的命中结果 (递归激活用)，内容不变所以算一次就够了
+        self._content_hits: Dict[int, FrozenSet[int]] = {}
+
+    def match(self, text: str) -> FrozenSet[int]:
+        """扫描一段文本，返回命中编码 (entry_id * 2 + 是否次要关键词)"""
+        if not text:
+            return frozenset()
+        hits: Set[int] = set()
+        if self._sensitive is not None:
+            hits |= self._sensitive.search(text)
+        if self._insensitive is not None:
+            hits |= self._insensitive.search(text.lower())
+        return frozenset(hits)
+
+    def activate(self, hits: Iterable[int]) -> List[int]:
+        """把命中编码换算成激活的词条 (按插入顺序)"""
+        primary: Set[int] = set()
+        secondary: Set[int] = set()
+        for code in hits:
+            (secondary if code & 1 else primary).add(code >> 1)
+
+        active = set(self.constant_ids)
+        for i in primary:
+            # selective 词条要求次要关键词也命中
+            if i in self.selective_ids and i not in secondary:
+                continue
+            active.add(i)
+        return sorted(active)
+
+    def content_hits(self, entry_id: int) -> FrozenSet[int]:
+        """词条内容本身的命中编码 (带缓存)"""
+        hits = self._content_hits.get(entry_id)
+        if hits is None:
+            hits = self._content_hits[entry_id] = self.match(self.entries[entry_id].content)
+        return hits
+
+    def resolve(self, hits: Iterable[int], max_recursion: int = DEFAULT_MAX_RECURSION) -> List[int]:
+        """
+        从消息的命中编码出发，算出最终激活的词条。
+        递归激活：新激活词条的内容再去触发别的词条，用工作队列按轮展开，最多 max_recursion 轮。
+        结果只取决于命中编码的集合，所以增量扫描和全量扫描得到的结果完全一致。
+        """
+        all_hits = set(hits)
+        active = set(self.activate(all_hits))
+        worklist = sorted(active)
+        rounds = 0
+        while worklist and rounds < max_recursion:
+            rounds += 1
+            for i in worklist:
+                all_hits |= self.content_hits(i)
+            newly = set(self.activate(all_hits)) - active
+            active |= newly
+            worklist = sorted(newly)
+        return sorted(active)
+
+    def scan(
+        self,
+        history: List[Dict[str, str]],
+        scan_depth: Optional[int] = None,
+        max_recursion: int = DEFAULT_MAX_RECURSION,
+    ) -> List[int]:
+        """全量扫描最近 scan_depth 条消息，返回激活的词条"""
+        depth = self.scan_depth if scan_depth is None else scan_depth
+        hits: Set[int] = set()
+        if depth > 0:
+            for msg in history[-depth:]:
+                hits |= self.match(msg.get("content", ""))
+        return self.resolve(hits, max_recursion)
+
+    def render(self, active: Iterable[int]) -> Dict[str, str]:
+        """把激活的词条按位置拼成 before / after 两段文本"""
+        before: List[str] = []
+        after: List[str] = []
+        for i in active:
+            entry = self.entries[i]
+            if not entry.content or not entry.content.strip():
+                continue
+            (after if entry.position in AFTER_POSITIONS else before).append(entry.content)
+        return {"before": "\n".join(before), "after": "\n".join(after)}
+
+
+class WorldInfoScanState:
+    """
+    一个聊天的增量扫描状态。
+    记住窗口里每条消息的命中编码，新一轮只扫描新追加的消息，
+    滑出 scan_depth 窗口的旧消息直接丢掉。
+    历史被编辑 / 删除 (不是单纯追加) 时，窗口里内容没变的消息仍然复用命中结果。
+    """
+
+    def __init__(self, index: WorldInfoIndex):
+        self.index = index
+        # 已同步的历史长度、窗口大小，以及窗口内每条消息的 (内容, 命中编码)
+        self.seen = 0
+        self.depth = 0
+        self.window: "deque[Tuple[str, FrozenSet[int]]]" = deque()
+        # 同一个聊天的并发请求 (比如连点重新生成) 不能同时改窗口
+        self._lock = Lock()
+
+    def _is_append_of(self, history: List[Dict[str, str]]) -> bool:
+        """本轮历史是不是在上次的基础上只追加了消息"""
+        if len(history) < self.seen:
+            return False
+        start = self.seen - len(self.window)
+        for offset, (content, _) in enumerate(self.window):
+            if history[start + offset].get("content", "") != content:
+                return False
+        return True
+
+    def update(
+        self,
+        history: List[Dict[str, str]],
+        scan_depth: Optional[int] = None,
+        max_recursion: int = DEFAULT_MAX_RECURSION,
+    ) -> List[int]:
+        """同步到最新的历史，返回激活的词条 (与 index.scan 的结果一致)"""
+        depth = self.index.scan_depth if scan_depth is None else scan_depth
+        with self._lock:
+            hits = self._sync(history, depth)
+        return self.index.resolve(hits, max_recursion)
+
+    def _sync(self, history: List[Dict[str, str]], depth: int) -> Set[int]:
+        """把窗口同步到最新历史，返回窗口内所有消息的命中编码"""
+        if depth <= 0:
+            self.seen, self.depth, self.window = len(history), depth, deque()
+            return set()
+
+        if depth == self.depth and self._is_append_of(history):
+            # 1. 只扫描新追加的消息 (超过窗口大小的部分根本不用扫)
+            first_new = max(self.seen, len(history) - depth)
+            if first_new > self.seen:
+                self.window.clear()
+            for msg in history[first_new:]:
+                content = msg.get("content", "")
+                self.window.append((content, self.index.match(content)))
+            # 2. 滑出窗口的旧消息移除
+            while len(self.window) > depth:
+                self.window.popleft()
+        else:
+            # 历史被改过：按内容复用还在窗口里的结果，其余重新扫描
+            known = {content: hits for content, hits in self.window}
+            window = deque()
+            for msg in history[-depth:]:
+                content = msg.get("content", "")
+                hits = known.get(content)
+                window.append((content, hits if hits is not None else self.index.match(content)))
+            self.window = window
+
+        self.seen = len(history)
+        self.depth = depth
+        hits: Set[int] = set()
+        for _, message_hits in self.window:
+            hits |= message_hits
+        return hits
+
+
+class WorldInfoStateStore:
+    """按聊天 ID 保存扫描状态，LRU 淘汰不活跃的聊天"""
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self._data: "OrderedDict[Hashable, WorldInfoScanState]" = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, chat_id: Hashable, index: WorldInfoIndex) -> WorldInfoScanState:
+        """取出聊天的扫描状态；世界书换了 (索引对象变了) 就重新开始"""
+        with self._lock:
+            state = self._data.get(chat_id)
+            if state is None or state.index is not index:
+                state = self._data[chat_id] = WorldInfoScanState(index)
+            self._data.move_to_end(chat_id)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+            return state
+
+    def discard(self, chat_id: Hashable) -> None:
+        with self._lock:
+            self._data.pop(chat_id, None)
+
+
+world_info_states = WorldInfoStateStore()
+
+
+# 全局共享的世界书索引缓存：按 (lorebook_id, version) 缓存，LRU 淘汰
+world_info_cache: VersionedLRUCache[WorldInfoIndex] = VersionedLRUCache(maxsize=32)
+
+
+def get_world_info_index(
+    lorebook: Lorebook,
+    lorebook_id: Optional[Hashable] = None,
+    version: Any = None,
+) -> WorldInfoIndex:
+    """有 ID 就走缓存；临时世界书 (没有 ID) 直接编译"""
+    if lorebook_id is None:
+        return WorldInfoIndex(lorebook)
+    return world_info_cache.get_or_build(lorebook_id, version, lambda: WorldInfoIndex(lorebook))
@@ -0,0 +1,310 @@
+"""
+编译好的世界书文件 (多个 worker 共享的只读 mmap)
+
+WorldInfoIndex 是一大堆 Python 对象 (每个词条一个 Pydantic 对象，自动机每个节点一个 dict)。
+开多个 uvicorn worker 时，每个进程各自解析 JSON、各自编译一份，内存和预热时间都要乘以 worker 数。
+这里把编译结果写成一个紧凑的二进制文件，世界书写入时生成一次，各 worker 只读 mmap：
+文件页在操作系统的页缓存里只有一份，所有进程共享；打开时不解析、不复制，用到哪页读哪页。
+
+文件布局 (本机字节序，各段按 8 字节对齐)：
+    "PWI1" + uint32 头部长度 + JSON 头部 (格式版本、世界书版本戳、scan_depth、各段的 [偏移, 字节数, 类型])
+    str_offsets / str_data   字符串表：内容 / 名称 / 关键词 / 位置去重后拼在一起，uint32 偏移数组
+    entries                  词条表：每条一个定长 struct (见 ENTRY)
+    keys                     关键词的字符串 ID，词条表里按 [start, end) 引用
+    constant / selective     常驻 / 要求次要关键词的词条下标
+    ac_s_* / ac_i_*          区分 / 不区分大小写的两个自动机 (AhoCorasick.tables 压平的 6 个数组)
+
+MappedWorldInfoIndex 的接口和 WorldInfoIndex 一样 (激活 / 递归 / 渲染的逻辑直接继承)，扫描结果完全一致。
+"""
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+from bisect import bisect_left
+from collections.abc import Sequence
+from typing import Any, Dict, Hashable, List, Optional, Set
+
+from app.core import config
+from app.core.world_info import AhoCorasick, WorldInfoIndex
+from app.schemas.lorebook import Lorebook
+
+MAGIC = b"PWI1"
+FORMAT_VERSION = 1
+NO_STRING = 0xFFFFFFFF
+ALIGN = 8
+
+# 词条：内容 / 名称 / 位置的字符串 ID、标志位、insertion_order、keys 和 secondary_keys 在 keys 段里的范围
+ENTRY = struct.Struct("<IIIIqIIII")
+FLAG_CONSTANT = 1
+FLAG_SELECTIVE = 2
+FLAG_CASE_SENSITIVE = 4
+
+AC_TABLES = ("edge_start", "edge_char", "edge_target", "fail", "out_start", "out_values")
+
+
+def artifact_path(lorebook_id: Hashable) -> str:
+    return os.path.join(config.WORLD_INFO_DIR, f"lorebook_{lorebook_id}.wi")
+
+
+# --- 写 ---
+class _StringTable:
+    """字符串去重：同一个文本 (比如位置、重复的关键词) 只存一份"""
+
+    def __init__(self):
+        self.ids: Dict[str, int] = {}
+        self.offsets = array("I", [0])
+        self.data = bytearray()
+
+    def add(self, text: Optional[str]) -> int:
+        if text is None:
+            return NO_STRING
+        sid = self.ids.get(text)
+        if sid is None:
+            sid = self.ids[text] = len(self.offsets) - 1
+            self.data += text.encode("utf-8")
+            self.offsets.append(len(self.data))
+        return sid
+
+
+def _sections(index: WorldInfoIndex) -> Dict[str, Any]:
+    """把编译好的索引压平成若干段 (bytes 或 uint32 数组)"""
+    strings = _StringTable()
+    entries = bytearray()
+    keys = array("I")
+    for entry in index.entries:
+        start = len(keys)
+        keys.extend(strings.add(key) for key in entry.keys)
+        middle = len(keys)
+        keys.extend(strings.add(key) for key in entry.secondary_keys)
+        flags = (
+            (FLAG_CONSTANT if entry.constant else 0)
+            | (FLAG_SELECTIVE if entry.selective else 0)
+            | (FLAG_CASE_SENSITIVE if entry.case_sensitive else 0)
+        )
+        entries += ENTRY.pack(
+            strings.add(entry.content), strings.add(entry.name), strings.add(entry.position),
+            flags, entry.insertion_order, start, middle, middle, len(keys),
+        )
+
+    sections: Dict[str, Any] = {
+        "str_offsets": strings.offsets,
+        "str_data": bytes(strings.data),
+        "entries": bytes(entries),
+        "keys": keys,
+        "constant": array("I", sorted(index.constant_ids)),
+        "selective": array("I", sorted(index.selective_ids)),
+    }
+    for prefix, automaton in (("ac_s", index._sensitive), ("ac_i", index._insensitive)):
+        if automaton is not None:
+            sections.update((f"{prefix}_{name}", table) for name, table in zip(AC_TABLES, automaton.tables()))
+    return sections
+
+
+def write_artifact(index: WorldInfoIndex, path: str, stamp: str) -> int:
+    """把索引写成文件 (先写临时文件再改名，别的进程不会读到写了一半的文件)，返回文件大小"""
+    # 1. 各段依次排好，记下相对数据区起点的偏移
+    layout: Dict[str, List[Any]] = {}
+    blobs: List[bytes] = []
+    offset = 0
+    for name, data in _sections(index).items():
+        raw = data.tobytes() if isinstance(data, array) else data
+        layout[name] = [offset, len(raw), "I" if isinstance(data, array) else "B"]
+        pad = -len(raw) % ALIGN
+        blobs.append(raw + b"\0" * pad)
+        offset += len(raw) + pad
+
+    header = json.dumps({
+        "format": FORMAT_VERSION,
+        "stamp": stamp,
+        "byteorder": sys.byteorder,
+        "scan_depth": index.scan_depth,
+        "entries": len(index.entries),
+        "sections": layout,
+    }).encode("utf-8")
+    head = MAGIC + struct.pack("<I", len(header)) + header
+    head += b"\0" * (-len(head) % ALIGN)
+
+    # 2. 原子替换
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(head)
+        for blob in blobs:
+            f.write(blob)
+    os.replace(tmp, path)
+    return len(head) + offset
+
+
+# --- 读 ---
+class MappedAhoCorasick:
+    """从压平的数组上直接跑的自动机 (出边按字符码二分查找)"""
+    __slots__ = ("_edge_start", "_edge_char", "_edge_target", "_fail", "_out_start", "_out_values", "_root")
+
+    def __init__(self, edge_start, edge_char, edge_target, fail, out_start, out_values):
+        self._edge_start = edge_start
+        self._edge_char = edge_char
+        self._edge_target = edge_target
+        self._fail = fail
+        self._out_start = out_start
+        self._out_values = out_values
+        # 大部分字符匹配不上任何关键词，一直停在根节点：根的出边单独做成 dict
+        lo, hi = edge_start[0], edge_start[1]
+        self._root = dict(zip(edge_char[lo:hi], edge_target[lo:hi]))
+
+    def search(self, text: str) -> Set[int]:
+        """和 AhoCorasick.search 一样：扫描一遍文本，返回所有命中模式的值"""
+        edge_start, edge_char, edge_target = self._edge_start, self._edge_char, self._edge_target
+        fail, out_start, out_values, root = self._fail, self._out_start, self._out_values, self._root
+        found: Set[int] = set()
+        node = 0
+        for ch in text:
+            code = ord(ch)
+            while node:
+                lo, hi = edge_start[node], edge_start[node + 1]
+                # 字典树深处大多只有一条出边，不用二分；叶子节点直接走失配指针
+                if hi - lo == 1:
+                    if edge_char[lo] == code:
+                        node = edge_target[lo]
+                        break
+                elif hi != lo:
+                    i = bisect_left(edge_char, code, lo, hi)
+                    if i < hi and edge_char[i] == code:
+                        node = edge_target[i]
+                        break
+                node = fail[node]
+            else:
+                node = root.get(code, 0)
+            start, end = out_start[node], out_start[node + 1]
+            if start != end:
+                found.update(out_values[start:end])
+        return found
+
+    def __len__(self) -> int:
+        return len(self._fail)
+
+
+class MappedEntry:
+    """词条表里的一条 (只读)，字段用到时才从文件里解码"""
+    __slots__ = ("_index", "_fields")
+    enabled = True
+
+    def __init__(self, index: "MappedWorldInfoIndex", fields):
+        self._index = index
+        self._fields = fields
+
+    content = property(lambda self: self._index.string(self._fields[0]) or "")
+    name = property(lambda self: self._index.string(self._fields[1]))
+    position = property(lambda self: self._index.string(self._fields[2]))
+    constant = property(lambda self: bool(self._fields[3] & FLAG_CONSTANT))
+    selective = property(lambda self: bool(self._fields[3] & FLAG_SELECTIVE))
+    case_sensitive = property(lambda self: bool(self._fields[3] & FLAG_CASE_SENSITIVE))
+    insertion_order = property(lambda self: self._fields[4])
+    keys = property(lambda self: self._index.strings(self._fields[5], self._fields[6]))
+    secondary_keys = property(lambda self: self._index.strings(self._fields[7], self._fields[8]))
+
+
+class MappedEntries(Sequence):
+    """index.entries 的只读视图 (按下标取词条，不预先建对象)"""
+
+    def __init__(self, index: "MappedWorldInfoIndex", count: int):
+        self._index = index
+        self._count = count
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(self._count))]
+        if i < 0:
+            i += self._count
+        if not 0 <= i < self._count:
+            raise IndexError(i)
+        return MappedEntry(self._index, ENTRY.unpack_from(self._index._entry_data, i * ENTRY.size))
+
+
+class MappedWorldInfoIndex(WorldInfoIndex):
+    """从 mmap 的文件上直接用的世界书索引；扫描 / 激活 / 渲染和 WorldInfoIndex 共用同一套逻辑"""
+
+    def __init__(self, buffer: mmap.mmap, header: Dict[str, Any], data_start: int):
+        self._buffer = buffer
+        self.size = len(buffer)
+        view = memoryview(buffer)
+        sections = {
+            name: view[data_start + offset:data_start + offset + size].cast(code)
+            for name, (offset, size, code) in header["sections"].items()
+        }
+        self._str_offsets = sections["str_offsets"]
+        self._str_data = sections["str_data"]
+        self._entry_data = sections["entries"]
+        self._keys = sections["keys"]
+
+        self.scan_depth = header["scan_depth"]
+        self.entries = MappedEntries(self, header["entries"])
+        self.constant_ids = frozenset(sections["constant"])
+        self.selective_ids = frozenset(sections["selective"])
+        self._sensitive = self._automaton(sections, "ac_s")
+        self._insensitive = self._automaton(sections, "ac_i")
+        self._content_hits = {}
+
+    @staticmethod
+    def _automaton(sections: Dict[str, memoryview], prefix: str) -> Optional[MappedAhoCorasick]:
+        if f"{prefix}_fail" not in sections:
+            return None
+        return MappedAhoCorasick(*(sections[f"{prefix}_{name}"] for name in AC_TABLES))
+
+    def string(self, sid: int) -> Optional[str]:
+        if sid == NO_STRING:
+            return None
+        return str(self._str_data[self._str_offsets[sid]:self._str_offsets[sid + 1]], "utf-8")
+
+    def strings(self, start: int, end: int) -> List[str]:
+        return [self.string(sid) for sid in self._keys[start:end]]
+
+
+def open_artifact(path: str, stamp: str) -> Optional[MappedWorldInfoIndex]:
+    """只读映射编译好的文件；没有文件、格式或版本戳对不上时返回 None"""
+    try:
+        f = open(path, "rb")
+    except OSError:
+        return None
+    with f:
+        head = f.read(8)
+        if len(head) < 8 or head[:4] != MAGIC:
+            return None
+        (length,) = struct.unpack("<I", head[4:])
+        try:
+            header = json.loads(f.read(length))
+        except ValueError:
+            return None
+        if (
+            header.get("format") != FORMAT_VERSION
+            or header.get("stamp") != stamp
+            or header.get("byteorder") != sys.byteorder
+        ):
+            return None
+        # 文件关掉之后映射仍然有效；别的进程改名替换文件也不影响已经映射的旧内容
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    data_start = 8 + length + (-(8 + length) % ALIGN)
+    return MappedWorldInfoIndex(buffer, header, data_start)
+
+
+def build_artifact(lorebook: Lorebook, lorebook_id: Hashable, version: Any) -> WorldInfoIndex:
+    """
+    编译世界书并写成文件，返回映射好的索引。
+    目录不可写时退回内存里的 WorldInfoIndex (功能不受影响，只是不能跨进程共享)。
+    """
+    index = WorldInfoIndex(lorebook)
+    path, stamp = artifact_path(lorebook_id), str(version)
+    try:
+        write_artifact(index, path, stamp)
+    except OSError:
+        return index
+    return open_artifact(path, stamp) or index
+
+
+def load_index(lorebook_id: Hashable, version: Any) -> Optional[MappedWorldInfoIndex]:
+    """已经编译好的文件 (版本对得上) 直接映射，否则返回 None"""
+    return open_artifact(artifact_path(lorebook_id), str(version))
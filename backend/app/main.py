@@ -1,15 +1,37 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
-from app.core.database import Base, engine
+from fastapi.concurrency import run_in_threadpool
+from app.core import config, llm
+from app.core.metrics import TimingMiddleware
+from app.core.migrations import migrate
+from app.modules.chat.summary import summary_queue
+from app.modules.importer import service as import_service
+from app.core.database import engine
 
 # 引入刚才写的三个路由文件
-from app.api.endpoints import character, preset, lorebook, chat
+from app.api.endpoints import character, preset, lorebook, chat, chat_session, importer, metrics
 
-# 1. 初始化数据库表
-#这一步会检查 models 定义，如果数据库里没表，它会自动创建
-Base.metadata.create_all(bind=engine)
+# 1. 应用生命周期：启动时初始化，关闭时释放
+#    导入这个模块本身不碰数据库 / 网络，脚本和测试导入 app 很快
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 数据库结构迁移：已是最新版本时只查一次 user_version (见 core/migrations.py)
+    await run_in_threadpool(migrate, engine)
+    # 上游 LLM 连接池
+    await llm.startup()
+    # 后台历史总结 (上次没跑完的任务会重新入队)
+    if config.SUMMARY_ENABLED:
+        await summary_queue.start()
+    yield
+    await summary_queue.stop()
+    await llm.shutdown()
+    # 批量导入用的进程池 (用过才会创建)
+    import_service.shutdown_pool()
 
 # 2. 创建 APP 实例
-app = FastAPI(title="SillyTavern Python Backend")
+app = FastAPI(title="SillyTavern Python Backend", lifespan=lifespan)
+# 每个请求的耗时 / 状态码，响应头带 Server-Timing (见 core/metrics.py)
+app.add_middleware(TimingMiddleware)
 
 # 3. 注册路由
 # prefix 意思是：访问这个模块的网址都要加上 /api/xxx
@@ -18,6 +40,12 @@ app.include_router(preset.router, prefix="/api/preset", tags=["Presets"])
 app.include_router(lorebook.router, prefix="/api/lorebook", tags=["Lorebook"])
 # 2. 新增注册 chat 路由
 app.include_router(chat.router, prefix="/api/chat", tags=["Chat"])
+# 服务端保存的聊天 (会话 + 消息)
+app.include_router(chat_session.router, prefix="/api/chat/sessions", tags=["Chat Sessions"])
+# 批量导入
+app.include_router(importer.router, prefix="/api/import", tags=["Import"])
+# Prometheus 指标
+app.include_router(metrics.router, tags=["Metrics"])
 @app.get("/")
 def root():
     return {"message": "System Operational. Welcome home, traveler."}
\ No newline at end of file
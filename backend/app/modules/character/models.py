@@ -1,5 +1,7 @@
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, DateTime, JSON
+from sqlalchemy import Column, Integer, String, DateTime, Index
+from sqlalchemy.orm import deferred
+from app.core.blob import CompressedJSON
 from app.core.database import Base
 
 class CharacterModel(Base):
@@ -14,12 +16,17 @@ class CharacterModel(Base):
     creator = Column(String, index=True, nullable=True, comment="作者")
     
     # 核心数据 (存刚才那个复杂的 JSON)
-    # 注意：在 SQLite 中 JSON 类型会自动变通存储，PostgreSQL 则有原生支持
-    data = Column(JSON, nullable=False, comment="完整角色卡数据")
+    # 压缩存储 + 延迟加载：列表 / 搜索只用上面的索引字段，不会读出这一列
+    data = deferred(Column(CompressedJSON, nullable=False, comment="完整角色卡数据"))
     
     # 头像路径 (之后做图片上传用)
     avatar_path = Column(String, nullable=True)
 
     # 时间戳
     create_date = Column(DateTime, default=datetime.now)
-    update_date = Column(DateTime, default=datetime.now, onupdate=datetime.now)
\ No newline at end of file
+    update_date = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+
+    __table_args__ = (
+        # 列表按创建时间分页 (name / creator 已有单列索引，SQLite 索引里自带 rowid，等价于 (列, id))
+        Index('ix_characters_create_date', 'create_date'),
+    )
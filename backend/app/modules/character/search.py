@@ -0,0 +1,109 @@
+"""
+角色卡全文搜索 (SQLite FTS5)
+
+characters_fts 只存倒排索引 (content='')，不重复保存正文；
+写入角色卡时由 service 层同步写索引 (单张上传和批量导入都走这里)。
+
+FTS5 自带的 unicode61 分词不会切中文，一整句中文会被当成一个词。
+所以写入和查询前都把 CJK 字符两边加上空格 (按字建索引)，
+查询时把每个词当成短语 ("魔 法" 要求两个字相邻)，任意长度的中文都能搜到。
+"""
+import re
+from typing import Any, Dict, Iterable, List, Optional
+
+from sqlalchemy import select, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.modules.character.models import CharacterModel
+
+FTS_TABLE = "characters_fts"
+
+CREATE_FTS = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} "
+    "USING fts5(name, tags, creator, description, content='', tokenize='unicode61 remove_diacritics 2')"
+)
+
+INSERT_FTS = text(
+    f"INSERT INTO {FTS_TABLE}(rowid, name, tags, creator, description) "
+    "VALUES (:rowid, :name, :tags, :creator, :description)"
+)
+
+# 列权重：名字 > 标签 > 作者 > 简介
+BM25 = f"bm25({FTS_TABLE}, 10.0, 5.0, 2.0, 1.0)"
+
+# 命中数超过这个值就不按相关度排序 (给每一行算 bm25 再排序，5 万行要几十毫秒)
+RANK_MAX_HITS = 20000
+
+_CJK = re.compile(r"([぀-ヿ㐀-䶿一-鿿가-힯豈-﫿])")
+_QUOTE = re.compile(r'["*^:()]')
+
+
+def fts_text(value: str) -> str:
+    """CJK 字符按字切开"""
+    return _CJK.sub(r" \1 ", value or "")
+
+
+def search_fields(data: Dict[str, Any]) -> Dict[str, str]:
+    """从完整卡片 JSON 里取出要建索引的字段"""
+    card = data.get("data") or {}
+    tags = card.get("tags") or []
+    return {
+        "name": fts_text(str(card.get("name") or "")),
+        "tags": fts_text(" ".join(str(t) for t in tags)),
+        "creator": fts_text(str(card.get("creator") or "")),
+        "description": fts_text(str(card.get("description") or "")),
+    }
+
+
+def fts_query(q: str) -> Optional[str]:
+    """
+    把用户输入转成安全的 FTS5 查询：每个词一个短语，词之间是 AND；
+    最后一个词不是中文时按前缀匹配 (边输边搜)。去掉 FTS5 语法字符，避免语法错误。
+    """
+    phrases: List[str] = []
+    for word in _QUOTE.sub(" ", q or "").split():
+        tokens = fts_text(word).split()
+        if tokens:
+            phrases.append('"' + " ".join(tokens) + '"')
+    if not phrases:
+        return None
+    if not _CJK.search(phrases[-1][-2]):
+        phrases[-1] += "*"
+    return " ".join(phrases)
+
+
+def _params(rows: Iterable[Any]) -> List[Dict[str, Any]]:
+    return [{"rowid": row.id, **search_fields(row.data)} for row in rows]
+
+
+async def index_rows(db: AsyncSession, rows: List[CharacterModel]) -> None:
+    """新角色卡写入索引 (需要已经 flush 拿到 ID，和插入同一个事务)"""
+    if rows:
+        await db.execute(INSERT_FTS, _params(rows))
+
+
+def _backfill(conn: Connection, batch_size: int = 500) -> None:
+    result = conn.execution_options(yield_per=batch_size).execute(
+        select(CharacterModel.id, CharacterModel.data)
+    )
+    for part in result.partitions():
+        conn.execute(INSERT_FTS, _params(part))
+
+
+def ensure_search_schema(bind: Engine) -> None:
+    """
+    启动时调用：补上列表分页用的索引和 FTS 表。
+    FTS 表是第一次创建时，把已有的角色卡全部补进索引。
+    """
+    with bind.begin() as conn:
+        for index in CharacterModel.__table__.indexes:
+            index.create(conn, checkfirst=True)
+
+        exists = conn.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"), {"name": FTS_TABLE}
+        ).first()
+        if exists:
+            return
+        conn.execute(text(CREATE_FTS))
+        _backfill(conn)
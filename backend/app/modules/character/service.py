@@ -1,29 +1,162 @@
-from sqlalchemy.orm import Session
+from datetime import datetime
+from typing import List, Optional, Tuple
+from sqlalchemy import and_, func, literal_column, null, or_, select, table, text, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from fastapi.concurrency import run_in_threadpool
+from app.core import model_cache
+from app.core.pagination import decode_cursor, encode_cursor
+from app.core.regex_scripts import quarantine_scripts
+from app.modules.character import search
 from app.modules.character.models import CharacterModel
+from app.modules.importer import fingerprint
 from app.schemas.character import TavernCardV3
 
-def create_character(db: Session, raw_json: dict):
+def row_fields(raw_json: dict) -> dict:
+    """校验并提取索引字段 (不碰数据库，批量导入的工作进程里也用它)"""
     # 1. 用模具检查数据 (如果不合格会自动报错)
     card = TavernCardV3(**raw_json)
-    
+
     # 2. 提取要写在索引卡上的信息 (名字、作者)
     # 注意：V3 标准里名字通常在 data.name
-    char_name = card.data.name
-    char_creator = card.data.creator
-    
-    # 3. 打包入库
+    return {"name": card.data.name, "creator": card.data.creator}
+
+async def create_character(db: AsyncSession, raw_json: dict, source: Optional[dict] = None):
+    """source 是上传的原始 JSON (raw_json 是校验后补全了默认值的)，内容指纹按它算，和批量导入一致"""
+    # 1. 检查 + 提取索引字段；会灾难性回溯的正则脚本直接标记隔离
+    fields = row_fields(raw_json)
+    await run_in_threadpool(quarantine_scripts, raw_json)
+
+    # 2. 打包入库
     db_obj = CharacterModel(
-        name=char_name,
-        creator=char_creator,
+        **fields,
         data=raw_json,  # 原样存入完整 JSON
         # avatar_path 暂时留空，以后做图片上传再填
     )
     
     db.add(db_obj)
-    db.commit()
-    db.refresh(db_obj) # 刷新一下，拿回数据库生成的 ID
+    await db.flush() # 先拿到 ID，和搜索索引、内容指纹在同一个事务里提交
+    await search.index_rows(db, [db_obj])
+    await fingerprint.record(db, "character", await run_in_threadpool(fingerprint.content_hash, source or raw_json), db_obj.id)
+    await db.commit()
+    await db.refresh(db_obj)
+    model_cache.invalidate(CharacterModel.__tablename__, db_obj.id)
     return db_obj
 
-def get_character(db: Session, char_id: int):
+async def get_character(db: AsyncSession, char_id: int):
     # 去仓库找 ID 对应的货
-    return db.query(CharacterModel).filter(CharacterModel.id == char_id).first()
\ No newline at end of file
+    return await db.get(CharacterModel, char_id)
+
+async def load_schema(db_obj: CharacterModel) -> TavernCardV3:
+    """把数据库行还原成校验过的角色卡对象 (按版本缓存，只读；没命中才读出 data)"""
+    return await model_cache.load_validated(
+        CharacterModel.__tablename__, db_obj, lambda raw: TavernCardV3(**raw)
+    )
+
+# 列表 / 搜索只查这些列，永远不读 data (完整 JSON)
+SUMMARY_COLUMNS = (
+    CharacterModel.id,
+    CharacterModel.name,
+    CharacterModel.creator,
+    CharacterModel.avatar_path,
+    CharacterModel.create_date,
+    CharacterModel.update_date,
+)
+
+SORT_COLUMNS = {
+    "name": CharacterModel.name,
+    "creator": CharacterModel.creator,
+    "create_date": CharacterModel.create_date,
+}
+
+def _after(column, value, last_id: int, desc: bool):
+    """
+    keyset 条件：排在 (value, last_id) 之后的行。
+    SQLite 里 NULL 最小 (升序排最前，降序排最后)，所以 NULL 要单独处理。
+    """
+    if not desc:
+        if value is None:
+            return or_(and_(column.is_(None), CharacterModel.id > last_id), column.is_not(None))
+        return tuple_(column, CharacterModel.id) > tuple_(value, last_id)
+    if value is None:
+        return and_(column.is_(None), CharacterModel.id < last_id)
+    return or_(tuple_(column, CharacterModel.id) < tuple_(value, last_id), column.is_(None))
+
+async def list_characters(
+    db: AsyncSession,
+    sort: str = "create_date",
+    desc: bool = False,
+    limit: int = 50,
+    cursor: Optional[str] = None,
+) -> Tuple[List, Optional[str]]:
+    """按 name / creator / create_date 分页列出角色卡摘要，返回 (本页, 下一页游标)"""
+    column = SORT_COLUMNS[sort]
+    stmt = select(*SUMMARY_COLUMNS)
+
+    last = decode_cursor(cursor)
+    if last is not None:
+        value, last_id = last
+        if sort == "create_date" and value is not None:
+            value = datetime.fromisoformat(value)
+        stmt = stmt.where(_after(column, value, last_id, desc))
+
+    if desc:
+        stmt = stmt.order_by(column.desc(), CharacterModel.id.desc())
+    else:
+        stmt = stmt.order_by(column, CharacterModel.id)
+    rows = (await db.execute(stmt.limit(limit))).all()
+
+    next_cursor = None
+    if len(rows) == limit:
+        tail = rows[-1]
+        next_cursor = encode_cursor(getattr(tail, sort), tail.id)
+    return rows, next_cursor
+
+async def search_characters(
+    db: AsyncSession,
+    q: str,
+    limit: int = 50,
+    cursor: Optional[str] = None,
+) -> Tuple[List, Optional[str]]:
+    """
+    全文搜索名字 / 标签 / 作者 / 简介，按相关度排序，游标是 (得分, id)。
+    命中数超过 RANK_MAX_HITS 时 (几乎每张卡都有的词) 不算相关度，按 id 顺序返回，游标是 (None, id)。
+    """
+    match = search.fts_query(q)
+    if match is None:
+        return [], None
+    where_match = text(f"{search.FTS_TABLE} MATCH :match").bindparams(match=match)
+
+    # 1. 决定排序方式：第一页数一下命中数，之后沿用游标里的方式
+    last = decode_cursor(cursor)
+    if last is None:
+        total = await db.scalar(
+            select(func.count()).select_from(table(search.FTS_TABLE)).where(where_match)
+        )
+        ranked = total <= search.RANK_MAX_HITS
+    else:
+        ranked = last[0] is not None
+
+    # 2. 命中的 rowid (+ 得分) 作为子查询，再只取摘要列
+    score = literal_column(search.BM25) if ranked else null()
+    hits = (
+        select(literal_column("rowid").label("id"), score.label("score"))
+        .select_from(table(search.FTS_TABLE))
+        .where(where_match)
+        .subquery("hits")
+    )
+    stmt = select(*SUMMARY_COLUMNS, hits.c.score).join(hits, hits.c.id == CharacterModel.id)
+
+    # 3. keyset 分页
+    if last is not None:
+        last_score, last_id = last
+        if ranked:
+            stmt = stmt.where(tuple_(hits.c.score, hits.c.id) > tuple_(last_score, last_id))
+        else:
+            stmt = stmt.where(hits.c.id > last_id)
+    order = (hits.c.score, hits.c.id) if ranked else (hits.c.id,)
+    rows = (await db.execute(stmt.order_by(*order).limit(limit))).all()
+
+    next_cursor = None
+    if len(rows) == limit:
+        next_cursor = encode_cursor(rows[-1].score, rows[-1].id)
+    return rows, next_cursor
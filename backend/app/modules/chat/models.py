@@ -0,0 +1,95 @@
+from datetime import datetime
+from sqlalchemy import Column, Integer, String, Text, DateTime, JSON, ForeignKey, Index
+from app.core.database import Base
+
+class ChatModel(Base):
+    # 一个聊天 (会话)：绑定角色卡 / 预设 / 世界书
+    __tablename__ = 'chats'
+
+    id = Column(Integer, primary_key=True, index=True)
+
+    char_id = Column(Integer, ForeignKey('characters.id'), index=True, nullable=False)
+    preset_id = Column(Integer, ForeignKey('presets.id'), nullable=False)
+    lorebook_id = Column(Integer, ForeignKey('lorebooks.id'), nullable=True)
+
+    user_name = Column(String, default="User", comment="用户称呼 ({{user}})")
+
+    # 统计：消息条数、所有消息的 token 总数 (下一条消息的 token_offset)
+    message_count = Column(Integer, default=0, nullable=False)
+    token_total = Column(Integer, default=0, nullable=False)
+
+    # {{setvar}} 写入的聊天变量，跨轮保留
+    variables = Column(JSON, default=dict, comment="聊天变量")
+
+    create_date = Column(DateTime, default=datetime.now)
+    update_date = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+
+class GlobalVariableModel(Base):
+    # {{setglobalvar}} 写入的全局变量：所有聊天共享，跨轮保留
+    # 一个变量一行，不同聊天同时改不同的变量不会互相覆盖
+    __tablename__ = 'global_variables'
+
+    name = Column(String, primary_key=True)
+    value = Column(JSON, nullable=True)
+
+    update_date = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+
+class ChatMessageModel(Base):
+    # 聊天消息：只追加，不修改
+    __tablename__ = 'chat_messages'
+
+    id = Column(Integer, primary_key=True)
+    chat_id = Column(Integer, ForeignKey('chats.id'), nullable=False)
+
+    role = Column(String, nullable=False)
+    content = Column(Text, nullable=False)
+
+    # token 数，以及这条消息之前所有消息的 token 总和 (前缀和)
+    # 取「最近 N 个 token 的历史」时直接按 token_offset 范围查询
+    token_count = Column(Integer, nullable=False, default=0)
+    token_offset = Column(Integer, nullable=False, default=0)
+
+    create_date = Column(DateTime, default=datetime.now)
+
+    __table_args__ = (
+        # 按聊天翻页 (keyset 分页)
+        Index('ix_chat_messages_chat_id_id', 'chat_id', 'id'),
+        # 按 token 预算取窗口
+        Index('ix_chat_messages_chat_id_offset', 'chat_id', 'token_offset'),
+    )
+
+class ChatSummaryModel(Base):
+    # 聊天较早部分的总结：覆盖 id <= up_to_id 的所有消息
+    # 新的总结在旧总结的基础上滚动生成 (包含旧的)，拼装时只用最新的一条
+    __tablename__ = 'chat_summaries'
+
+    id = Column(Integer, primary_key=True)
+    chat_id = Column(Integer, ForeignKey('chats.id'), nullable=False)
+
+    up_to_id = Column(Integer, nullable=False, comment="覆盖到哪条消息 (含)")
+    # 被覆盖的消息的 token 总数 (= 下一条消息的 token_offset)
+    covered_tokens = Column(Integer, nullable=False, default=0)
+
+    content = Column(Text, nullable=False)
+    token_count = Column(Integer, nullable=False, default=0)
+
+    create_date = Column(DateTime, default=datetime.now)
+
+    __table_args__ = (
+        # 取最新的一条
+        Index('ix_chat_summaries_chat_id_id', 'chat_id', 'id'),
+    )
+
+class SummaryJobModel(Base):
+    # 排队中的总结任务：每个聊天最多一条 (重复触发合并成一条)，跑完删除
+    # 进程重启后 pending / running 的任务重新入队
+    __tablename__ = 'summary_jobs'
+
+    chat_id = Column(Integer, ForeignKey('chats.id'), primary_key=True)
+
+    status = Column(String, nullable=False, default="pending", comment="pending / running / failed")
+    attempts = Column(Integer, nullable=False, default=0)
+    error = Column(Text, nullable=True)
+
+    create_date = Column(DateTime, default=datetime.now)
+    update_date = Column(DateTime, default=datetime.now, onupdate=datetime.now)
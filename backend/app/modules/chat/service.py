@@ -0,0 +1,173 @@
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select, update
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core import config, semantic_memory
+from app.core.tokenizer import count_message, get_tokenizer
+from app.modules.chat.models import ChatModel, ChatMessageModel, ChatSummaryModel, GlobalVariableModel
+
+async def create_chat(
+    db: AsyncSession,
+    char_id: int,
+    preset_id: int,
+    lorebook_id: Optional[int] = None,
+    user_name: str = "User",
+    greeting: str = "",
+):
+    db_obj = ChatModel(
+        char_id=char_id,
+        preset_id=preset_id,
+        lorebook_id=lorebook_id,
+        user_name=user_name,
+        variables={},
+    )
+    db.add(db_obj)
+    await db.commit()
+    await db.refresh(db_obj)
+
+    # 角色卡的开场白作为第一条 AI 消息
+    if greeting:
+        await append_message(db, db_obj.id, "assistant", greeting)
+        await db.refresh(db_obj)
+    return db_obj
+
+async def get_chat(db: AsyncSession, chat_id: int):
+    return await db.get(ChatModel, chat_id)
+
+async def append_message(db: AsyncSession, chat_id: int, role: str, content: str):
+    """追加一条消息，同时更新聊天的 token 前缀和"""
+    tokens = count_message(get_tokenizer(), content)
+
+    # 1. 先原子地把总数加上去 (UPDATE ... RETURNING)，拿到新总数
+    #    写锁在这一步就拿到了，并发追加也不会读到旧的总数
+    result = await db.execute(
+        update(ChatModel)
+        .where(ChatModel.id == chat_id)
+        .values(
+            token_total=ChatModel.token_total + tokens,
+            message_count=ChatModel.message_count + 1,
+        )
+        .returning(ChatModel.token_total)
+    )
+    new_total = result.scalar_one()
+
+    # 2. 插入消息，offset = 加之前的总数
+    db_obj = ChatMessageModel(
+        chat_id=chat_id,
+        role=role,
+        content=content,
+        token_count=tokens,
+        token_offset=new_total - tokens,
+    )
+    db.add(db_obj)
+    await db.commit()
+    await db.refresh(db_obj)
+
+    # 3. 增量写入聊天的向量索引 (语义召回用)
+    if config.VECTOR_ENABLED:
+        await run_in_threadpool(semantic_memory.index_messages, chat_id, [(db_obj.id, content)])
+    return db_obj
+
+async def list_messages(db: AsyncSession, chat_id: int, before_id: Optional[int] = None, limit: int = 50):
+    """
+    keyset 分页：从新到旧返回 id < before_id 的最多 limit 条。
+    不用 OFFSET，翻到多深都只走索引。
+    """
+    stmt = select(ChatMessageModel).where(ChatMessageModel.chat_id == chat_id)
+    if before_id is not None:
+        stmt = stmt.where(ChatMessageModel.id < before_id)
+    stmt = stmt.order_by(ChatMessageModel.id.desc()).limit(limit)
+    return list((await db.execute(stmt)).scalars())
+
+async def load_window(
+    db: AsyncSession, chat: ChatModel, token_budget: int, summary: Optional[ChatSummaryModel] = None
+) -> List[Dict[str, Any]]:
+    """
+    只取 token 预算内的最近消息 (按时间正序)，每条带上消息 id。
+    后缀 [k:] 的 token 数 = token_total - offset[k]，要求 <= token_budget，
+    即 offset[k] >= token_total - token_budget，直接走 (chat_id, token_offset) 索引。
+    有总结时，总结覆盖的消息 (offset < covered_tokens) 不再取出。
+    """
+    need = chat.token_total - max(token_budget, 0)
+    if summary is not None:
+        need = max(need, summary.covered_tokens)
+    stmt = (
+        select(ChatMessageModel.id, ChatMessageModel.role, ChatMessageModel.content)
+        .where(ChatMessageModel.chat_id == chat.id, ChatMessageModel.token_offset >= need)
+        .order_by(ChatMessageModel.id)
+    )
+    return [{"id": id_, "role": role, "content": content} for id_, role, content in await db.execute(stmt)]
+
+async def latest_summary(db: AsyncSession, chat_id: int) -> Optional[ChatSummaryModel]:
+    """最新的一条历史总结 (包含之前所有的总结)"""
+    stmt = (
+        select(ChatSummaryModel)
+        .where(ChatSummaryModel.chat_id == chat_id)
+        .order_by(ChatSummaryModel.id.desc())
+        .limit(1)
+    )
+    return (await db.execute(stmt)).scalar_one_or_none()
+
+async def index_history(db: AsyncSession, chat: ChatModel) -> None:
+    """
+    补建聊天的向量索引 (功能上线前的旧消息，或者换了嵌入模型之后)。
+    只查上次补建到的消息之后的 (索引 meta 里的 indexed_up_to)：空消息不进索引，不能拿条数判断有没有补全，
+    不然有一条空消息之后每轮都要把整个聊天记录查一遍
+    """
+    store = await run_in_threadpool(semantic_memory.get_chat_store, chat.id)
+    last = store.meta.get("indexed_up_to", 0)
+    stmt = (
+        select(ChatMessageModel.id, ChatMessageModel.content)
+        .where(ChatMessageModel.chat_id == chat.id, ChatMessageModel.id > last)
+        .order_by(ChatMessageModel.id)
+    )
+    rows = (await db.execute(stmt)).all()
+    if not rows:
+        return
+    missing = [(id_, content) for id_, content in rows if id_ not in store]
+    await run_in_threadpool(semantic_memory.index_messages, chat.id, missing, rows[-1].id)
+
+async def recall_messages(db: AsyncSession, chat: ChatModel, window: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    语义召回历史窗口之前的旧消息 (窗口里的消息本来就会发给模型)。
+    返回 [{"id", "role", "content", "score"}]，按时间正序。
+    """
+    if not window:
+        return []
+    await index_history(db, chat)
+    hits = await run_in_threadpool(semantic_memory.recall_messages, chat.id, window, window[0]["id"])
+    if not hits:
+        return []
+    scores = dict(hits)
+    stmt = (
+        select(ChatMessageModel.id, ChatMessageModel.role, ChatMessageModel.content)
+        .where(ChatMessageModel.id.in_(list(scores)))
+        .order_by(ChatMessageModel.id)
+    )
+    return [
+        {"id": id_, "role": role, "content": content, "score": scores[id_]}
+        for id_, role, content in await db.execute(stmt)
+    ]
+
+async def save_variables(db: AsyncSession, chat: ChatModel, variables: Dict):
+    """拼装时 {{setvar}} 改过的变量写回聊天"""
+    chat.variables = dict(variables)
+    await db.commit()
+
+async def load_global_variables(db: AsyncSession) -> Dict[str, Any]:
+    """所有全局变量 ({{getglobalvar}})"""
+    rows = await db.execute(select(GlobalVariableModel.name, GlobalVariableModel.value))
+    return {name: value for name, value in rows}
+
+async def save_global_variables(db: AsyncSession, before: Dict[str, Any], after: Dict[str, Any]):
+    """拼装时 {{setglobalvar}} 改过的全局变量写回：只写改过的那几个 (别的聊天可能同时在改其他变量)"""
+    changed = [{"name": k, "value": v} for k, v in after.items() if k not in before or before[k] != v]
+    if not changed:
+        return
+    stmt = insert(GlobalVariableModel).values(changed)
+    await db.execute(stmt.on_conflict_do_update(
+        index_elements=["name"], set_={"value": stmt.excluded.value, "update_date": datetime.now()},
+    ))
+    await db.commit()
@@ -0,0 +1,317 @@
+"""
+后台历史总结
+
+长聊天超出上下文之后，较早的消息只能被裁掉。这里提前在后台把较早的部分总结成一段文字，
+拼装时用最新的总结代替它覆盖的那些消息 (见 ContextAssembler 的 summary 参数)。
+
+- 触发：每轮回复保存后检查一次 (maybe_enqueue)：还没被总结覆盖的 token 超过
+  openai_max_context * SUMMARY_TRIGGER_RATIO 时排一个任务。只查两行，不等模型。
+- 合并：每个聊天最多一个任务 (内存里的集合 + summary_jobs 的主键)；
+  任务运行中又被触发时，跑完再排一次。
+- 并发：SUMMARY_CONCURRENCY 个 worker 协程，应用启动时创建 (见 main.py 的 lifespan)。
+- 持久化：任务落在 summary_jobs 表里，跑完删除；重启时 pending / running 的重新入队。
+  失败的任务标成 failed，SUMMARY_RETRY_SECONDS 之后才会被再次触发。
+- 滚动总结：上一份总结 + 接下来一段原文 (每次最多 SUMMARY_CHUNK_TOKENS) -> 新的总结，
+  一直追到最近 SUMMARY_KEEP_RATIO 的上下文之前 (这部分保持原文)。
+"""
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Set
+
+from sqlalchemy import delete, select, update
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core import config, llm
+from app.core.database import AsyncSessionLocal
+from app.core.tokenizer import count_message, get_tokenizer
+from app.modules.character import service as char_service
+from app.modules.chat import service as chat_service
+from app.modules.chat.models import ChatMessageModel, ChatModel, ChatSummaryModel, SummaryJobModel
+from app.modules.preset import service as preset_service
+from app.schemas.preset import SillyTavernPreset
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_PROMPT = (
+    "You keep a running summary of a roleplay chat between {user} and {char}. "
+    "Rewrite the summary so that it also covers the new messages. "
+    "Keep names, facts, relationships, promises and unresolved plot threads; drop small talk. "
+    "Write in the language of the chat, in past tense, as plain prose without any commentary."
+)
+
+
+def trigger_tokens(preset: SillyTavernPreset) -> int:
+    """未总结的历史超过这么多 token 时排任务"""
+    return int(preset.openai_max_context * config.SUMMARY_TRIGGER_RATIO)
+
+
+def keep_tokens(preset: SillyTavernPreset) -> int:
+    """最近这么多 token 的历史保持原文"""
+    available = max(preset.openai_max_context - preset.openai_max_tokens, 0)
+    return int(available * config.SUMMARY_KEEP_RATIO)
+
+
+def needs_summary(chat: ChatModel, summary: Optional[ChatSummaryModel], preset: SillyTavernPreset) -> bool:
+    covered = summary.covered_tokens if summary is not None else 0
+    return chat.token_total - covered >= trigger_tokens(preset)
+
+
+def build_messages(previous: str, rows, char_name: str, user_name: str) -> List[Dict[str, str]]:
+    """工具模型的输入：说明 + 上一份总结 + 新的原文 (按「名字: 内容」逐行)"""
+    names = {"user": user_name, "assistant": char_name}
+    transcript = "\n".join(f"{names.get(row.role, row.role)}: {row.content}" for row in rows)
+    parts = []
+    if previous:
+        parts.append(f"Summary so far:\n{previous}")
+    parts.append(f"New messages:\n{transcript}")
+    return [
+        {"role": "system", "content": SUMMARY_PROMPT.format(user=user_name, char=char_name)},
+        {"role": "user", "content": "\n\n".join(parts)},
+    ]
+
+
+async def _next_chunk(chat_id: int, covered: int, cutoff: int):
+    """
+    covered 之后、整条落在 cutoff 之前的消息，最多约 SUMMARY_CHUNK_TOKENS 个 token (至少一条)。
+    offset + count <= cutoff 随 offset 单调，取出来的一定是连续的一段。
+    """
+    async with AsyncSessionLocal() as db:
+        stmt = (
+            select(
+                ChatMessageModel.id, ChatMessageModel.role, ChatMessageModel.content,
+                ChatMessageModel.token_offset, ChatMessageModel.token_count,
+            )
+            .where(
+                ChatMessageModel.chat_id == chat_id,
+                ChatMessageModel.token_offset >= covered,
+                ChatMessageModel.token_offset < covered + max(config.SUMMARY_CHUNK_TOKENS, 1),
+                ChatMessageModel.token_offset + ChatMessageModel.token_count <= cutoff,
+            )
+            .order_by(ChatMessageModel.id)
+        )
+        return list(await db.execute(stmt))
+
+
+async def summarize_chat(chat_id: int) -> int:
+    """把聊天较早的部分滚动总结到最新，返回写了几份总结 (已经够新时为 0)"""
+    # 1. 读聊天、预设、角色名和最新的总结 (短事务，调模型时不占着数据库)
+    async with AsyncSessionLocal() as db:
+        chat = await db.get(ChatModel, chat_id)
+        if chat is None:
+            return 0
+        preset = await preset_service.get_preset(db, chat.preset_id)
+        char = await char_service.get_character(db, chat.char_id)
+        if preset is None or char is None:
+            return 0
+        preset_schema = await preset_service.load_schema(preset)
+        char_name = (await char_service.load_schema(char)).data.name or char.name
+        user_name = chat.user_name
+        summary = await chat_service.latest_summary(db, chat_id)
+        cutoff = chat.token_total - keep_tokens(preset_schema)
+
+    params = {"model": config.UTILITY_MODEL, "temperature": 0.3, "max_tokens": config.SUMMARY_MAX_TOKENS}
+    previous = summary.content if summary is not None else ""
+    covered = summary.covered_tokens if summary is not None else 0
+    written = 0
+
+    # 2. 一段一段往前追，每段写一份新总结 (中途失败时已经写好的不丢)
+    while covered < cutoff:
+        rows = await _next_chunk(chat_id, covered, cutoff)
+        if not rows:
+            break
+        content = (await llm.complete(
+            build_messages(previous, rows, char_name, user_name), params,
+            api_url=config.UTILITY_API_URL, api_key=config.UTILITY_API_KEY,
+        )).strip()
+        if not content:
+            raise llm.UpstreamError(502, "Empty summary from upstream")
+
+        last = rows[-1]
+        covered = last.token_offset + last.token_count
+        async with AsyncSessionLocal() as db:
+            db.add(ChatSummaryModel(
+                chat_id=chat_id,
+                up_to_id=last.id,
+                covered_tokens=covered,
+                content=content,
+                token_count=count_message(get_tokenizer(), content),
+            ))
+            await db.commit()
+        previous = content
+        written += 1
+    return written
+
+
+class SummaryQueue:
+    """进程内的总结任务队列：按聊天合并、限制并发、任务落库"""
+
+    def __init__(self):
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        # 排队中 / 运行中的聊天；运行中又被触发的记在 _again 里，跑完再排一次
+        self._pending: Set[int] = set()
+        self._running: Set[int] = set()
+        self._again: Set[int] = set()
+
+    @property
+    def running(self) -> bool:
+        return bool(self._workers)
+
+    async def start(self, concurrency: Optional[int] = None) -> None:
+        if self._workers:
+            return
+        self._queue = asyncio.Queue()
+
+        # 1. 上次没跑完的任务重新入队 (running 说明进程是在任务中途退出的)
+        async with AsyncSessionLocal() as db:
+            await db.execute(
+                update(SummaryJobModel).where(SummaryJobModel.status == "running").values(status="pending")
+            )
+            await db.commit()
+            stmt = (
+                select(SummaryJobModel.chat_id)
+                .where(SummaryJobModel.status == "pending")
+                .order_by(SummaryJobModel.create_date)
+            )
+            for chat_id in (await db.execute(stmt)).scalars():
+                self._pending.add(chat_id)
+                self._queue.put_nowait(chat_id)
+
+        # 2. worker 协程
+        count = max(concurrency or config.SUMMARY_CONCURRENCY, 1)
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(count)]
+
+    async def stop(self) -> None:
+        """取消 worker；正在跑的任务在库里还是 running，下次启动时重新入队"""
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._queue = None
+        self._pending.clear()
+        self._running.clear()
+        self._again.clear()
+
+    async def join(self) -> None:
+        """等队列里的任务都跑完 (脚本 / 测试用)"""
+        if self._queue is not None:
+            await self._queue.join()
+
+    async def enqueue(self, chat_id: int) -> bool:
+        """
+        排一个总结任务，返回是否新排了任务。
+        已经在排队的直接合并；运行中的跑完再排一次；刚失败过的在冷却期内不排。
+        worker 没启动时 (脚本) 只落库，下次启动时再跑。
+        """
+        if chat_id in self._pending:
+            return False
+        if chat_id in self._running:
+            self._again.add(chat_id)
+            return False
+
+        # 先占位再落库：落库期间同一个聊天再触发也会被合并
+        self._pending.add(chat_id)
+        try:
+            queued = await self._persist(chat_id)
+        except Exception:
+            self._pending.discard(chat_id)
+            raise
+        if not queued or self._queue is None:
+            self._pending.discard(chat_id)
+            return queued
+        self._queue.put_nowait(chat_id)
+        return True
+
+    @staticmethod
+    async def _persist(chat_id: int) -> bool:
+        """写入 (或复用) summary_jobs 里的一行，返回任务是否可以跑 (不在失败冷却期)"""
+        now = datetime.now()
+        async with AsyncSessionLocal() as db:
+            # 多个 worker 进程同时触发时主键冲突，用 INSERT OR IGNORE 合并
+            await db.execute(
+                insert(SummaryJobModel)
+                .values(chat_id=chat_id, status="pending", attempts=0, create_date=now, update_date=now)
+                .on_conflict_do_nothing()
+            )
+            await db.execute(
+                update(SummaryJobModel)
+                .where(
+                    SummaryJobModel.chat_id == chat_id,
+                    SummaryJobModel.status == "failed",
+                    SummaryJobModel.update_date <= now - timedelta(seconds=config.SUMMARY_RETRY_SECONDS),
+                )
+                .values(status="pending", update_date=now)
+            )
+            status = (await db.execute(
+                select(SummaryJobModel.status).where(SummaryJobModel.chat_id == chat_id)
+            )).scalar_one()
+            await db.commit()
+        return status != "failed"
+
+    async def _worker(self) -> None:
+        while True:
+            chat_id = await self._queue.get()
+            self._pending.discard(chat_id)
+            self._running.add(chat_id)
+            try:
+                await self._run(chat_id)
+            except Exception:
+                # 数据库出错之类：任务留在库里，下次触发 / 重启时再跑，worker 本身不能退出
+                logger.exception("summary job for chat %s crashed", chat_id)
+            finally:
+                self._running.discard(chat_id)
+                self._queue.task_done()
+            if chat_id in self._again:
+                self._again.discard(chat_id)
+                try:
+                    await self.enqueue(chat_id)
+                except Exception:
+                    logger.exception("re-enqueue summary job for chat %s failed", chat_id)
+
+    async def _run(self, chat_id: int) -> None:
+        # 1. 认领任务 (pending -> running)；别的进程已经认领了就跳过
+        async with AsyncSessionLocal() as db:
+            claimed = await db.execute(
+                update(SummaryJobModel)
+                .where(SummaryJobModel.chat_id == chat_id, SummaryJobModel.status == "pending")
+                .values(status="running", attempts=SummaryJobModel.attempts + 1, update_date=datetime.now())
+            )
+            await db.commit()
+        if not claimed.rowcount:
+            return
+
+        # 2. 总结；成功删掉任务，失败记下原因
+        try:
+            written = await summarize_chat(chat_id)
+        except Exception as e:
+            logger.warning("summary job for chat %s failed: %s", chat_id, e)
+            async with AsyncSessionLocal() as db:
+                await db.execute(
+                    update(SummaryJobModel)
+                    .where(SummaryJobModel.chat_id == chat_id)
+                    .values(status="failed", error=str(e)[:1000], update_date=datetime.now())
+                )
+                await db.commit()
+            return
+        async with AsyncSessionLocal() as db:
+            await db.execute(delete(SummaryJobModel).where(SummaryJobModel.chat_id == chat_id))
+            await db.commit()
+        logger.info("summarized chat %s (%d new summaries)", chat_id, written)
+
+
+# 整个进程共用一个队列 (lifespan 里 start / stop)
+summary_queue = SummaryQueue()
+
+
+async def maybe_enqueue(db: AsyncSession, chat_id: int, preset: SillyTavernPreset) -> bool:
+    """每轮回复保存后调用：未总结的部分超过阈值就排一个任务 (不等总结跑完)"""
+    if not config.SUMMARY_ENABLED:
+        return False
+    chat = await db.get(ChatModel, chat_id, populate_existing=True)
+    if chat is None:
+        return False
+    if not needs_summary(chat, await chat_service.latest_summary(db, chat_id), preset):
+        return False
+    return await summary_queue.enqueue(chat_id)
@@ -0,0 +1,29 @@
+"""
+内容指纹 (content_hashes 表)
+
+单个上传和批量导入都在这里记指纹，批量导入按指纹去重时才能认出单独上传过的对象。
+这里不导入任何 service，角色卡 / 预设 / 世界书的 service 和导入的工作进程都能直接用。
+"""
+import hashlib
+import json
+from typing import Any, Dict
+
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.modules.importer.models import ContentHashModel
+
+
+def content_hash(raw: Dict[str, Any]) -> str:
+    """规范化 JSON 的 sha256：同一张卡不管是 PNG 还是 JSON、键顺序如何，指纹都一样"""
+    canonical = json.dumps(raw, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+async def record(db: AsyncSession, kind: str, content: str, object_id: int) -> None:
+    """记下指纹 (和对象在同一个事务里提交)；同样的内容已经有对象了就保留原来的"""
+    await db.execute(
+        insert(ContentHashModel)
+        .values(kind=kind, content_hash=content, object_id=object_id)
+        .on_conflict_do_nothing(index_elements=["kind", "content_hash"])
+    )
@@ -0,0 +1,22 @@
+from datetime import datetime
+from sqlalchemy import Column, Integer, String, DateTime, UniqueConstraint
+from app.core.database import Base
+
+class ContentHashModel(Base):
+    # 导入过的内容指纹：同一份 JSON 再导入时直接跳过
+    __tablename__ = 'content_hashes'
+
+    id = Column(Integer, primary_key=True)
+
+    # character / preset / lorebook
+    kind = Column(String, nullable=False)
+    # 规范化 JSON (键排序、紧凑格式) 的 sha256
+    content_hash = Column(String(64), nullable=False)
+    # 对应的对象 ID
+    object_id = Column(Integer, nullable=False)
+
+    create_date = Column(DateTime, default=datetime.now)
+
+    __table_args__ = (
+        UniqueConstraint('kind', 'content_hash', name='uq_content_hashes_kind_hash'),
+    )
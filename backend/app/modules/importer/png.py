@@ -0,0 +1,60 @@
+"""
+从 PNG 角色卡里取出内嵌的角色数据
+
+SillyTavern 把角色 JSON 做 base64 后放进 tEXt 块：
+    chara  V2 数据
+    ccv3   V3 数据 (新版同时写两个，优先用 ccv3)
+按块读取，图像数据 (IDAT) 直接跳过，不会把整张图读进内存。
+"""
+import base64
+import struct
+from typing import BinaryIO, Optional
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+CARD_KEYWORDS = (b"ccv3", b"chara")
+_SKIP_BLOCK = 64 * 1024
+
+
+class PngCardError(ValueError):
+    pass
+
+
+def _skip(stream: BinaryIO, n: int) -> None:
+    while n > 0:
+        block = stream.read(min(n, _SKIP_BLOCK))
+        if not block:
+            raise PngCardError("Truncated PNG")
+        n -= len(block)
+
+
+def read_card_text(stream: BinaryIO, max_bytes: int) -> bytes:
+    """返回角色数据的 JSON (bytes)；没有内嵌数据时报错"""
+    if stream.read(8) != PNG_SIGNATURE:
+        raise PngCardError("Not a PNG file")
+
+    found = {}
+    while True:
+        header = stream.read(8)
+        if len(header) < 8:
+            break
+        length, chunk_type = struct.unpack(">I4s", header)
+
+        if chunk_type == b"tEXt" and length <= max_bytes:
+            body = stream.read(length)
+            keyword, _, text = body.partition(b"\x00")
+            if keyword in CARD_KEYWORDS:
+                found[keyword] = text
+            _skip(stream, 4)  # CRC
+        else:
+            _skip(stream, length + 4)
+
+        if chunk_type == b"IEND" or b"ccv3" in found:
+            break
+
+    text: Optional[bytes] = next((found[k] for k in CARD_KEYWORDS if k in found), None)
+    if text is None:
+        raise PngCardError("PNG has no embedded character data (chara / ccv3)")
+    try:
+        return base64.b64decode(text)
+    except ValueError as e:
+        raise PngCardError(f"Bad base64 in PNG text chunk: {e}")
@@ -0,0 +1,190 @@
+"""
+批量导入流水线
+
+    上传文件 --(线程池里流式拆分)--> 条目 --(进程池校验)--> 攒批 --(一个事务插入)--> 进度
+同时在途的校验任务有上限，拆分速度不会把整个压缩包堆在内存里。
+内容指纹记在 content_hashes 表里，同一份 JSON 重复导入时直接返回已有对象的 ID。
+"""
+import asyncio
+from collections import Counter, deque
+from concurrent.futures import Executor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+
+from app.core import config
+from app.core.database import AsyncSessionLocal
+from app.modules.character import search as character_search
+from app.modules.character.models import CharacterModel
+from app.modules.importer.models import ContentHashModel
+from app.modules.importer.sources import RawItem
+from app.modules.importer.worker import validate_item
+from app.modules.lorebook.models import LorebookModel
+from app.modules.preset.models import PresetModel
+
+MODELS = {
+    "character": CharacterModel,
+    "preset": PresetModel,
+    "lorebook": LorebookModel,
+}
+
+_pool: Optional[Executor] = None
+
+
+def get_pool() -> Optional[Executor]:
+    """校验用的进程池 (按需创建，整个应用共用)；IMPORT_WORKERS=0 时返回 None，走默认线程池"""
+    global _pool
+    if _pool is None and config.IMPORT_WORKERS > 0:
+        _pool = ProcessPoolExecutor(max_workers=config.IMPORT_WORKERS)
+    return _pool
+
+
+def shutdown_pool() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(cancel_futures=True)
+        _pool = None
+
+
+def discard_pool(broken: Optional[Executor]) -> None:
+    """工作进程崩溃 (BrokenProcessPool) 后这个池子不能再用了：丢掉，下次 get_pool 重建"""
+    global _pool
+    if broken is not None and _pool is broken:
+        _pool = None
+        broken.shutdown(wait=False, cancel_futures=True)
+
+
+async def _insert_batch(batch: List[Tuple[int, str, Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    """一个事务插入一批；已经导入过的 (按内容指纹) 标记为 duplicate"""
+    async with AsyncSessionLocal() as db:
+        # 1. 一次查出这批里已存在的指纹
+        hashes = {result["hash"] for _, _, result in batch}
+        rows = await db.execute(
+            select(ContentHashModel.kind, ContentHashModel.content_hash, ContentHashModel.object_id)
+            .where(ContentHashModel.content_hash.in_(hashes))
+        )
+        known: Dict[Tuple[str, str], Any] = {(kind, h): obj_id for kind, h, obj_id in rows}
+
+        # 2. 新的入库；同一批里重复出现的指向同一个对象
+        placed = []
+        for index, name, result in batch:
+            key = (result["kind"], result["hash"])
+            if key in known:
+                placed.append((index, name, result, known[key], "duplicate"))
+                continue
+            obj = MODELS[result["kind"]](**result["fields"], data=result["data"])
+            db.add(obj)
+            known[key] = obj
+            placed.append((index, name, result, obj, "created"))
+
+        # 3. flush 拿到 ID，再记指纹、写角色卡搜索索引，最后一起提交
+        await db.flush()
+        created = [(result, obj) for _, _, result, obj, status in placed if status == "created"]
+        for result, obj in created:
+            db.add(ContentHashModel(kind=result["kind"], content_hash=result["hash"], object_id=obj.id))
+        await character_search.index_rows(db, [obj for result, obj in created if result["kind"] == "character"])
+        await db.commit()
+
+    events = []
+    for index, name, result, obj, status in placed:
+        event = {
+            "index": index,
+            "name": name,
+            "status": status,
+            "kind": result["kind"],
+            "id": obj if isinstance(obj, int) else obj.id,
+        }
+        if "quarantined" in result:
+            event["quarantined"] = result["quarantined"]
+        events.append(event)
+    return events
+
+
+async def _flush(batch: List[Tuple[int, str, Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    try:
+        return await _insert_batch(batch)
+    except IntegrityError:
+        # 另一个导入刚好插入了相同内容：重查一次指纹即可
+        return await _insert_batch(batch)
+
+
+async def import_items(items: AsyncIterator[RawItem], kind: Optional[str] = None) -> AsyncIterator[Dict[str, Any]]:
+    """
+    逐条产出进度：
+        {"index", "name", "status": created / duplicate / error / skipped, "kind", "id", "detail"}
+    角色卡里被隔离的正则脚本会附带 "quarantined": [{"index", "name", "reason"}]
+    最后产出汇总：{"done": true, "total", "created", "duplicate", "error", "skipped"}
+    """
+    loop = asyncio.get_running_loop()
+    max_pending = max(config.IMPORT_WORKERS, 1) * 4
+    batch_size = max(config.IMPORT_BATCH_SIZE, 1)
+
+    # (序号, 文件名, 原始内容, 提交到的池子, future, 是否已经重试过)
+    pending: Deque[Tuple[int, str, bytes, Optional[Executor], Any, bool]] = deque()
+    batch: List[Tuple[int, str, Dict[str, Any]]] = []
+    counts: Counter = Counter()
+    total = 0
+
+    def submit(index: int, name: str, payload: bytes, retried: bool = False) -> None:
+        pool = get_pool()
+        fut = loop.run_in_executor(pool, validate_item, payload, kind)
+        pending.append((index, name, payload, pool, fut, retried))
+
+    async def drain_one() -> List[Dict[str, Any]]:
+        # 取最早提交的一个校验结果：失败的直接报告，成功的攒进批次，批次满了就入库
+        index, name, payload, pool, fut, retried = pending.popleft()
+        try:
+            result = await fut
+        except BrokenProcessPool as e:
+            # 有工作进程崩了，池子里在途的任务全部失败：重建池子，每条重新提交一次 (排回最前面，保持顺序)
+            discard_pool(pool)
+            if not retried:
+                submit(index, name, payload, retried=True)
+                pending.rotate(1)
+                return []
+            result = {"ok": False, "error": f"Validation worker crashed: {e}"}
+        except Exception as e:
+            # 跨进程传递失败 (pickle) 等意外错误：只算这一条出错，导入继续
+            result = {"ok": False, "error": f"Validation failed: {e}"}
+        if not result["ok"]:
+            return [{"index": index, "name": name, "status": "error", "detail": result["error"]}]
+        batch.append((index, name, result))
+        if len(batch) < batch_size:
+            return []
+        events = await _flush(batch)
+        batch.clear()
+        return events
+
+    async for item in items:
+        index = total
+        total += 1
+        if item.skipped or item.error:
+            event = {"index": index, "name": item.name, "status": "skipped" if item.skipped else "error"}
+            if item.error:
+                event["detail"] = item.error
+            counts[event["status"]] += 1
+            yield event
+            continue
+
+        submit(index, item.name, item.payload)
+        while len(pending) >= max_pending:
+            for event in await drain_one():
+                counts[event["status"]] += 1
+                yield event
+
+    while pending:
+        for event in await drain_one():
+            counts[event["status"]] += 1
+            yield event
+    if batch:
+        for event in await _flush(batch):
+            counts[event["status"]] += 1
+            yield event
+
+    yield {
+        "done": True,
+        "total": total,
+        **{status: counts[status] for status in ("created", "duplicate", "error", "skipped")},
+    }
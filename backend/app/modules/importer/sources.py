@@ -0,0 +1,121 @@
+"""
+把上传的文件拆成一条条待导入的条目 (流式，逐条产出)
+
+支持：
+    .zip            逐个成员读取 (需要可 seek 的文件，上传文件本身就是临时文件)
+    .tar / .tar.gz  流式模式读取，整个目录打包也行
+    .ndjson/.jsonl  一行一个对象
+    .json           单个对象，或对象数组
+    .png            内嵌 chara / ccv3 的角色卡
+成员里不认识的文件类型会标记为 skipped。
+"""
+import json
+import tarfile
+import zipfile
+from dataclasses import dataclass
+from typing import BinaryIO, Iterator, Optional
+
+from app.modules.importer.png import PngCardError, read_card_text
+
+JSON_SUFFIXES = (".json",)
+NDJSON_SUFFIXES = (".ndjson", ".jsonl")
+PNG_SUFFIXES = (".png",)
+
+
+@dataclass
+class RawItem:
+    """一个待导入的条目：payload 是 JSON 文本；读取失败时 error 非空"""
+    name: str
+    payload: Optional[bytes] = None
+    error: Optional[str] = None
+    skipped: bool = False
+
+
+def _read_limited(stream: BinaryIO, max_bytes: int) -> bytes:
+    data = stream.read(max_bytes + 1)
+    if len(data) > max_bytes:
+        raise ValueError(f"Item larger than {max_bytes} bytes")
+    return data
+
+
+def _iter_json_array(name: str, data: bytes) -> Iterator[RawItem]:
+    # .json 文件里是数组时，拆成多条
+    try:
+        items = json.loads(data)
+    except ValueError as e:
+        yield RawItem(name, error=f"Invalid JSON: {e}")
+        return
+    for i, obj in enumerate(items):
+        yield RawItem(f"{name}[{i}]", payload=json.dumps(obj, ensure_ascii=False).encode("utf-8"))
+
+
+def _iter_member(name: str, stream: BinaryIO, max_bytes: int) -> Iterator[RawItem]:
+    """按后缀处理单个文件"""
+    lower = name.lower()
+    try:
+        if lower.endswith(PNG_SUFFIXES):
+            yield RawItem(name, payload=read_card_text(stream, max_bytes))
+        elif lower.endswith(NDJSON_SUFFIXES):
+            yield from _iter_ndjson(name, stream, max_bytes)
+        elif lower.endswith(JSON_SUFFIXES):
+            data = _read_limited(stream, max_bytes)
+            if data.lstrip()[:1] == b"[":
+                yield from _iter_json_array(name, data)
+            else:
+                yield RawItem(name, payload=data)
+        else:
+            yield RawItem(name, skipped=True)
+    except (PngCardError, ValueError) as e:
+        yield RawItem(name, error=str(e))
+
+
+def _iter_ndjson(name: str, stream: BinaryIO, max_bytes: int) -> Iterator[RawItem]:
+    for lineno, line in enumerate(stream, start=1):
+        if len(line) > max_bytes:
+            yield RawItem(f"{name}:{lineno}", error=f"Item larger than {max_bytes} bytes")
+            continue
+        if line.strip():
+            yield RawItem(f"{name}:{lineno}", payload=line)
+
+
+def _iter_zip(stream: BinaryIO, max_bytes: int) -> Iterator[RawItem]:
+    with zipfile.ZipFile(stream) as zf:
+        for info in zf.infolist():
+            if info.is_dir():
+                continue
+            if info.file_size > max_bytes and not info.filename.lower().endswith(PNG_SUFFIXES):
+                yield RawItem(info.filename, error=f"Item larger than {max_bytes} bytes")
+                continue
+            with zf.open(info) as member:
+                yield from _iter_member(info.filename, member, max_bytes)
+
+
+def _iter_tar(stream: BinaryIO, max_bytes: int) -> Iterator[RawItem]:
+    # "r|*"：纯流式读取，不回头 seek，自动识别 gz / bz2 / xz
+    with tarfile.open(fileobj=stream, mode="r|*") as tf:
+        for member in tf:
+            if not member.isfile():
+                continue
+            f = tf.extractfile(member)
+            if f is None:
+                continue
+            yield from _iter_member(member.name, f, max_bytes)
+
+
+def iter_items(stream: BinaryIO, filename: str, max_bytes: int) -> Iterator[RawItem]:
+    """根据文件名 (没有后缀时看文件头) 选择拆分方式"""
+    lower = (filename or "").lower()
+    head = stream.read(512)
+    stream.seek(0)
+
+    if lower.endswith(".zip") or head.startswith(b"PK\x03\x04"):
+        yield from _iter_zip(stream, max_bytes)
+    elif lower.endswith((".tar", ".tar.gz", ".tgz", ".tar.xz", ".tar.bz2")) or head[257:262] == b"ustar" \
+            or head.startswith(b"\x1f\x8b"):
+        yield from _iter_tar(stream, max_bytes)
+    elif lower.endswith(PNG_SUFFIXES) or head.startswith(b"\x89PNG"):
+        yield from _iter_member(filename or "upload.png", stream, max_bytes)
+    elif lower.endswith(NDJSON_SUFFIXES):
+        yield from _iter_ndjson(filename, stream, max_bytes)
+    else:
+        yield from _iter_member(filename if lower.endswith(".json") else "upload.json", stream, max_bytes)
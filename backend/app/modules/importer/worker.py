@@ -0,0 +1,78 @@
+"""
+导入条目的校验 (在工作进程里跑)
+
+只做纯计算：解析 JSON、识别类型、Pydantic 校验、提取索引字段、算内容指纹。
+参数和返回值都是普通的 bytes / dict，方便跨进程传递。
+"""
+import json
+from typing import Any, Dict, Optional
+
+from app.core.regex_scripts import quarantine_scripts
+from app.modules.character import service as char_service
+from app.modules.importer.fingerprint import content_hash
+from app.modules.lorebook import service as lorebook_service
+from app.modules.preset import service as preset_service
+
+KINDS = ("character", "preset", "lorebook")
+
+ROW_FIELDS = {
+    "character": char_service.row_fields,
+    "preset": preset_service.row_fields,
+    "lorebook": lorebook_service.row_fields,
+}
+
+
+def detect_kind(raw: Dict[str, Any]) -> Optional[str]:
+    """根据字段猜类型"""
+    spec = str(raw.get("spec") or "")
+    data = raw.get("data")
+    if spec.startswith("chara_card") or "first_mes" in raw or (isinstance(data, dict) and "first_mes" in data):
+        return "character"
+    if "entries" in raw:
+        return "lorebook"
+    if "prompts" in raw or "chat_completion_source" in raw or "temperature" in raw:
+        return "preset"
+    return None
+
+
+def _normalize_character(raw: Dict[str, Any]) -> Dict[str, Any]:
+    # V1 卡没有 data 外壳，字段平铺在最外层，包一层成 V2
+    if not isinstance(raw.get("data"), dict):
+        return {"spec": "chara_card_v2", "spec_version": "2.0", "data": raw}
+    return raw
+
+
+def validate_item(payload: bytes, kind: Optional[str] = None) -> Dict[str, Any]:
+    """
+    返回：
+        {"ok": True, "kind", "fields", "data", "hash"}
+        {"ok": False, "error"}
+    """
+    try:
+        raw = json.loads(payload)
+    except ValueError as e:
+        return {"ok": False, "error": f"Invalid JSON: {e}"}
+    if not isinstance(raw, dict):
+        return {"ok": False, "error": "Top-level JSON must be an object"}
+
+    kind = kind or detect_kind(raw)
+    if kind not in ROW_FIELDS:
+        return {"ok": False, "error": "Cannot tell whether this is a character, preset or lorebook"}
+    if kind == "character":
+        raw = _normalize_character(raw)
+
+    try:
+        fields = ROW_FIELDS[kind](raw)
+    except Exception as e:
+        return {"ok": False, "error": f"Validation failed: {e}"}
+
+    # 指纹按上传的内容算 (隔离标记之前)，和单个上传一致
+    fingerprint = content_hash(raw)
+
+    # 角色卡：会灾难性回溯的正则脚本标记隔离
+    quarantined = quarantine_scripts(raw) if kind == "character" else []
+
+    result = {"ok": True, "kind": kind, "fields": fields, "data": raw, "hash": fingerprint}
+    if quarantined:
+        result["quarantined"] = quarantined
+    return result
@@ -1,21 +1,68 @@
-from sqlalchemy.orm import Session
+from typing import Optional
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core import config, model_cache, world_info_artifact
+from app.core.world_info import WorldInfoIndex, get_world_info_index, world_info_cache
+from app.modules.importer import fingerprint
 from app.modules.lorebook.models import LorebookModel
 from app.schemas.lorebook import LorebookV3
 
-def create_lorebook(db: Session, raw_json: dict):
-    # 1. 检查
+def row_fields(raw_json: dict) -> dict:
+    """校验并提取索引字段 (不碰数据库，批量导入的工作进程里也用它)"""
     lb = LorebookV3(**raw_json)
-    
+    return {"name": lb.name or "Untitled Lorebook"}
+
+async def create_lorebook(db: AsyncSession, raw_json: dict, source: Optional[dict] = None):
+    """source 是上传的原始 JSON (raw_json 是校验后补全了默认值的)，内容指纹按它算，和批量导入一致"""
+    # 1. 检查
+    fields = row_fields(raw_json)
+
     # 2. 入库
     db_obj = LorebookModel(
-        name=lb.name or "Untitled Lorebook",
+        **fields,
         data=raw_json
     )
     
     db.add(db_obj)
-    db.commit()
-    db.refresh(db_obj)
+    await db.flush() # 先拿到 ID，内容指纹和对象一起提交 (批量导入按它去重)
+    await fingerprint.record(db, "lorebook", await run_in_threadpool(fingerprint.content_hash, source or raw_json), db_obj.id)
+    await db.commit()
+    await db.refresh(db_obj)
+    model_cache.invalidate(LorebookModel.__tablename__, db_obj.id)
+
+    # 3. 编译成文件 (关键词自动机 + 词条表)，各 worker 直接 mmap，不用各自解析、编译
+    if config.WORLD_INFO_MMAP:
+        version = model_cache.stamp_of(db_obj)
+        await run_in_threadpool(
+            world_info_artifact.build_artifact, LorebookV3(**raw_json), db_obj.id, version
+        )
     return db_obj
 
-def get_lorebook(db: Session, lb_id: int):
-    return db.query(LorebookModel).filter(LorebookModel.id == lb_id).first()
\ No newline at end of file
+async def get_lorebook(db: AsyncSession, lb_id: int):
+    return await db.get(LorebookModel, lb_id)
+
+async def load_schema(db_obj: LorebookModel) -> LorebookV3:
+    """把数据库行还原成校验过的世界书对象 (按版本缓存，只读；没命中才读出 data)"""
+    return await model_cache.load_validated(
+        LorebookModel.__tablename__, db_obj, lambda raw: LorebookV3(**raw)
+    )
+
+async def load_index(db_obj: LorebookModel) -> WorldInfoIndex:
+    """
+    世界书的关键词索引 (按版本缓存在进程里)。
+    优先只读映射编译好的文件 (多个 worker 共享页缓存，不用读 data、不建 Pydantic 对象)；
+    文件不存在或版本对不上 (批量导入的、功能上线前的世界书) 就编译一次并写文件。
+    """
+    version = model_cache.stamp_of(db_obj)
+    cached = world_info_cache.peek(db_obj.id, version)
+    if cached is not None:
+        return cached
+    if not config.WORLD_INFO_MMAP:
+        schema = await load_schema(db_obj)
+        return await run_in_threadpool(get_world_info_index, schema, db_obj.id, version)
+
+    index = await run_in_threadpool(world_info_artifact.load_index, db_obj.id, version)
+    if index is None:
+        schema = await load_schema(db_obj)
+        index = await run_in_threadpool(world_info_artifact.build_artifact, schema, db_obj.id, version)
+    return world_info_cache.get_or_build(db_obj.id, version, lambda: index)
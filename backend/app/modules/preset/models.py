@@ -1,5 +1,7 @@
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, DateTime, JSON
+from sqlalchemy import Column, Integer, String, DateTime
+from sqlalchemy.orm import deferred
+from app.core.blob import CompressedJSON
 from app.core.database import Base
 
 class PresetModel(Base):
@@ -15,6 +17,7 @@ class PresetModel(Base):
     source = Column(String, index=True)
     
     # 完整配置 JSON
-    data = Column(JSON, nullable=False)
+    # 压缩存储 + 延迟加载：用到时才读出并解压
+    data = deferred(Column(CompressedJSON, nullable=False))
     
     create_date = Column(DateTime, default=datetime.now)
\ No newline at end of file
@@ -1,8 +1,13 @@
-from sqlalchemy.orm import Session
+from typing import Optional
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core import model_cache
+from app.modules.importer import fingerprint
 from app.modules.preset.models import PresetModel
 from app.schemas.preset import SillyTavernPreset
 
-def create_preset(db: Session, raw_json: dict):
+def row_fields(raw_json: dict) -> dict:
+    """校验并提取索引字段 (不碰数据库，批量导入的工作进程里也用它)"""
     # 1. 检查数据
     preset = SillyTavernPreset(**raw_json)
     
@@ -18,18 +23,32 @@ def create_preset(db: Session, raw_json: dict):
         "Unknown Model"
     )
     display_name = f"{source_type} - {model_name}"
+    return {"name": display_name, "source": source_type}
 
-    # 4. 入库
+async def create_preset(db: AsyncSession, raw_json: dict, source: Optional[dict] = None):
+    """source 是上传的原始 JSON (raw_json 是校验后补全了默认值的)，内容指纹按它算，和批量导入一致"""
+    # 1. 检查 + 提取索引字段
+    fields = row_fields(raw_json)
+
+    # 2. 入库
     db_obj = PresetModel(
-        name=display_name,
-        source=source_type,
+        **fields,
         data=raw_json
     )
     
     db.add(db_obj)
-    db.commit()
-    db.refresh(db_obj)
+    await db.flush() # 先拿到 ID，内容指纹和对象一起提交 (批量导入按它去重)
+    await fingerprint.record(db, "preset", await run_in_threadpool(fingerprint.content_hash, source or raw_json), db_obj.id)
+    await db.commit()
+    await db.refresh(db_obj)
+    model_cache.invalidate(PresetModel.__tablename__, db_obj.id)
     return db_obj
 
-def get_preset(db: Session, preset_id: int):
-    return db.query(PresetModel).filter(PresetModel.id == preset_id).first()
\ No newline at end of file
+async def get_preset(db: AsyncSession, preset_id: int):
+    return await db.get(PresetModel, preset_id)
+
+async def load_schema(db_obj: PresetModel) -> SillyTavernPreset:
+    """把数据库行还原成校验过的预设对象 (按版本缓存，只读；没命中才读出 data)"""
+    return await model_cache.load_validated(
+        PresetModel.__tablename__, db_obj, lambda raw: SillyTavernPreset(**raw)
+    )
@@ -1,7 +1,10 @@
 from typing import List, Optional, Any
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, field_validator
 import uuid
 
+# 酒馆导出的世界书里 position 是数字：0 = 角色定义前，1 = 角色定义后
+POSITION_NAMES = {0: "before_char", 1: "after_char"}
+
 class LorebookEntry(BaseModel):
     """
     代表 Lorebook 中的单个词条 (Entry)
@@ -34,7 +37,16 @@ class LorebookEntry(BaseModel):
     
     # 辅助/可选字段 (根据你的 JSON 实际情况增减)
     secondary_keys: List[str] = Field(default_factory=list, description="次要关键词")
+    # V2 规范：selective 为 True 时，需要主关键词和次要关键词同时命中
+    selective: bool = Field(False, description="是否要求次要关键词也命中")
     comment: Optional[str] = None
+
+    @field_validator("position", mode="before")
+    @classmethod
+    def _normalize_position(cls, v: Any) -> Any:
+        if isinstance(v, int):
+            return POSITION_NAMES.get(v, str(v))
+        return v
     
     class Config:
         # 允许通过字段名赋值 (Schema.content) 也可以通过别名赋值 (json['content'])
@@ -63,6 +75,28 @@ class Lorebook(BaseModel):
     # 扩展字段：有些格式会在顶层放 settings
     extensions: dict = Field(default_factory=dict, description="其他扩展数据")
 
+    @field_validator("entries", mode="before")
+    @classmethod
+    def _normalize_entries(cls, v: Any) -> Any:
+        # 酒馆导出的格式是 {"uid": {...}}，统一转成列表
+        if isinstance(v, dict):
+            items = []
+            for uid, entry in v.items():
+                if isinstance(entry, dict):
+                    entry = dict(entry)
+                    entry["uid"] = str(entry.get("uid", uid))
+                    # 旧字段名兼容：key / keysecondary
+                    if "keys" not in entry and "key" in entry:
+                        entry["keys"] = entry["key"]
+                    if "secondary_keys" not in entry and "keysecondary" in entry:
+                        entry["secondary_keys"] = entry["keysecondary"]
+                items.append(entry)
+            return items
+        return v
+
     class Config:
         populate_by_name = True
-        extra = "ignore"
\ No newline at end of file
+        extra = "ignore"
+
+# 兼容旧名称：service / endpoint / prompt_engine 里都按 LorebookV3 引用
+LorebookV3 = Lorebook
@@ -13,6 +13,22 @@ class PromptDefinition(BaseModel):
     class Config:
         extra = "allow"
 
+class PromptOrderItem(BaseModel):
+    """prompt_order 里的单个条目：引用哪个 Prompt、是否启用"""
+    identifier: str
+    enabled: bool = True
+
+    class Config:
+        extra = "allow"
+
+class PromptOrder(BaseModel):
+    """一套排序配置 (酒馆按 character_id 区分)"""
+    character_id: Optional[int] = None
+    order: List[PromptOrderItem] = Field(default_factory=list)
+
+    class Config:
+        extra = "allow"
+
 class SillyTavernPreset(BaseModel):
     """酒馆预设根模型"""
     # 核心生成参数
@@ -22,6 +38,10 @@ class SillyTavernPreset(BaseModel):
     top_p: float = 1.0
     top_k: int = 0
     
+    # 上下文长度 / 回复长度 (Token 预算用，默认值与酒馆一致)
+    openai_max_context: int = 4095
+    openai_max_tokens: int = 300
+
     # API 来源标识
     chat_completion_source: str = "openai"
     openai_model: Optional[str] = ""
@@ -29,6 +49,9 @@ class SillyTavernPreset(BaseModel):
     
     # Prompt 列表 (这是最重要的部分)
     prompts: List[PromptDefinition] = Field(default_factory=list)
+
+    # 排序与启用状态 (决定最终拼装顺序)
+    prompt_order: List[PromptOrder] = Field(default_factory=list)
     
     # 允许所有额外字段 (OpenRouter配置、UI设置等)
     class Config:
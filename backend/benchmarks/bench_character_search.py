@@ -0,0 +1,164 @@
+"""
+角色卡列表 / 搜索基准：合成 N 张卡 (默认 5 万)，测分页和全文搜索的延迟。
+
+流程：
+    1. 临时目录建库，批量插入合成卡片
+    2. ensure_search_schema 建索引并回填 FTS (同时统计回填耗时)
+    3. 通过 ASGI 直接调用接口：各排序的首页、顺着游标往后翻很多页、几类搜索词
+
+用法 (在 backend 目录下)：
+    python -m benchmarks.bench_character_search
+    python -m benchmarks.bench_character_search --cards 50000 --rounds 50
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+# 延迟目标 (ms, p95)
+TARGETS = {"list": 20.0, "search": 50.0}
+
+WORDS = "knight witch dragon detective maid pirate vampire idol android ninja teacher princess".split()
+CJK = "魔法少女骑士侦探女仆海盗吸血鬼偶像机器人忍者老师公主学园异世界冒险日常恋爱"
+TAGS = ["female", "male", "fantasy", "sci-fi", "romance", "comedy", "horror", "原创", "同人", "恋爱", "冒险", "学园"]
+
+
+# 简介用近似 Zipf 分布的词表生成：少数词很常见，大部分词很少见，和真实卡片的词频接近
+VOCAB = [f"w{i}" for i in range(3000)]
+VOCAB_WEIGHTS = [1.0 / (rank + 1) for rank in range(len(VOCAB))]
+
+
+def fake_card(i: int, rng: random.Random) -> dict:
+    theme = rng.sample(WORDS, 2)
+    name = f"{theme[0].title()} {''.join(rng.sample(CJK, 2))} {i}"
+    words = rng.choices(VOCAB, weights=VOCAB_WEIGHTS, k=60) + theme
+    rng.shuffle(words)
+    desc = " ".join(words) + " " + "".join(rng.choice(CJK) for _ in range(40))
+    return {
+        "spec": "chara_card_v2",
+        "spec_version": "2.0",
+        "data": {
+            "name": name,
+            "description": desc,
+            "personality": "", "scenario": "", "first_mes": "你好", "mes_example": "",
+            "creator": f"author{rng.randrange(500)}" if rng.random() > 0.1 else "",
+            "tags": rng.sample(TAGS, 3),
+        },
+    }
+
+
+def seed(count: int) -> None:
+    from app.core.database import Base, engine
+    from app.modules.character.models import CharacterModel
+    from app.modules.character.search import ensure_search_schema
+
+    Base.metadata.create_all(bind=engine)
+    rng = random.Random(42)
+    base = datetime(2024, 1, 1)
+    start = time.perf_counter()
+    with engine.begin() as conn:
+        for lo in range(0, count, 1000):
+            rows = []
+            for i in range(lo, min(lo + 1000, count)):
+                card = fake_card(i, rng)
+                rows.append({
+                    "name": card["data"]["name"],
+                    "creator": card["data"]["creator"] or None,
+                    "data": card,
+                    "create_date": base + timedelta(seconds=rng.randrange(10 ** 7)),
+                    "update_date": base,
+                })
+            conn.execute(CharacterModel.__table__.insert(), rows)
+    print(f"seeded {count} cards in {time.perf_counter() - start:.1f} s")
+
+    start = time.perf_counter()
+    ensure_search_schema(engine)
+    print(f"FTS backfill: {time.perf_counter() - start:.1f} s")
+
+
+def pct(values, p):
+    values = sorted(values)
+    return values[max(int(len(values) * p) - 1, 0)]
+
+
+async def timed(client, url, params, rounds):
+    samples = []
+    body = None
+    for _ in range(rounds):
+        start = time.perf_counter()
+        resp = await client.get(url, params=params)
+        samples.append((time.perf_counter() - start) * 1000)
+        resp.raise_for_status()
+        body = resp.json()
+    return samples, body
+
+
+async def run(rounds: int, deep_pages: int):
+    import httpx
+    from app.main import app
+
+    failed = False
+
+    def report(kind, label, samples, extra=""):
+        nonlocal failed
+        p95 = pct(samples, 0.95)
+        over = p95 > TARGETS[kind]
+        failed |= over
+        print(f"{label:<34} p50={statistics.median(samples):6.2f} ms  p95={p95:6.2f} ms"
+              f"{'  OVER TARGET' if over else ''}{extra}")
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for sort in ("name", "creator", "create_date"):
+            for desc in (False, True):
+                samples, _ = await timed(client, "/api/character/", {"sort": sort, "desc": desc}, rounds)
+                report("list", f"list sort={sort} desc={desc}", samples)
+
+        # 顺着游标一直往后翻：每页耗时应该和第一页差不多
+        samples = []
+        cursor = None
+        for _ in range(deep_pages):
+            params = {"sort": "name", "limit": 100}
+            if cursor:
+                params["cursor"] = cursor
+            start = time.perf_counter()
+            body = (await client.get("/api/character/", params=params)).json()
+            samples.append((time.perf_counter() - start) * 1000)
+            cursor = body["next_cursor"]
+            if not cursor:
+                break
+        report("list", f"list walk {len(samples)} pages x100", samples)
+
+        # 主题词约 1/6 的卡命中；w0 是最常见的词 (约 40% 的卡命中)，代表最坏情况
+        for q in ("dragon", "drag", "魔法", "学园 knight", "author42", "恋爱", "w0", "w2500"):
+            samples, body = await timed(client, "/api/character/search", {"q": q}, rounds)
+            report("search", f"search q={q!r}", samples, f"  hits(page)={len(body['items'])}")
+    return failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--cards", type=int, default=50000)
+    parser.add_argument("--rounds", type=int, default=30)
+    parser.add_argument("--deep-pages", type=int, default=200)
+    args = parser.parse_args()
+
+    os.chdir(tempfile.mkdtemp(prefix="prisma-bench-"))
+    sys.path.insert(0, str(BACKEND_DIR))
+
+    seed(args.cards)
+    failed = asyncio.run(run(args.rounds, args.deep_pages))
+    print("targets:", ", ".join(f"{k} p95 <= {v:.0f} ms" for k, v in TARGETS.items()))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
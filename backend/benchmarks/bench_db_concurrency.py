@@ -0,0 +1,94 @@
+"""
+数据库并发基准：上传 (写) 进行时，读接口的吞吐和延迟。
+
+真实起一个 uvicorn 服务，先只读测一轮作为基线，再在后台持续上传预设的同时测一轮读。
+WAL 模式下读不会被写阻塞，两轮的吞吐应该接近。
+
+用法 (在 backend 目录下)：
+    python -m benchmarks.bench_db_concurrency
+    python -m benchmarks.bench_db_concurrency --seconds 10 --readers 32 --writers 4
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+ROOT_DIR = BACKEND_DIR.parent
+PORT = 9031
+BASE = f"http://127.0.0.1:{PORT}"
+
+
+async def reader(client, url, stop_at, latencies):
+    while time.perf_counter() < stop_at:
+        start = time.perf_counter()
+        resp = await client.get(url)
+        resp.raise_for_status()
+        latencies.append(time.perf_counter() - start)
+
+
+async def writer(client, preset, stop_at, counter):
+    while time.perf_counter() < stop_at:
+        resp = await client.post(f"{BASE}/api/preset/upload", json=preset)
+        resp.raise_for_status()
+        counter[0] += 1
+
+
+async def run_round(seconds, readers, writers, preset, url):
+    import httpx
+
+    latencies = []
+    uploads = [0]
+    limits = httpx.Limits(max_connections=readers + writers)
+    async with httpx.AsyncClient(timeout=60, limits=limits) as client:
+        stop_at = time.perf_counter() + seconds
+        tasks = [reader(client, url, stop_at, latencies) for _ in range(readers)]
+        tasks += [writer(client, preset, stop_at, uploads) for _ in range(writers)]
+        await asyncio.gather(*tasks)
+    return latencies, uploads[0]
+
+
+def report(label, latencies, uploads, seconds):
+    ms = sorted(x * 1000 for x in latencies)
+    p95 = ms[max(int(len(ms) * 0.95) - 1, 0)]
+    print(f"{label:<16} reads/s={len(ms) / seconds:8.1f}  p50={statistics.median(ms):6.1f} ms  "
+          f"p95={p95:6.1f} ms  uploads={uploads}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--readers", type=int, default=16)
+    parser.add_argument("--writers", type=int, default=2)
+    args = parser.parse_args()
+
+    os.chdir(tempfile.mkdtemp(prefix="prisma-bench-"))
+    sys.path.insert(0, str(BACKEND_DIR))
+
+    from fastapi.testclient import TestClient
+    from app.main import app
+    from benchmarks.mock_upstream import run_in_thread
+
+    card = json.loads((ROOT_DIR / "jsontemplates" / "character_card_v2.json").read_text("utf-8"))
+    preset = json.loads((ROOT_DIR / "夏瑾 Pro 比邻星 1.0.json").read_text("utf-8"))
+    with TestClient(app) as c:
+        char_id = c.post("/api/character/upload", json=card).json()["id"]
+
+    server = run_in_thread(app, PORT)
+    url = f"{BASE}/api/character/{char_id}"
+    try:
+        latencies, uploads = asyncio.run(run_round(args.seconds, args.readers, 0, preset, url))
+        report("reads only", latencies, uploads, args.seconds)
+        latencies, uploads = asyncio.run(run_round(args.seconds, args.readers, args.writers, preset, url))
+        report("reads + uploads", latencies, uploads, args.seconds)
+    finally:
+        server.should_exit = True
+
+
+if __name__ == "__main__":
+    main()
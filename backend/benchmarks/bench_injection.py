@@ -0,0 +1,120 @@
+"""
+聊天内注入基准：单遍合并 (ContextAssembler._inject) vs 每条注入 list.insert 一次。
+
+两种场景：
+    fixed    固定 8 条注入 (深度 0~64，和常见预设差不多)
+    scaled   每 50 条消息一条注入，深度均匀铺满整个历史 (insert 的 O(n·m) 会暴露出来)
+每个规模输出总耗时和「每条消息的纳秒数」：单遍合并的每条耗时应该基本不随规模变 (线性)。
+最后再跑一遍带注入预设的完整拼装，确认整条流水线也是线性的。
+
+用法 (在 backend 目录下)：
+    python -m benchmarks.bench_injection
+    python -m benchmarks.bench_injection --sizes 1000,10000,100000 --rounds 5
+"""
+import argparse
+import time
+from typing import Dict, List
+
+from app.core.prompt_engine import ContextAssembler
+
+
+def make_history(n: int) -> List[Dict[str, str]]:
+    return [{"role": "user" if i % 2 == 0 else "assistant", "content": f"message {i}"} for i in range(n)]
+
+
+def make_groups(depths: List[int]) -> Dict[int, List[Dict[str, str]]]:
+    return {d: [{"role": "system", "content": f"inject @{d}"}] for d in depths}
+
+
+def naive_inject(history: List[Dict[str, str]], groups: Dict[int, List[Dict[str, str]]]) -> List[Dict[str, str]]:
+    """旧思路：复制一份，再从浅到深逐条 insert (每次 insert 都要挪动后面的元素)"""
+    out = list(history)
+    n = len(history)
+    for depth in sorted(groups):
+        at = max(n - depth, 0)
+        for msg in reversed(groups[depth]):
+            out.insert(at, msg)
+    return out
+
+
+def best_of(func, rounds: int) -> float:
+    best = float("inf")
+    for _ in range(rounds):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def run_case(label: str, sizes: List[int], depths_for, rounds: int) -> None:
+    print(f"\n[{label}]")
+    print(f"{'messages':>10} {'injections':>10} {'single pass':>14} {'ns/msg':>8} {'list.insert':>14} {'ns/msg':>8}")
+    per_msg = []
+    for n in sizes:
+        history = make_history(n)
+        groups = make_groups(depths_for(n))
+        assert ContextAssembler._inject(history, groups) == naive_inject(history, groups)
+        fast = best_of(lambda: ContextAssembler._inject(history, groups), rounds)
+        slow = best_of(lambda: naive_inject(history, groups), rounds)
+        per_msg.append(fast / n)
+        print(f"{n:>10} {len(groups):>10} {fast * 1000:>11.2f} ms {fast / n * 1e9:>8.1f} "
+              f"{slow * 1000:>11.2f} ms {slow / n * 1e9:>8.1f}")
+    print(f"single pass ns/msg, largest / smallest size: {per_msg[-1] / per_msg[0]:.2f}x (≈1 = linear)")
+
+
+def run_assemble(sizes: List[int], rounds: int) -> None:
+    """完整拼装：预设里 3 条聊天内注入 + 角色卡 depth_prompt，上下文足够大，历史全部保留"""
+    from app.schemas.character import TavernCardV3
+    from app.schemas.preset import SillyTavernPreset
+
+    card = TavernCardV3(data={
+        "name": "Bench",
+        "description": "{{char}} is a benchmark.",
+        "extensions": {"depth_prompt": {"prompt": "Stay in character as {{char}}.", "depth": 4, "role": "system"}},
+    })
+    preset = SillyTavernPreset(
+        openai_max_context=10_000_000,
+        prompts=[
+            {"identifier": "main", "content": "You are {{char}}."},
+            {"identifier": "charDescription"},
+            {"identifier": "chatHistory"},
+            {"identifier": "note", "content": "Author's note.", "injection_position": 1, "injection_depth": 2},
+            {"identifier": "deep", "content": "Deep reminder.", "injection_position": 1, "injection_depth": 500},
+            {"identifier": "tail", "content": "{{user}} is waiting.", "role": "user",
+             "injection_position": 1, "injection_depth": 0},
+        ],
+    )
+
+    print("\n[assemble]")
+    print(f"{'messages':>10} {'assemble':>14} {'ns/msg':>8}")
+    per_msg = []
+    for n in sizes:
+        history = make_history(n)
+
+        def assemble():
+            return ContextAssembler(
+                card=card, preset=preset, history=history, preset_id="bench", preset_version=0,
+                card_id="bench", card_version=0, recall_budget=0,
+            ).assemble()
+
+        assemble()
+        elapsed = best_of(assemble, rounds)
+        per_msg.append(elapsed / n)
+        print(f"{n:>10} {elapsed * 1000:>11.2f} ms {elapsed / n * 1e9:>8.1f}")
+    print(f"assemble ns/msg, largest / smallest size: {per_msg[-1] / per_msg[0]:.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1000,10000,50000,200000", help="历史条数，逗号分隔")
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+    sizes = [int(s) for s in args.sizes.split(",")]
+
+    run_case("fixed", sizes, lambda n: [0, 1, 2, 4, 8, 16, 32, 64], args.rounds)
+    run_case("scaled", sizes, lambda n: list(range(0, n, 50)), args.rounds)
+    run_assemble([s for s in sizes if s <= 50000] or sizes[:1], args.rounds)
+
+
+if __name__ == "__main__":
+    main()
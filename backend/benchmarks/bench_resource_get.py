@@ -0,0 +1,95 @@
+"""
+大对象 GET 基准：预设 (约 100 KB) 的读取延迟。
+
+对比：
+    baseline     改动前的做法：FastAPI 对 ORM 对象 jsonable_encoder + json 编码 (只算编码本身)
+    200 identity 命中响应缓存，直接返回序列化好的 bytes
+    200 gzip/br  命中缓存的压缩结果 (含客户端解压时间)
+    304          带 If-None-Match，不返回 body
+
+用法 (在 backend 目录下)：
+    python -m benchmarks.bench_resource_get
+    python -m benchmarks.bench_resource_get --rounds 500
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+ROOT_DIR = BACKEND_DIR.parent
+
+
+def summary(label, samples, size=None):
+    ms = sorted(x * 1000 for x in samples)
+    extra = f"  body={size / 1024:7.1f} KB" if size is not None else ""
+    print(f"{label:<22} p50={statistics.median(ms):7.3f} ms  p95={ms[int(len(ms) * 0.95) - 1]:7.3f} ms{extra}")
+
+
+async def run(rounds: int):
+    import httpx
+    from fastapi.encoders import jsonable_encoder
+
+    from app.core.database import AsyncSessionLocal
+    from app.main import app
+    from app.modules.preset import service
+
+    preset = json.loads((ROOT_DIR / "夏瑾 Pro 比邻星 1.0.json").read_text("utf-8"))
+    # ASGITransport 不会触发 lifespan，手动进入 (数据库迁移等启动初始化都在里面)
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app), \
+            httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        preset_id = (await client.post("/api/preset/upload", json=preset)).json()["id"]
+        url = f"/api/preset/{preset_id}"
+
+        # 改动前：每次请求都对整行做 jsonable_encoder + 编码
+        async with AsyncSessionLocal() as db:
+            row = await service.get_preset(db, preset_id)
+            await row.awaitable_attrs.data
+            samples = []
+            for _ in range(rounds):
+                start = time.perf_counter()
+                body = json.dumps(jsonable_encoder(row), ensure_ascii=False).encode("utf-8")
+                samples.append(time.perf_counter() - start)
+            summary("baseline encode", samples, len(body))
+
+        for label, headers in [
+            ("200 identity", {"Accept-Encoding": "identity"}),
+            ("200 gzip", {"Accept-Encoding": "gzip"}),
+            ("200 br", {"Accept-Encoding": "br"}),
+        ]:
+            samples = []
+            for _ in range(rounds):
+                start = time.perf_counter()
+                resp = await client.get(url, headers=headers)
+                samples.append(time.perf_counter() - start)
+            wire = int(resp.headers.get("content-length", len(resp.content)))
+            summary(f"{label} ({resp.headers.get('content-encoding', 'none')})", samples, wire)
+
+        etag = resp.headers["etag"]
+        samples = []
+        for _ in range(rounds):
+            start = time.perf_counter()
+            resp = await client.get(url, headers={"If-None-Match": etag})
+            samples.append(time.perf_counter() - start)
+        assert resp.status_code == 304
+        summary("304", samples, 0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rounds", type=int, default=200)
+    args = parser.parse_args()
+
+    os.chdir(tempfile.mkdtemp(prefix="prisma-bench-"))
+    sys.path.insert(0, str(BACKEND_DIR))
+    asyncio.run(run(args.rounds))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,263 @@
+"""
+后台历史总结：对着本地模拟上游 (benchmarks/mock_upstream.py) 跑一遍，检查行为并测对话延迟。
+
+检查项 (任何一项不满足时退出码为 1)：
+    trigger      长聊天的对话轮次里自动排任务，跑完写入总结、删掉任务
+    assemble     拼装用最新的总结代替它覆盖的消息 (总结之前的消息不再出现)
+    coalesce     同一个聊天并发触发多次只跑一个任务
+    concurrency  同时运行的任务数不超过 --concurrency
+    restart      任务中途关掉应用，重启后接着跑完
+    latency      后台总结跑着的时候，对话轮次的耗时基本不受影响
+    disconnect   流式回复中途前端断开，已收到的部分照样存成 AI 消息
+
+用法 (在 backend 目录下)：
+    python -m benchmarks.bench_summary
+    python -m benchmarks.bench_summary --chats 8 --concurrency 3
+数据库用临时目录里的 SQLite，不会碰到项目里的 test.db。
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+ROOT_DIR = BACKEND_DIR.parent
+UPSTREAM_PORT = 9013
+
+# 上下文很小的预设：几十条消息就超过阈值
+PRESET = {
+    "chat_completion_source": "openai",
+    "openrouter_model": "",
+    "openai_model": "mock-model",
+    "claude_model": "",
+    "openai_max_context": 1000,
+    "openai_max_tokens": 100,
+    "prompts": [
+        {"identifier": "main", "content": "You are {{char}}."},
+        {"identifier": "chatHistory"},
+    ],
+}
+LINE = "The caravan kept moving north through the pass while the snow kept falling on the old road."
+
+
+async def stream_and_disconnect(app, chat_id: int, content: str, after_chunks: int) -> int:
+    """
+    直接按 ASGI 调接口 (httpx 的 ASGITransport 会等整个响应，模拟不了中途断开)：
+    收到 after_chunks 块之后前端断开，返回实际收到的块数。
+    spec_version 2.3 和 uvicorn 一致：Starlette 看到断开就取消正在推流的任务。
+    """
+    body = json.dumps({"content": content, "stream": True}).encode("utf-8")
+    gone = asyncio.Event()
+    state = {"sent": False, "chunks": 0}
+
+    async def receive():
+        if not state["sent"]:
+            state["sent"] = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        await gone.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.body" and message.get("body"):
+            state["chunks"] += 1
+            if state["chunks"] >= after_chunks:
+                gone.set()
+
+    path = f"/api/chat/sessions/{chat_id}/completions"
+    scope = {
+        "type": "http", "asgi": {"version": "3.0", "spec_version": "2.3"}, "http_version": "1.1",
+        "method": "POST", "scheme": "http", "path": path, "raw_path": path.encode(), "root_path": "",
+        "query_string": b"", "headers": [(b"host", b"test"), (b"content-type", b"application/json")],
+        "client": ("127.0.0.1", 12345), "server": ("test", 80),
+    }
+    await app(scope, receive, send)
+    return state["chunks"]
+
+
+class Tracker:
+    """包一层 summarize_chat，记下每个聊天跑了几次、最多同时跑了几个"""
+
+    def __init__(self, func):
+        self.func = func
+        self.calls = {}
+        self.active = 0
+        self.peak = 0
+
+    async def __call__(self, chat_id):
+        self.calls[chat_id] = self.calls.get(chat_id, 0) + 1
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        try:
+            return await self.func(chat_id)
+        finally:
+            self.active -= 1
+
+
+async def run(args) -> bool:
+    import httpx
+
+    from app.main import app
+    from app.core.database import AsyncSessionLocal
+    from app.modules.chat import summary
+    from app.modules.chat.models import SummaryJobModel
+    from benchmarks import mock_upstream
+
+    tracker = Tracker(summary.summarize_chat)
+    summary.summarize_chat = tracker
+    card = json.loads((ROOT_DIR / "jsontemplates" / "character_card_v2.json").read_text("utf-8"))
+    results = {}
+
+    def check(name: str, ok: bool, detail: str) -> None:
+        results[name] = ok
+        print(f"[{'ok' if ok else 'FAIL'}] {name:<12} {detail}")
+
+    async def job_of(chat_id):
+        async with AsyncSessionLocal() as db:
+            return await db.get(SummaryJobModel, chat_id)
+
+    upstream = mock_upstream.run_in_thread(mock_upstream.app, UPSTREAM_PORT)
+    transport = httpx.ASGITransport(app=app)
+    try:
+        async with app.router.lifespan_context(app):
+            async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=60) as c:
+                char_id = (await c.post("/api/character/upload", json=card)).json()["id"]
+                preset_id = (await c.post("/api/preset/upload", json=PRESET)).json()["id"]
+
+                async def new_chat(messages: int) -> int:
+                    chat_id = (await c.post("/api/chat/sessions/", json={
+                        "char_id": char_id, "preset_id": preset_id, "with_greeting": False,
+                    })).json()["id"]
+                    for i in range(messages):
+                        role = "user" if i % 2 == 0 else "assistant"
+                        await c.post(f"/api/chat/sessions/{chat_id}/messages", json={"role": role, "content": f"{i}. {LINE}"})
+                    return chat_id
+
+                sent = [0]
+
+                async def turn(chat_id: int) -> float:
+                    # 每轮内容带编号，模拟上游的回复 (复读开头几个字) 也各不相同
+                    sent[0] += 1
+                    content = f"#{sent[0]:03d} {LINE}"
+                    start = time.perf_counter()
+                    resp = await c.post(f"/api/chat/sessions/{chat_id}/completions", json={"content": content, "stream": False})
+                    resp.raise_for_status()
+                    return time.perf_counter() - start
+
+                # 1. trigger：正常聊天，超过阈值后自动排任务
+                chat_a = await new_chat(0)
+                turns = 0
+                while not tracker.calls.get(chat_a) and turns < 100:
+                    await turn(chat_a)
+                    turns += 1
+                await summary.summary_queue.join()
+                state = (await c.get(f"/api/chat/sessions/{chat_a}/summary")).json()
+                check("trigger", state["summary"] is not None and state["job"] is None,
+                      f"first job after {turns} turns, summary covers messages <= {(state['summary'] or {}).get('up_to_id')}")
+
+                # 2. assemble：总结在聊天记录最前面，覆盖的消息不再出现
+                up_to = state["summary"]["up_to_id"] if state["summary"] else 0
+                assembled = (await c.post(f"/api/chat/sessions/{chat_a}/assemble")).json()
+                budget = assembled["budget"]
+                prompt_text = [m["content"] for m in assembled["prompt"]]
+                first_kept = (await c.get(f"/api/chat/sessions/{chat_a}/messages", params={"before_id": up_to + 1, "limit": 1})).json()
+                covered_text = first_kept["items"][0]["content"] if first_kept["items"] else None
+                check("assemble",
+                      budget["summary_up_to"] == up_to and budget["summary_tokens"] > 0
+                      and any(state["summary"]["content"] in t for t in prompt_text)
+                      and covered_text not in prompt_text,
+                      f"summary_tokens={budget['summary_tokens']} history_kept={budget['history_kept']} "
+                      f"total={budget['total_tokens']}/{budget['available']}")
+
+                # 3. coalesce：上游变慢，同一个聊天并发触发 10 次
+                os.environ["MOCK_TTFT_MS"] = str(args.job_ms)
+                chat_b = await new_chat(args.messages)
+                queued = await asyncio.gather(*(summary.summary_queue.enqueue(chat_b) for _ in range(10)))
+                await summary.summary_queue.join()
+                check("coalesce", sum(queued) == 1 and tracker.calls.get(chat_b) == 1,
+                      f"10 triggers -> {sum(queued)} queued, {tracker.calls.get(chat_b)} run")
+
+                # 4. concurrency + latency：一批任务在跑的时候对话 (上游恢复成正常速度之前先测空闲时)
+                chat_d = await new_chat(4)
+                os.environ["MOCK_TTFT_MS"] = "20"
+                idle = [await turn(chat_d) for _ in range(args.turns)]
+                chats = [await new_chat(args.messages) for _ in range(args.chats)]
+                tracker.peak = 0
+                for chat_id in chats:
+                    await summary.summary_queue.enqueue(chat_id)
+                busy = [await turn(chat_d) for _ in range(args.turns)]
+                await summary.summary_queue.join()
+                check("concurrency", 1 < tracker.peak <= args.concurrency,
+                      f"{args.chats} jobs, peak {tracker.peak} running (limit {args.concurrency})")
+                idle_ms, busy_ms = statistics.median(idle) * 1000, statistics.median(busy) * 1000
+                check("latency", busy_ms <= idle_ms * 1.5 + 5,
+                      f"turn p50 idle {idle_ms:.1f} ms, with jobs running {busy_ms:.1f} ms")
+
+                # 5. disconnect：上游慢慢吐字，前端收到 3 块就断开
+                os.environ["MOCK_TOKEN_MS"] = "20"
+                chat_f = await new_chat(2)
+                got = await stream_and_disconnect(app, chat_f, f"disconnect {LINE}", after_chunks=3)
+                os.environ["MOCK_TOKEN_MS"] = "1"
+                last = (await c.get(f"/api/chat/sessions/{chat_f}/messages", params={"limit": 1})).json()["items"]
+                saved = last[0]["content"] if last and last[0]["role"] == "assistant" else ""
+                parts = saved.count("#")
+                check("disconnect", 0 < parts < int(os.environ["MOCK_TOKENS"]),
+                      f"client left after {got} chunks, saved reply has {parts}/{os.environ['MOCK_TOKENS']} tokens")
+
+                # 6. restart：任务跑到一半关掉应用
+                os.environ["MOCK_TTFT_MS"] = str(args.job_ms * 4)
+                chat_e = await new_chat(args.messages)
+                await summary.summary_queue.enqueue(chat_e)
+                while not tracker.calls.get(chat_e):
+                    await asyncio.sleep(0.01)
+        interrupted = await job_of(chat_e)
+        os.environ["MOCK_TTFT_MS"] = "20"
+
+        async with app.router.lifespan_context(app):
+            await summary.summary_queue.join()
+            async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=60) as c:
+                state = (await c.get(f"/api/chat/sessions/{chat_e}/summary")).json()
+        check("restart",
+              interrupted is not None and interrupted.status == "running"
+              and state["summary"] is not None and state["job"] is None,
+              f"job was {interrupted.status if interrupted else None!r} at shutdown, "
+              f"finished after restart (runs: {tracker.calls.get(chat_e)})")
+    finally:
+        upstream.should_exit = True
+
+    return all(results.values())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chats", type=int, default=6, help="concurrency 检查用的聊天数")
+    parser.add_argument("--concurrency", type=int, default=2, help="SUMMARY_CONCURRENCY")
+    parser.add_argument("--messages", type=int, default=40, help="每个聊天预先写入的消息数")
+    parser.add_argument("--turns", type=int, default=8, help="测延迟的对话轮数")
+    parser.add_argument("--job-ms", type=int, default=150, help="模拟上游在总结请求上的首字延迟")
+    args = parser.parse_args()
+
+    # 必须在导入 app 之前设置好上游地址、总结参数和工作目录
+    upstream_url = f"http://127.0.0.1:{UPSTREAM_PORT}/v1"
+    os.environ["CHAT_API_URL"] = upstream_url
+    os.environ["UTILITY_API_URL"] = upstream_url
+    os.environ.setdefault("CHAT_MODEL", "mock-model")
+    os.environ["SUMMARY_ENABLED"] = "1"
+    os.environ["SUMMARY_CONCURRENCY"] = str(args.concurrency)
+    os.environ["SUMMARY_CHUNK_TOKENS"] = "400"
+    os.environ["VECTOR_ENABLED"] = "0"
+    os.environ["MOCK_TTFT_MS"] = "20"
+    os.environ["MOCK_TOKEN_MS"] = "1"
+    os.environ["MOCK_TOKENS"] = "16"
+    os.chdir(tempfile.mkdtemp(prefix="prisma-bench-"))
+    sys.path.insert(0, str(BACKEND_DIR))
+
+    sys.exit(0 if asyncio.run(run(args)) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+首字延迟 (TTFT) 基准：真实起两个 uvicorn 服务 (模拟上游 + 本后端)，
+通过 /api/chat/completions 流式请求，统计首个 token 和整段回复的耗时。
+
+用法 (在 backend 目录下)：
+    python -m benchmarks.bench_ttft
+    python -m benchmarks.bench_ttft --requests 50 --concurrency 10
+数据库用临时目录里的 SQLite，不会碰到项目里的 test.db。
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+ROOT_DIR = BACKEND_DIR.parent
+UPSTREAM_PORT = 9011
+BACKEND_PORT = 9012
+
+
+async def one_request(client, payload):
+    start = time.perf_counter()
+    ttft = None
+    chunks = 0
+    async with client.stream("POST", f"http://127.0.0.1:{BACKEND_PORT}/api/chat/completions", json=payload) as resp:
+        resp.raise_for_status()
+        async for line in resp.aiter_lines():
+            if not line.startswith("data:"):
+                continue
+            if line.strip() == "data: [DONE]":
+                break
+            if ttft is None:
+                ttft = time.perf_counter() - start
+            chunks += 1
+    return ttft, time.perf_counter() - start, chunks
+
+
+async def run(requests: int, concurrency: int, payload):
+    import httpx
+
+    sem = asyncio.Semaphore(concurrency)
+    async with httpx.AsyncClient(timeout=60) as client:
+        async def guarded():
+            async with sem:
+                return await one_request(client, payload)
+        return await asyncio.gather(*(guarded() for _ in range(requests)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=5)
+    args = parser.parse_args()
+
+    # 必须在导入 app 之前设置好上游地址和工作目录
+    os.environ["CHAT_API_URL"] = f"http://127.0.0.1:{UPSTREAM_PORT}/v1"
+    os.environ.setdefault("CHAT_MODEL", "mock-model")
+    os.chdir(tempfile.mkdtemp(prefix="prisma-bench-"))
+    sys.path.insert(0, str(BACKEND_DIR))
+
+    from fastapi.testclient import TestClient
+    from app.main import app
+    from benchmarks import mock_upstream
+
+    # 准备角色卡和预设
+    card = json.loads((ROOT_DIR / "jsontemplates" / "character_card_v2.json").read_text("utf-8"))
+    preset = json.loads((ROOT_DIR / "夏瑾 Pro 比邻星 1.0.json").read_text("utf-8"))
+    with TestClient(app) as c:
+        char_id = c.post("/api/character/upload", json=card).json()["id"]
+        preset_id = c.post("/api/preset/upload", json=preset).json()["id"]
+
+    upstream = mock_upstream.run_in_thread(mock_upstream.app, UPSTREAM_PORT)
+    backend = mock_upstream.run_in_thread(app, BACKEND_PORT)
+    try:
+        payload = {"char_id": char_id, "preset_id": preset_id, "messages": [{"role": "user", "content": "你好，{{char}}"}]}
+        results = asyncio.run(run(args.requests, args.concurrency, payload))
+    finally:
+        backend.should_exit = True
+        upstream.should_exit = True
+
+    ttfts = sorted(r[0] * 1000 for r in results)
+    totals = sorted(r[1] * 1000 for r in results)
+    mock_ttft = float(os.getenv("MOCK_TTFT_MS", "50"))
+    print(f"requests={args.requests} concurrency={args.concurrency} (mock upstream TTFT = {mock_ttft:.0f} ms)")
+    print(f"TTFT  p50={statistics.median(ttfts):7.1f} ms  p95={ttfts[int(len(ttfts) * 0.95) - 1]:7.1f} ms")
+    print(f"total p50={statistics.median(totals):7.1f} ms  p95={totals[int(len(totals) * 0.95) - 1]:7.1f} ms")
+    print(f"chunks per reply: {results[0][2]}")
+
+
+if __name__ == "__main__":
+    main()
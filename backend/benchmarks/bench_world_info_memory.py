@@ -0,0 +1,191 @@
+"""
+世界书内存基准：每个 worker 各自编译 (WorldInfoIndex) vs 只读 mmap 编译好的文件 (world_info_artifact)。
+
+生成一本大世界书 (默认 20000 个词条)，编译一次写成文件，然后同时起 --workers 个子进程模拟 uvicorn worker：
+    memory   读 JSON -> LorebookV3 -> WorldInfoIndex (改动前每个 worker 的做法，Schema 和索引都常驻)
+    mmap     open_artifact 只读映射
+每个子进程加载后扫描同一批消息 (把用到的页都摸一遍)，所有子进程都就绪后一起测内存：
+    RSS  常驻内存的增量 (共享的文件页也算在每个进程头上)
+    PSS  按共享进程数分摊之后的增量 (Linux 的 /proc/self/smaps_rollup)，加起来就是这批 worker 真正占的内存
+另外输出加载耗时 (预热) 和每条消息的扫描耗时，并确认两种方式激活的词条完全一致。
+
+用法 (在 backend 目录下)：
+    python -m benchmarks.bench_world_info_memory
+    python -m benchmarks.bench_world_info_memory --entries 50000 --workers 8
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+WORDS = ["dragon", "castle", "river", "tower", "guild", "ember", "frost", "shadow", "crown", "blade",
+         "王都", "魔法", "龙", "暗影", "银月", "学院", "圣殿", "商会", "遗迹", "星辰"]
+
+
+def make_lorebook(entries: int, seed: int = 7) -> Dict:
+    rng = random.Random(seed)
+    items = []
+    for i in range(entries):
+        name = f"{rng.choice(WORDS)}{i}"
+        items.append({
+            "keys": [name, f"{rng.choice(WORDS)}-{i % 997}"],
+            "secondary_keys": [f"{rng.choice(WORDS)}{rng.randrange(100)}"] if i % 9 == 0 else [],
+            "selective": i % 9 == 0,
+            "constant": i % 2000 == 0,
+            "case_sensitive": i % 11 == 0,
+            "insertion_order": rng.randint(0, 500),
+            "position": "after_char" if i % 3 == 0 else "before_char",
+            "name": name,
+            "content": " ".join(rng.choice(WORDS) for _ in range(60)) + f" ({name})",
+        })
+    return {"name": "bench", "scan_depth": 2, "entries": items}
+
+
+def make_messages(count: int, entries: int, seed: int = 11) -> List[str]:
+    rng = random.Random(seed)
+    messages = []
+    for _ in range(count):
+        words = [rng.choice(WORDS) + (str(rng.randrange(entries)) if rng.random() < 0.02 else "") for _ in range(120)]
+        messages.append(" ".join(words))
+    return messages
+
+
+# --- 子进程 ---
+def _memory_kb() -> Dict[str, int]:
+    """当前进程的 RSS / PSS (kB)；没有 /proc 时 PSS 记为 RSS"""
+    out: Dict[str, int] = {}
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            for line in f:
+                name, _, rest = line.partition(":")
+                if name in ("Rss", "Pss"):
+                    out[name.lower()] = int(rest.split()[0])
+    except OSError:
+        import resource
+
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        rss = rss // 1024 if sys.platform == "darwin" else rss
+        out = {"rss": rss, "pss": rss}
+    return out
+
+
+def worker(mode: str, json_path: str, artifact: str, messages_path: str) -> None:
+    from app.core.world_info import WorldInfoIndex
+    from app.core.world_info_artifact import open_artifact
+    from app.schemas.lorebook import LorebookV3
+
+    messages = json.loads(Path(messages_path).read_text("utf-8"))
+    before = _memory_kb()
+
+    # 1. 加载 (预热)
+    start = time.perf_counter()
+    if mode == "memory":
+        schema = LorebookV3(**json.loads(Path(json_path).read_text("utf-8")))
+        index = WorldInfoIndex(schema)
+    else:
+        schema = None
+        index = open_artifact(artifact, "bench")
+    load_ms = (time.perf_counter() - start) * 1000
+
+    # 2. 扫描 + 渲染：两条一组模拟 scan_depth = 2
+    start = time.perf_counter()
+    digest = hashlib.blake2b(digest_size=8)
+    for i in range(0, len(messages), 2):
+        active = index.scan([{"content": m} for m in messages[i:i + 2]])
+        digest.update(json.dumps([active, index.render(active)], ensure_ascii=False).encode("utf-8"))
+    scan_ms = (time.perf_counter() - start) * 1000 / max(len(messages), 1)
+
+    # 3. 等所有 worker 都就绪再测 (PSS 要在共享的进程都还活着时才准)
+    print("ready", flush=True)
+    sys.stdin.readline()
+    after = _memory_kb()
+    print(json.dumps({
+        "load_ms": load_ms,
+        "scan_ms": scan_ms,
+        "rss_kb": after["rss"] - before["rss"],
+        "pss_kb": after["pss"] - before["pss"],
+        "digest": digest.hexdigest(),
+    }), flush=True)
+    del schema, index
+
+
+# --- 主进程 ---
+def run_mode(mode: str, workers: int, paths: Dict[str, str]) -> List[Dict]:
+    procs = [
+        subprocess.Popen(
+            [sys.executable, "-m", "benchmarks.bench_world_info_memory", "--worker", mode,
+             paths["json"], paths["artifact"], paths["messages"]],
+            cwd=BACKEND_DIR, stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True,
+        )
+        for _ in range(workers)
+    ]
+    for proc in procs:
+        assert proc.stdout.readline().strip() == "ready"
+    results = []
+    for proc in procs:
+        proc.stdin.write("measure\n")
+        proc.stdin.flush()
+        results.append(json.loads(proc.stdout.readline()))
+    for proc in procs:
+        proc.stdin.close()
+        proc.wait()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--entries", type=int, default=20000)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--worker", nargs=4, metavar=("MODE", "JSON", "ARTIFACT", "MESSAGES"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.worker:
+        worker(*args.worker)
+        return
+
+    sys.path.insert(0, str(BACKEND_DIR))
+    from app.core.world_info import WorldInfoIndex
+    from app.core.world_info_artifact import write_artifact
+    from app.schemas.lorebook import LorebookV3
+
+    # 1. 生成世界书，编译一次写成文件 (世界书写入时做的事)
+    tmp = tempfile.mkdtemp(prefix="prisma-bench-")
+    paths = {name: os.path.join(tmp, name) for name in ("json", "artifact", "messages")}
+    data = make_lorebook(args.entries)
+    Path(paths["json"]).write_text(json.dumps(data, ensure_ascii=False), "utf-8")
+    Path(paths["messages"]).write_text(json.dumps(make_messages(args.messages, args.entries), ensure_ascii=False), "utf-8")
+    start = time.perf_counter()
+    size = write_artifact(WorldInfoIndex(LorebookV3(**data)), paths["artifact"], "bench")
+    build_ms = (time.perf_counter() - start) * 1000
+    json_kb = os.path.getsize(paths["json"]) / 1024
+    print(f"lorebook: {args.entries} entries, JSON {json_kb:.0f} KB, "
+          f"compiled file {size / 1024:.0f} KB (built once in {build_ms:.0f} ms)")
+
+    # 2. 两种方式各起一批 worker
+    print(f"\n{args.workers} workers, {args.messages} messages scanned per worker")
+    print(f"{'mode':<8} {'load':>10} {'scan/msg':>10} {'RSS/worker':>12} {'PSS/worker':>12} {'PSS total':>11}")
+    digests = {}
+    for mode in ("memory", "mmap"):
+        results = run_mode(mode, args.workers, paths)
+        digests[mode] = {r["digest"] for r in results}
+        mean = lambda key: sum(r[key] for r in results) / len(results)
+        print(f"{mode:<8} {mean('load_ms'):>7.1f} ms {mean('scan_ms'):>7.3f} ms "
+              f"{mean('rss_kb') / 1024:>9.1f} MB {mean('pss_kb') / 1024:>9.1f} MB "
+              f"{sum(r['pss_kb'] for r in results) / 1024:>8.1f} MB")
+
+    same = len(digests["memory"] | digests["mmap"]) == 1
+    print(f"\nactivated entries identical across modes: {same}")
+    sys.exit(0 if same else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+向量索引的多进程写入检查：几个进程 (模拟 uvicorn worker) 同时往同一个聊天的 VectorStore 里追加，
+另外几个进程同时查询，最后检查：
+    - 每个写进去的 ID 都在，而且各占一行 (没有两个 ID 抢到同一行、被覆盖掉的)
+    - 每行的向量就是这个 ID 写进去的那个
+    - 查询进程没有出错 (包括文件扩容、重新映射的时候)
+任何一项不满足时退出码为 1。
+
+用法 (在 backend 目录下)：
+    python -m benchmarks.check_vector_store_writers
+    python -m benchmarks.check_vector_store_writers --writers 8 --ids 2000
+"""
+import argparse
+import multiprocessing
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+DIM = 32
+
+
+def vector_of(obj_id: int) -> np.ndarray:
+    """每个 ID 一个确定的单位向量，事后能逐行核对"""
+    vec = np.random.default_rng(obj_id).standard_normal(DIM).astype(np.float32)
+    return vec / np.linalg.norm(vec)
+
+
+def make_store(path: str):
+    from app.core.vector_store import HashingEmbedder, VectorStore
+
+    return VectorStore(path, HashingEmbedder(dim=DIM))
+
+
+def writer(path: str, worker: int, writers: int, ids: int, batch: int, start) -> None:
+    store = make_store(path)
+    mine = list(range(worker, ids, writers))
+    start.wait()
+    for i in range(0, len(mine), batch):
+        chunk = mine[i:i + batch]
+        store.upsert(chunk, np.stack([vector_of(obj_id) for obj_id in chunk]))
+
+
+def reader(path: str, start, stop, errors) -> None:
+    store = make_store(path)
+    start.wait()
+    while not stop.is_set():
+        try:
+            for hits in store.search(np.stack([vector_of(1), vector_of(2)]), k=5):
+                for obj_id, score in hits:
+                    assert -1.01 <= score <= 1.01, (obj_id, score)
+        except Exception as e:  # noqa: BLE001  (出错就记下来，最后统一报告)
+            errors.put(repr(e))
+            return
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--readers", type=int, default=2)
+    parser.add_argument("--ids", type=int, default=1000, help="一共写入多少个 ID")
+    parser.add_argument("--batch", type=int, default=3, help="每次 upsert 几个 (小批次 = 更多并发追加)")
+    args = parser.parse_args()
+
+    path = tempfile.mkdtemp(prefix="prisma-vectors-")
+    make_store(path)  # 先建好文件，子进程都打开同一个
+    ctx = multiprocessing.get_context("spawn")
+    start, stop, errors = ctx.Event(), ctx.Event(), ctx.Queue()
+    writers = [
+        ctx.Process(target=writer, args=(path, w, args.writers, args.ids, args.batch, start))
+        for w in range(args.writers)
+    ]
+    readers = [ctx.Process(target=reader, args=(path, start, stop, errors)) for _ in range(args.readers)]
+    for proc in writers + readers:
+        proc.start()
+
+    began = time.perf_counter()
+    start.set()
+    for proc in writers:
+        proc.join()
+    elapsed = time.perf_counter() - began
+    stop.set()
+    for proc in readers:
+        proc.join()
+
+    # 重新打开，逐行核对
+    store = make_store(path)
+    rows = store._rows
+    missing = [obj_id for obj_id in range(args.ids) if obj_id not in rows]
+    wrong = [obj_id for obj_id, row in rows.items() if not np.allclose(store._vectors[row], vector_of(obj_id))]
+    reader_errors = []
+    while not errors.empty():
+        reader_errors.append(errors.get())
+
+    ok = not missing and not wrong and not reader_errors and store.count == args.ids
+    print(f"{args.writers} writers x {args.ids // args.writers} ids (batch {args.batch}), "
+          f"{args.readers} readers, {elapsed:.2f} s")
+    print(f"rows used {store.count}, ids stored {len(rows)}/{args.ids}, "
+          f"missing {len(missing)}, wrong vector {len(wrong)}, reader errors {len(reader_errors)}")
+    for err in reader_errors[:5]:
+        print(f"  reader: {err}")
+    print(f"[{'ok' if ok else 'FAIL'}] concurrent appends")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
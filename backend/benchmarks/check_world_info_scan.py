@@ -0,0 +1,134 @@
+"""
+世界书增量扫描的随机等价性检查：WorldInfoScanState.update 必须和 WorldInfoIndex.scan 全量重扫的结果完全一致。
+
+每一轮随机生成一本带递归触发 (词条内容里含有别的词条关键词)、次要关键词、区分大小写和常驻词条的世界书，
+然后对同一段历史随机做一串操作，每步之后都对比两种扫描激活的词条 (含顺序)：
+    append    追加 1~N 条消息 (可能一次超过整个窗口)
+    truncate  删掉末尾几条消息
+    regen     删掉最后一条再追加 (重新生成)
+    edit      改写窗口内 / 窗口外的某条消息
+    insert    在中间插入一条消息
+    depth     换一个 scan_depth (包括 0)
+    recursion 换一个递归轮数
+任何一步不一致就打印 seed、步数和操作序列，退出码为 1。
+
+用法 (在 backend 目录下)：
+    python -m benchmarks.check_world_info_scan
+    python -m benchmarks.check_world_info_scan --rounds 500 --steps 200 --seed 1
+"""
+import argparse
+import random
+import sys
+import time
+from typing import Dict, List
+
+from app.core.world_info import WorldInfoIndex, WorldInfoScanState
+from app.schemas.lorebook import Lorebook
+
+WORDS = ["dragon", "Dragon", "castle", "river", "tower", "ember", "frost",
+         "王都", "魔法", "龙", "银月", "学院", "圣殿", "遗迹"]
+FILLER = ["the", "a", "走吧", "。", "，", "and", "then", "我们", "quietly"]
+OPS = ["append", "append", "append", "truncate", "regen", "edit", "insert", "depth", "recursion"]
+
+
+def make_lorebook(rng: random.Random, entries: int) -> Lorebook:
+    items = []
+    for i in range(entries):
+        # 内容里偶尔带别的关键词，制造多轮递归激活
+        content = " ".join(rng.choice(FILLER + WORDS[:3]) for _ in range(rng.randint(3, 10)))
+        if rng.random() < 0.4:
+            content += f" {rng.choice(WORDS)}{rng.randrange(entries)}"
+        items.append({
+            "keys": [f"{rng.choice(WORDS)}{i}"] + ([rng.choice(WORDS)] if rng.random() < 0.2 else []),
+            "secondary_keys": [rng.choice(WORDS)] if rng.random() < 0.3 else [],
+            "selective": rng.random() < 0.3,
+            "constant": rng.random() < 0.05,
+            "case_sensitive": rng.random() < 0.2,
+            "enabled": rng.random() > 0.05,
+            "insertion_order": rng.randint(0, 50),
+            "content": content,
+        })
+    return Lorebook(name="check", scan_depth=rng.randint(1, 4), entries=items)
+
+
+def make_message(rng: random.Random, entries: int) -> Dict[str, str]:
+    words = []
+    for _ in range(rng.randint(1, 12)):
+        if rng.random() < 0.25:
+            words.append(f"{rng.choice(WORDS)}{rng.randrange(entries)}")
+        else:
+            words.append(rng.choice(FILLER + WORDS))
+    # 少量重复内容：窗口重建时按内容复用命中结果
+    if rng.random() < 0.1:
+        return {"role": "user", "content": "dragon"}
+    return {"role": rng.choice(["user", "assistant"]), "content": " ".join(words)}
+
+
+def run_round(seed: int, steps: int) -> List[str]:
+    """跑一轮随机操作；一致时返回空列表，否则返回到出错为止的操作序列"""
+    rng = random.Random(seed)
+    entries = rng.randint(5, 60)
+    index = WorldInfoIndex(make_lorebook(rng, entries))
+    state = WorldInfoScanState(index)
+    history: List[Dict[str, str]] = []
+    depth, recursion = None, rng.randint(0, 4)
+    log: List[str] = []
+
+    for _ in range(steps):
+        op = rng.choice(OPS)
+        if op == "append":
+            count = rng.randint(1, 8)
+            history.extend(make_message(rng, entries) for _ in range(count))
+            op = f"append {count}"
+        elif op == "truncate" and history:
+            count = rng.randint(1, min(4, len(history)))
+            del history[-count:]
+            op = f"truncate {count}"
+        elif op == "regen" and history:
+            history[-1:] = [make_message(rng, entries)]
+        elif op == "edit" and history:
+            pos = rng.randrange(len(history))
+            history[pos] = make_message(rng, entries)
+            op = f"edit {pos}/{len(history)}"
+        elif op == "insert":
+            pos = rng.randint(0, len(history))
+            history.insert(pos, make_message(rng, entries))
+            op = f"insert {pos}"
+        elif op == "depth":
+            depth = rng.choice([None, 0, 1, 2, 3, 5, 8])
+            op = f"depth {depth}"
+        elif op == "recursion":
+            recursion = rng.randint(0, 4)
+            op = f"recursion {recursion}"
+        log.append(op)
+
+        # 传副本进去：状态不能依赖调用方之后不改列表
+        incremental = state.update([dict(m) for m in history], depth, recursion)
+        full = index.scan(history, depth, recursion)
+        if incremental != full:
+            log.append(f"MISMATCH incremental={incremental} full={full}")
+            return log
+    return []
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", type=int, default=300, help="随机世界书 / 操作序列的数量")
+    parser.add_argument("--steps", type=int, default=120, help="每轮的操作步数")
+    parser.add_argument("--seed", type=int, default=0, help="第一轮的种子，之后依次加一")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    for seed in range(args.seed, args.seed + args.rounds):
+        log = run_round(seed, args.steps)
+        if log:
+            print(f"[FAIL] seed={seed} step={len(log) - 1}")
+            for step, op in enumerate(log):
+                print(f"  {step:>4}  {op}")
+            sys.exit(1)
+    elapsed = time.perf_counter() - start
+    print(f"[ok] {args.rounds} rounds x {args.steps} steps: incremental scan == full rescan ({elapsed:.1f} s)")
+
+
+if __name__ == "__main__":
+    main()
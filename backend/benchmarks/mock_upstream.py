@@ -0,0 +1,92 @@
+"""
+本地模拟的 OpenAI 兼容上游 (/v1/chat/completions)
+
+用于联调和测首字延迟 (TTFT)，不需要真实的 API Key：
+    python -m benchmarks.mock_upstream --port 9000
+然后在 .env 里设置 CHAT_API_URL="http://127.0.0.1:9000/v1"。
+
+延迟通过环境变量调整：
+    MOCK_TTFT_MS   首个 token 前的等待 (默认 50)
+    MOCK_TOKEN_MS  每个 token 之间的间隔 (默认 5)
+    MOCK_TOKENS    回复的 token 数 (默认 64)
+"""
+import argparse
+import asyncio
+import json
+import os
+import threading
+import time
+
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+app = FastAPI(title="Mock LLM Upstream")
+
+# 记录收到的请求 (测试里可以检查发过来的 messages)
+received = []
+
+
+def _settings():
+    return (
+        float(os.getenv("MOCK_TTFT_MS", "50")) / 1000,
+        float(os.getenv("MOCK_TOKEN_MS", "5")) / 1000,
+        int(os.getenv("MOCK_TOKENS", "64")),
+    )
+
+
+def _tokens(body: dict, count: int):
+    # 回复内容：把最后一条消息的前几个字复读一遍，再补上编号
+    last = body.get("messages", [{}])[-1].get("content", "")
+    return [f"{last[:8]}#{i} " for i in range(count)]
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    received.append(body)
+    ttft, gap, count = _settings()
+    tokens = _tokens(body, count)
+
+    if not body.get("stream"):
+        await asyncio.sleep(ttft + gap * count)
+        return {
+            "id": "mock",
+            "object": "chat.completion",
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(tokens)}, "finish_reason": "stop"}],
+        }
+
+    async def events():
+        await asyncio.sleep(ttft)
+        for i, token in enumerate(tokens):
+            if i:
+                await asyncio.sleep(gap)
+            chunk = {"id": "mock", "object": "chat.completion.chunk", "choices": [{"index": 0, "delta": {"content": token}}]}
+            yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+def run_in_thread(asgi_app, port: int):
+    """在后台线程里跑一个 uvicorn 服务，返回 server 对象 (server.should_exit = True 即可停止)"""
+    import uvicorn
+
+    server = uvicorn.Server(uvicorn.Config(asgi_app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    return server
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--port", type=int, default=9000)
+    args = parser.parse_args()
+    uvicorn.run(app, host="127.0.0.1", port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+"""
+JSON 大字段压缩存储的效果报告：数据库体积、每行常驻内存、读出耗时。
+
+语料默认是仓库里真实的角色卡 / 世界书 / 预设，也可以用 --corpus 指定一个目录
+(里面的 .json / .png / .zip 等，格式同批量导入)。
+每个文件复制 --copies 份，分别写入「旧格式」(明文 JSON 列) 和「新格式」(压缩 + 延迟加载) 两个库，对比：
+    - 每条数据的原始大小 / 压缩后大小
+    - 库文件大小 (VACUUM 之后)
+    - 把所有行读成 ORM 对象时的内存 (列表页场景：旧格式会把整个 JSON 一起读进来)
+    - 真正需要 data 时的读取耗时 (新格式要多一步解压)
+耗时是在 tracemalloc 开启时测的，只适合横向比较。
+
+用法 (在 backend 目录下)：
+    python -m benchmarks.report_blob_storage
+    python -m benchmarks.report_blob_storage --copies 500 --corpus ~/SillyTavern/data/default-user/characters
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+ROOT_DIR = BACKEND_DIR.parent
+
+DEFAULT_CORPUS = [
+    ROOT_DIR / "jsontemplates" / "character_card_v2.json",
+    ROOT_DIR / "jsontemplates" / "lorebook_v1.json",
+    ROOT_DIR / "夏瑾 Pro 比邻星 1.0.json",
+]
+
+
+def load_corpus(corpus_dir):
+    """返回 [(名字, 类型, 原始 dict)]"""
+    from app.core import config
+    from app.modules.importer.sources import iter_items
+    from app.modules.importer.worker import detect_kind
+
+    paths = sorted(p for p in Path(corpus_dir).rglob("*") if p.is_file()) if corpus_dir else DEFAULT_CORPUS
+    items = []
+    for path in paths:
+        with open(path, "rb") as f:
+            for item in iter_items(f, path.name, config.IMPORT_MAX_ITEM_BYTES):
+                if item.payload is None:
+                    continue
+                raw = json.loads(item.payload)
+                kind = detect_kind(raw)
+                if kind:
+                    items.append((item.name, kind, raw))
+    return items
+
+
+def db_size(engine, path):
+    from sqlalchemy import text
+
+    with engine.connect() as conn:
+        conn.execution_options(isolation_level="AUTOCOMMIT").execute(text("VACUUM"))
+    return os.path.getsize(path)
+
+
+def fill(engine, models, items, copies):
+    """把语料按类型写入对应的表"""
+    with engine.begin() as conn:
+        for name, kind, raw in items:
+            table = models[kind]
+            rows = [{"name": f"{name} #{i}", "data": raw} for i in range(copies)]
+            conn.execute(table.insert(), rows)
+
+
+def measure_rows(session_factory, entity, load_data):
+    """读出所有行，返回 (行数, 常驻内存字节, 耗时秒)"""
+    from sqlalchemy import select
+    from sqlalchemy.orm import undefer
+
+    stmt = select(entity)
+    if load_data:
+        # 需要 data 时一次查询带出来 (undefer)，而不是每行再查一次
+        stmt = stmt.options(undefer(entity.data))
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    with session_factory() as db:
+        rows = db.execute(stmt).scalars().all()
+        elapsed = time.perf_counter() - start
+        current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return len(rows), current, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--copies", type=int, default=200)
+    parser.add_argument("--corpus", type=str, default=None)
+    args = parser.parse_args()
+
+    workdir = Path(tempfile.mkdtemp(prefix="prisma-blob-"))
+    os.chdir(workdir)
+    sys.path.insert(0, str(BACKEND_DIR))
+
+    from sqlalchemy import JSON, Column, DateTime, Integer, MetaData, String, Table, create_engine
+    from sqlalchemy.orm import Session, declarative_base
+
+    from app.core import config
+    from app.core.blob import compress_json
+    from app.core.database import Base, engine as new_engine
+    from app.modules.character.models import CharacterModel
+    from app.modules.lorebook.models import LorebookModel
+    from app.modules.preset.models import PresetModel
+
+    items = load_corpus(args.corpus)
+    if not items:
+        sys.exit("corpus is empty")
+
+    # 1. 每条数据压缩前后的大小
+    print(f"codec={config.BLOB_CODEC} level={config.BLOB_LEVEL}")
+    print(f"{'item':<40} {'kind':<10} {'raw KB':>9} {'stored KB':>10} {'ratio':>6}")
+    raw_total = stored_total = 0
+    for name, kind, raw in items:
+        raw_size = len(json.dumps(raw, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+        stored = len(compress_json(raw))
+        raw_total += raw_size
+        stored_total += stored
+        print(f"{name[:40]:<40} {kind:<10} {raw_size / 1024:9.1f} {stored / 1024:10.1f} {raw_size / stored:6.1f}x")
+    print(f"{'total':<51} {raw_total / 1024:9.1f} {stored_total / 1024:10.1f} {raw_total / stored_total:6.1f}x\n")
+
+    # 2. 旧格式：明文 JSON 列，和改动前的模型一样
+    legacy_path = workdir / "legacy.db"
+    legacy_engine = create_engine(f"sqlite:///{legacy_path}")
+    LegacyBase = declarative_base(metadata=MetaData())
+
+    def legacy_model(table_name):
+        return type(f"Legacy_{table_name}", (LegacyBase,), {
+            "__tablename__": table_name,
+            "id": Column(Integer, primary_key=True),
+            "name": Column(String),
+            "data": Column(JSON, nullable=False),
+            "create_date": Column(DateTime),
+        })
+
+    legacy = {kind: legacy_model(table) for kind, table in
+              [("character", "characters"), ("preset", "presets"), ("lorebook", "lorebooks")]}
+    LegacyBase.metadata.create_all(legacy_engine)
+    fill(legacy_engine, {k: m.__table__ for k, m in legacy.items()}, items, args.copies)
+
+    # 3. 新格式：当前的模型
+    Base.metadata.create_all(new_engine)
+    fill(new_engine, {"character": CharacterModel.__table__, "preset": PresetModel.__table__,
+                      "lorebook": LorebookModel.__table__}, items, args.copies)
+
+    legacy_size = db_size(legacy_engine, legacy_path)
+    new_size = db_size(new_engine, workdir / "test.db")
+    print(f"database size  legacy={legacy_size / 1024 / 1024:8.2f} MB  compressed={new_size / 1024 / 1024:8.2f} MB"
+          f"  ({legacy_size / new_size:.1f}x smaller)\n")
+
+    # 4. 内存 / 耗时：只读行 (列表场景) 和连 data 一起读
+    print(f"{'table':<12} {'mode':<16} {'rows':>6} {'KB/row':>9} {'ms total':>9}")
+    for kind, model in [("character", CharacterModel), ("preset", PresetModel), ("lorebook", LorebookModel)]:
+        if not any(k == kind for _, k, _ in items):
+            continue
+        for label, factory, entity, load_data in [
+            ("legacy", lambda: Session(legacy_engine), legacy[kind], False),
+            ("compressed", lambda: Session(new_engine), model, False),
+            ("compressed+data", lambda: Session(new_engine), model, True),
+        ]:
+            n, mem, elapsed = measure_rows(factory, entity, load_data)
+            print(f"{model.__tablename__:<12} {label:<16} {n:6d} {mem / n / 1024:9.2f} {elapsed * 1000:9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+启动耗时分析：import app.main 时每个模块的导入耗时 + lifespan 初始化耗时。
+
+导入耗时来自 python -X importtime (在子进程里跑，每次都是冷启动)，跑 --runs 次取最小值。
+CI 里可以加两种检查 (不满足时退出码 1)：
+    --budget-ms 800          import app.main 的总耗时上限
+    --forbid numpy,httpx     这些模块不允许在导入 app 时加载 (默认就是 LAZY_MODULES)
+耗时受机器影响，模块检查是确定的，两个一起用比较稳。
+
+用法 (在 backend 目录下)：
+    python -m benchmarks.startup_profile
+    python -m benchmarks.startup_profile --top 30 --budget-ms 800
+    python -m benchmarks.startup_profile --output startup.json
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+# 这些重依赖应该在第一次用到时才导入
+LAZY_MODULES = ["numpy", "httpx", "regex", "tiktoken"]
+
+# 子进程里进一次 lifespan (新库：迁移全部执行；然后是上游连接池)，打印各步耗时
+LIFESPAN_SCRIPT = """
+import asyncio, json, time
+t0 = time.perf_counter()
+from app.main import app
+from app.core import llm
+from app.core.database import engine
+from app.core.migrations import migrate, SCHEMA_VERSION
+t1 = time.perf_counter()
+migrate(engine)
+t2 = time.perf_counter()
+migrate(engine)
+t3 = time.perf_counter()
+asyncio.run(llm.startup())
+t4 = time.perf_counter()
+print(json.dumps({
+    "import_app": t1 - t0,
+    "migrate_fresh_db": t2 - t1,
+    "migrate_up_to_date": t3 - t2,
+    "llm_startup": t4 - t3,
+}))
+"""
+
+
+def run_python(args: List[str], workdir: str) -> subprocess.CompletedProcess:
+    env = dict(os.environ, PYTHONPATH=str(BACKEND_DIR))
+    return subprocess.run([sys.executable, *args], cwd=workdir, env=env, capture_output=True, text=True, check=True)
+
+
+def import_times(workdir: str) -> Dict[str, Tuple[int, int]]:
+    """{模块: (自身耗时 us, 累计耗时 us)}"""
+    proc = run_python(["-X", "importtime", "-c", "import app.main"], workdir)
+    times: Dict[str, Tuple[int, int]] = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        times[name.strip()] = (int(self_us), int(cumulative_us))
+    return times
+
+
+def loaded_modules(names: List[str], workdir: str) -> List[str]:
+    """导入 app.main 之后，names 里哪些已经在 sys.modules 里 (importtime 里失败的导入也会出现，不能用它判断)"""
+    script = f"import json, sys, app.main; print(json.dumps([m for m in {names!r} if m in sys.modules]))"
+    return json.loads(run_python(["-c", script], workdir).stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3, help="导入跑几次，每个模块取最小值")
+    parser.add_argument("--top", type=int, default=20, help="列出累计耗时最多的几个模块")
+    parser.add_argument("--budget-ms", type=float, help="import app.main 的耗时上限 (毫秒)")
+    parser.add_argument("--forbid", default=",".join(LAZY_MODULES), help="导入 app 时不允许加载的模块 (逗号分隔)")
+    parser.add_argument("--output", type=Path, help="结果 JSON 写到哪里")
+    args = parser.parse_args()
+
+    # 1. 导入耗时 (每次新开临时目录，数据库 / 向量文件不碰项目里的)
+    runs = [import_times(tempfile.mkdtemp(prefix="prisma-startup-")) for _ in range(args.runs)]
+    best: Dict[str, Tuple[int, int]] = {}
+    for name in runs[0]:
+        samples = [r[name] for r in runs if name in r]
+        best[name] = (min(s[0] for s in samples), min(s[1] for s in samples))
+    total_ms = best["app.main"][1] / 1000
+
+    print(f"import app.main: {total_ms:.1f} ms (best of {args.runs})\n")
+    print(f"{'module':<48} {'self':>10} {'cumulative':>12}")
+    for name, (self_us, cumulative_us) in sorted(best.items(), key=lambda item: -item[1][1])[:args.top]:
+        print(f"{name:<48} {self_us / 1000:>8.1f}ms {cumulative_us / 1000:>10.1f}ms")
+
+    # 2. lifespan 里的初始化
+    proc = run_python(["-c", LIFESPAN_SCRIPT], tempfile.mkdtemp(prefix="prisma-startup-"))
+    lifespan = json.loads(proc.stdout.strip().splitlines()[-1])
+    print()
+    for name, seconds in lifespan.items():
+        print(f"{name:<48} {seconds * 1000:>10.1f}ms")
+
+    # 3. 检查
+    failures = []
+    forbidden = [m.strip() for m in args.forbid.split(",") if m.strip()]
+    loaded = loaded_modules(forbidden, tempfile.mkdtemp(prefix="prisma-startup-"))
+    if loaded:
+        failures.append(f"imported at startup (should be lazy): {', '.join(loaded)}")
+    if args.budget_ms is not None and total_ms > args.budget_ms:
+        failures.append(f"import app.main took {total_ms:.1f} ms > budget {args.budget_ms:.0f} ms")
+
+    if args.output:
+        args.output.write_text(json.dumps({
+            "import_ms": total_ms,
+            "modules": {name: {"self_us": s, "cumulative_us": c} for name, (s, c) in best.items()},
+            "lifespan": lifespan,
+            "failures": failures,
+        }, indent=2), "utf-8")
+
+    if failures:
+        print()
+        for failure in failures:
+            print("FAIL:", failure)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
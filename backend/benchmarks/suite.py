@@ -0,0 +1,342 @@
+"""
+基准套件：拼装引擎、Schema 校验和接口往返，结果存成 JSON，可以和基线对比找出性能回退。
+
+数据：
+    预设       仓库里的 夏瑾 Pro 比邻星 1.0.json
+    角色卡     jsontemplates/character_card_v2.json
+    世界书     jsontemplates/lorebook_v1.json 的词条 + 合成词条 (10 ~ 20000 条)
+    聊天记录   合成 (100 ~ 50000 条)，部分消息带世界书关键词和宏
+接口走进程内的 ASGI 客户端 (httpx.ASGITransport)，数据库放在临时目录里，不会碰到 test.db。
+
+每个用例先预热一次，再反复运行 (至少 --min-rounds 次，最多跑 --max-time 秒)，
+记录 min / median / mean / p95 (秒/次)。吞吐类用例的 median 是「总耗时 / 请求数」。
+
+用法 (在 backend 目录下)：
+    python -m benchmarks.suite                              # 全部用例
+    python -m benchmarks.suite --quick                      # 只跑小规模 (CI 用)
+    python -m benchmarks.suite -k assemble                  # 名字里带 assemble 的
+    python -m benchmarks.suite --output out.json            # 结果写到文件
+    python -m benchmarks.suite --baseline benchmarks/baseline.json
+                                                            # 和基线对比，慢了超过 --threshold 就报回退 (退出码 1)
+    python -m benchmarks.suite --save-baseline              # 把本次结果存成新的基线
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+ROOT_DIR = BACKEND_DIR.parent
+DEFAULT_BASELINE = Path(__file__).resolve().parent / "baseline.json"
+
+HISTORY_SIZES = [100, 1000, 10000, 50000]
+LOREBOOK_SIZES = [10, 1000, 20000]
+QUICK_HISTORY_SIZES = [100, 1000]
+QUICK_LOREBOOK_SIZES = [10, 1000]
+
+# 合成数据用的词表：一部分是世界书关键词，聊天里出现就会激活词条
+WORDS = ["the", "and", "魔法", "走吧", "你好", "城墙", "sword", "river", "night", "。", "，", "?"]
+
+
+# --- 数据 ---
+def load_fixtures() -> Dict[str, Any]:
+    return {
+        "preset": json.loads((ROOT_DIR / "夏瑾 Pro 比邻星 1.0.json").read_text("utf-8")),
+        "card": json.loads((ROOT_DIR / "jsontemplates" / "character_card_v2.json").read_text("utf-8")),
+        "lorebook": json.loads((ROOT_DIR / "jsontemplates" / "lorebook_v1.json").read_text("utf-8")),
+    }
+
+
+def make_lorebook(template: Dict[str, Any], n: int, seed: int = 7) -> Dict[str, Any]:
+    """模板词条 + 合成词条，共 n 条；关键词形如 kw123，聊天记录里会按概率出现"""
+    rng = random.Random(seed)
+    entries = [dict(e, uid=uid) for uid, e in template["entries"].items()][:n]
+    for i in range(len(entries), n):
+        entries.append({
+            "uid": f"e{i}",
+            "keys": [f"kw{i}", f"alias{i}"],
+            "content": " ".join(rng.choice(WORDS) for _ in range(rng.randint(20, 80))),
+            "insertion_order": rng.randint(0, 200),
+            "position": rng.choice(["before_char", "after_char"]),
+        })
+    return dict(template, name=f"{template['name']} x{n}", entries=entries)
+
+
+def make_history(n: int, keyword_range: int = 1000, seed: int = 42) -> List[Dict[str, str]]:
+    """合成聊天记录：大约一成消息带世界书关键词，两成带宏"""
+    rng = random.Random(seed)
+    history = []
+    for i in range(n):
+        parts = [rng.choice(WORDS) for _ in range(rng.randint(20, 120))]
+        if rng.random() < 0.1:
+            parts.insert(rng.randrange(len(parts)), f" kw{rng.randrange(keyword_range)} ")
+        if rng.random() < 0.2:
+            parts.insert(rng.randrange(len(parts)), rng.choice(["{{char}}", "{{user}}"]))
+        history.append({"role": "user" if i % 2 == 0 else "assistant", "content": "".join(parts)})
+    return history
+
+
+# --- 计时 ---
+def measure(func: Callable[[], Any], min_rounds: int, max_time: float) -> Dict[str, Any]:
+    func()  # 预热 (顺便填好各种缓存)
+    samples: List[float] = []
+    deadline = time.perf_counter() + max_time
+    while len(samples) < min_rounds or time.perf_counter() < deadline:
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return stats(samples)
+
+
+def stats(samples: List[float], requests: int = 1) -> Dict[str, Any]:
+    per_op = sorted(s / requests for s in samples)
+    return {
+        "min": per_op[0],
+        "median": statistics.median(per_op),
+        "mean": statistics.fmean(per_op),
+        "p95": per_op[max(int(len(per_op) * 0.95) - 1, 0)],
+        "rounds": len(per_op),
+        "ops": 1 / statistics.median(per_op),
+    }
+
+
+# --- 用例 ---
+def bench_schemas(fx, sizes, run):
+    from app.schemas.character import TavernCardV3
+    from app.schemas.lorebook import LorebookV3
+    from app.schemas.preset import SillyTavernPreset
+
+    run("schema/preset", lambda: SillyTavernPreset(**fx["preset"]))
+    run("schema/card", lambda: TavernCardV3(**fx["card"]))
+    for n in sizes["lorebook"]:
+        raw = make_lorebook(fx["lorebook"], n)
+        run(f"schema/lorebook[{n}]", lambda raw=raw: LorebookV3(**raw))
+
+
+def bench_compile(fx, sizes, run):
+    from app.core.preset_compiler import compile_preset
+    from app.core.world_info import WorldInfoIndex
+    from app.schemas.lorebook import LorebookV3
+    from app.schemas.preset import SillyTavernPreset
+
+    from app.core.world_info_artifact import open_artifact, write_artifact
+
+    preset = SillyTavernPreset(**fx["preset"])
+    run("compile/preset", lambda: compile_preset(preset))
+    for n in sizes["lorebook"]:
+        lorebook = LorebookV3(**make_lorebook(fx["lorebook"], n))
+        run(f"compile/world_info[{n}]", lambda lorebook=lorebook: WorldInfoIndex(lorebook))
+        # 编译好的文件：别的 worker 只需要 mmap 打开
+        path = os.path.join(tempfile.gettempdir(), f"prisma-bench-world-info-{n}.wi")
+        write_artifact(WorldInfoIndex(lorebook), path, "bench")
+        run(f"open/world_info_mmap[{n}]", lambda path=path: open_artifact(path, "bench"))
+
+
+def bench_assemble(fx, sizes, run):
+    """稳态 (缓存都热了) 的一次完整拼装：预设计划 / 世界书索引命中缓存，历史和世界书扫描每次都做"""
+    from app.core.prompt_engine import ContextAssembler
+    from app.core.world_info import WorldInfoIndex
+    from app.core.world_info_artifact import open_artifact, write_artifact
+    from app.schemas.character import TavernCardV3
+    from app.schemas.lorebook import LorebookV3
+    from app.schemas.preset import SillyTavernPreset
+
+    card = TavernCardV3(**fx["card"])
+    preset = SillyTavernPreset(**fx["preset"])
+
+    def case(history, lorebook, lorebook_id, world_info_index=None):
+        return lambda: ContextAssembler(
+            card=card, preset=preset, history=history, lorebook=lorebook,
+            preset_id="bench", preset_version=0, card_id="bench", card_version=0,
+            lorebook_id=lorebook_id, lorebook_version=0, world_info_index=world_info_index,
+        ).assemble()
+
+    lorebook = LorebookV3(**make_lorebook(fx["lorebook"], 1000))
+    for n in sizes["history"]:
+        run(f"assemble/history[{n}]", case(make_history(n), lorebook, "lb1000"))
+    history = make_history(100)
+    for n in sizes["lorebook"]:
+        lb = LorebookV3(**make_lorebook(fx["lorebook"], n))
+        run(f"assemble/lorebook[{n}]", case(history, lb, f"lb{n}"))
+        # 同一本世界书走 mmap 的编译文件 (见 world_info_artifact)
+        path = os.path.join(tempfile.gettempdir(), f"prisma-bench-world-info-{n}.wi")
+        write_artifact(WorldInfoIndex(lb), path, "bench")
+        run(f"assemble/lorebook_mmap[{n}]", case(history, None, f"lb{n}-mmap", open_artifact(path, "bench")))
+
+
+async def _bench_api(fx, run_async, concurrency: int):
+    import httpx
+    from app.main import app
+
+    # ASGITransport 不会触发 lifespan，手动进入 (数据库迁移等启动初始化都在里面)
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app), \
+            httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        char_id = (await client.post("/api/character/upload", json=fx["card"])).json()["id"]
+        preset_id = (await client.post("/api/preset/upload", json=fx["preset"])).json()["id"]
+        lorebook_id = (await client.post("/api/lorebook/", json=make_lorebook(fx["lorebook"], 1000))).json()["id"]
+        payload = {
+            "char_id": char_id, "preset_id": preset_id, "lorebook_id": lorebook_id,
+            "messages": make_history(200),
+        }
+
+        async def assemble():
+            resp = await client.post("/api/chat/debug/assemble", json=payload)
+            resp.raise_for_status()
+
+        async def get_preset():
+            resp = await client.get(f"/api/preset/{preset_id}")
+            resp.raise_for_status()
+
+        async def list_characters():
+            resp = await client.get("/api/character/", params={"limit": 50})
+            resp.raise_for_status()
+
+        async def assemble_burst():
+            await asyncio.gather(*(assemble() for _ in range(concurrency)))
+
+        async def assemble_batch():
+            # 同样的任务数走批量接口：对象只查一次，稳定前缀只拼一次
+            resp = await client.post("/api/chat/assemble/batch", json={"jobs": [payload] * concurrency})
+            resp.raise_for_status()
+            assert "event: error" not in resp.text
+
+        await run_async("api/debug_assemble", assemble)
+        await run_async("api/get_preset", get_preset)
+        await run_async("api/list_characters", list_characters)
+        await run_async(f"api/debug_assemble_x{concurrency}", assemble_burst, requests=concurrency)
+        await run_async(f"api/assemble_batch_x{concurrency}", assemble_batch, requests=concurrency)
+
+
+# --- 对比 ---
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], threshold: float, metric: str = "median") -> List[str]:
+    """逐项对比 metric (min / median / mean)，返回回退了的用例名"""
+    regressions = []
+    print(f"\n{'case':<36} {'baseline':>12} {'current':>12} {'change':>9}")
+    for name, current in results.items():
+        base = baseline.get(name)
+        if base is None:
+            print(f"{name:<36} {'-':>12} {fmt(current[metric]):>12} {'new':>9}")
+            continue
+        ratio = current[metric] / base[metric] - 1
+        flag = ""
+        if ratio > threshold:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        elif ratio < -threshold:
+            flag = "  faster"
+        print(f"{name:<36} {fmt(base[metric]):>12} {fmt(current[metric]):>12} {ratio:>+8.0%}{flag}")
+    return regressions
+
+
+def fmt(seconds: float) -> str:
+    if seconds >= 1:
+        return f"{seconds:.2f} s"
+    if seconds >= 1e-3:
+        return f"{seconds * 1e3:.2f} ms"
+    return f"{seconds * 1e6:.1f} us"
+
+
+def git_commit() -> Optional[str]:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR,
+                             capture_output=True, text=True, timeout=5)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return out.stdout.strip() or None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--quick", action="store_true", help="只跑小规模的数据")
+    parser.add_argument("-k", "--filter", default="", help="只跑名字里包含这个字符串的用例")
+    parser.add_argument("--min-rounds", type=int, default=5)
+    parser.add_argument("--max-time", type=float, default=1.0, help="每个用例最多跑多少秒 (至少跑 min-rounds 次)")
+    parser.add_argument("--concurrency", type=int, default=16, help="吞吐用例同时发多少个请求")
+    parser.add_argument("--output", type=Path, help="结果 JSON 写到哪里")
+    parser.add_argument("--baseline", type=Path, help="和这个基线文件对比")
+    parser.add_argument("--threshold", type=float, default=0.25, help="慢了多少算回退 (0.25 = 25%%)")
+    parser.add_argument("--metric", choices=["min", "median", "mean"], default="median",
+                        help="对比用哪个统计量 (机器噪声大时用 min 更稳)")
+    parser.add_argument("--save-baseline", nargs="?", type=Path, const=DEFAULT_BASELINE,
+                        help=f"把结果存成基线 (默认 {DEFAULT_BASELINE.relative_to(BACKEND_DIR)})")
+    args = parser.parse_args()
+
+    fx = load_fixtures()
+    sizes = {
+        "history": QUICK_HISTORY_SIZES if args.quick else HISTORY_SIZES,
+        "lorebook": QUICK_LOREBOOK_SIZES if args.quick else LOREBOOK_SIZES,
+    }
+
+    # 数据库、向量文件都放在临时目录 (先把命令行里的相对路径定下来)
+    for name in ("output", "baseline", "save_baseline"):
+        if getattr(args, name):
+            setattr(args, name, getattr(args, name).resolve())
+    os.chdir(tempfile.mkdtemp(prefix="prisma-bench-"))
+    sys.path.insert(0, str(BACKEND_DIR))
+
+    results: Dict[str, Any] = {}
+
+    def report(name: str, result: Dict[str, Any]) -> None:
+        results[name] = result
+        print(f"{name:<36} median={fmt(result['median']):>10}  p95={fmt(result['p95']):>10}  "
+              f"({result['rounds']} rounds, {result['ops']:.1f} ops/s)")
+
+    def run(name: str, func: Callable[[], Any]) -> None:
+        if args.filter in name:
+            report(name, measure(func, args.min_rounds, args.max_time))
+
+    async def run_async(name: str, func: Callable[[], Any], requests: int = 1) -> None:
+        if args.filter not in name:
+            return
+        await func()
+        samples: List[float] = []
+        deadline = time.perf_counter() + args.max_time
+        while len(samples) < args.min_rounds or time.perf_counter() < deadline:
+            start = time.perf_counter()
+            await func()
+            samples.append(time.perf_counter() - start)
+        report(name, stats(samples, requests))
+
+    bench_schemas(fx, sizes, run)
+    bench_compile(fx, sizes, run)
+    bench_assemble(fx, sizes, run)
+    api_cases = ["api/debug_assemble", "api/get_preset", "api/list_characters", f"api/debug_assemble_x{args.concurrency}"]
+    if any(args.filter in name for name in api_cases):
+        asyncio.run(_bench_api(fx, run_async, args.concurrency))
+
+    document = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "quick": args.quick,
+        },
+        "results": results,
+    }
+    if args.output:
+        args.output.write_text(json.dumps(document, indent=2), "utf-8")
+    if args.save_baseline:
+        args.save_baseline.write_text(json.dumps(document, indent=2), "utf-8")
+        print(f"\nbaseline saved to {args.save_baseline}")
+
+    if args.baseline:
+        baseline = json.loads(args.baseline.read_text("utf-8"))["results"]
+        regressions = compare(results, baseline, args.threshold, args.metric)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) over {args.threshold:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()